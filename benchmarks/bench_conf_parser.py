@@ -0,0 +1,45 @@
+"""
+Benchmark for the wg-quick config parser on configs with many peers.
+
+Run from the repository root:  python benchmarks/bench_conf_parser.py
+"""
+import base64
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import conf_parser  # noqa: E402
+
+
+def _config(peers):
+    lines = ["[Interface]", "PrivateKey = " + base64.b64encode(bytes(32)).decode(),
+             "Address = 10.0.0.1/16", "ListenPort = 51820"]
+    for i in range(peers):
+        lines += [
+            "",
+            "[Peer]",
+            f"#Name = peer{i}",
+            "PublicKey = " + base64.b64encode(i.to_bytes(32, "big")).decode(),
+            f"AllowedIPs = 10.0.{i // 256}.{i % 256}/32, fd00::{i:x}/128  # client {i}",
+            "PersistentKeepalive = 25",
+        ]
+    return lines
+
+
+def main(rounds=5):
+    for peers in (10, 1000, 5000, 20000):
+        lines = _config(peers)
+        best = None
+        for _ in range(rounds):
+            start = time.perf_counter()
+            parsed = conf_parser.parse(lines)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        assert len(parsed.peers) == peers
+        print(f"{peers:>6} peers  {len(lines):>7} lines  best={best * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
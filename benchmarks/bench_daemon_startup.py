@@ -0,0 +1,52 @@
+"""
+Start-up cost of the userspace tunnel daemon.
+
+Compares what daemon.py imports before it can bring a tunnel up with the
+old entry point, which imported the whole `vpn` module.
+
+Run from the repository root:  python benchmarks/bench_daemon_startup.py
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+
+SNIPPETS = {
+    "daemon (lazy imports)": "import daemon, interface",
+    "vpn module (old daemon)": "import vpn",
+}
+
+PROBE = (
+    "import sys, time, resource\n"
+    "sys.path.insert(0, {src!r})\n"
+    "t = time.perf_counter()\n"
+    "{code}\n"
+    "print((time.perf_counter() - t) * 1000, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)\n"
+)
+
+
+def _measure(code, rounds=10):
+    env = dict(os.environ, WIREGUARD_APP_HOME=tempfile.mkdtemp(prefix="wg_bench_"))
+    walls, imports, rss = [], [], []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        out = subprocess.check_output([sys.executable, "-c", PROBE.format(src=str(SRC), code=code)], env=env)
+        walls.append((time.perf_counter() - start) * 1000)
+        import_ms, max_rss = out.decode().split()
+        imports.append(float(import_ms))
+        rss.append(int(max_rss))
+    return min(walls), min(imports), min(rss)
+
+
+def main():
+    for label, code in SNIPPETS.items():
+        wall, imp, rss = _measure(code)
+        print(f"{label:<26} process={wall:7.1f} ms  imports={imp:6.1f} ms  max RSS={rss / 1024:5.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
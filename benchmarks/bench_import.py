@@ -0,0 +1,55 @@
+"""
+Benchmark for the zip import pipeline (parse, validate, allocate, commit).
+The key store write is stubbed, so this measures everything but sudo.
+
+Run from the repository root:  python benchmarks/bench_import.py
+"""
+import base64
+import os
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+os.environ.setdefault("WIREGUARD_APP_HOME", tempfile.mkdtemp(prefix="wg_bench_"))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import import_pipeline  # noqa: E402
+import secrets_store  # noqa: E402
+import vpn  # noqa: E402
+
+
+def _zip(path, count):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        for i in range(count):
+            key = base64.b64encode(i.to_bytes(32, "big")).decode()
+            peer = base64.b64encode((i + 1).to_bytes(32, "little")).decode()
+            z.writestr(f"site{i}.conf", "\n".join([
+                "[Interface]",
+                f"PrivateKey = {key}",
+                f"Address = 10.{i // 250}.{i % 250}.2/32",
+                "DNS = 1.1.1.1",
+                "[Peer]",
+                f"PublicKey = {peer}",
+                "AllowedIPs = 0.0.0.0/0, ::/0",
+                f"Endpoint = vpn{i}.example.com:51820",
+                "PersistentKeepalive = 25",
+            ]) + "\n")
+
+
+def main():
+    secrets_store.set_private_keys = lambda keys, sudo_pwd: (True, None)
+    v = vpn.Vpn()
+    for count in (50, 500):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "configs.zip")
+            _zip(path, count)
+            start = time.perf_counter()
+            res = import_pipeline.run(v, path, set(), progress=None)
+            elapsed = time.perf_counter() - start
+        print(f"{count:>5} configs  imported={len(res['profiles']):>5}  {elapsed * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
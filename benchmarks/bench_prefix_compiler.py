@@ -0,0 +1,52 @@
+"""
+Benchmark for the AllowedIPs compiler.
+
+Run from the repository root:  python benchmarks/bench_prefix_compiler.py
+"""
+import random
+import sys
+import time
+from ipaddress import IPv4Network
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from prefix_compiler import compile_prefixes  # noqa: E402
+
+
+def _random_prefixes(count, min_len, max_len, rng):
+    out = []
+    for _ in range(count):
+        plen = rng.randint(min_len, max_len)
+        addr = rng.getrandbits(32) & ((0xFFFFFFFF << (32 - plen)) & 0xFFFFFFFF)
+        out.append(str(IPv4Network((addr, plen))))
+    return out
+
+
+def _run(label, include, exclude, rounds=5):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = compile_prefixes(include, exclude)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label:<40} in={len(include):>6} ex={len(exclude):>6} "
+          f"routes={len(result):>6} best={best * 1000:8.2f} ms")
+
+
+def main():
+    rng = random.Random(51820)
+    lan = ["10.0.0.0/8", "172.16.0.0/12", "192.168.0.0/16", "169.254.0.0/16", "100.64.0.0/10"]
+    _run("default minus LAN", ["0.0.0.0/0"], lan)
+    # What the web calculators emit for "0.0.0.0/0 minus LAN": already split
+    calculated = [str(n) for n in compile_prefixes(["0.0.0.0/0"], lan)]
+    _run("calculator output (re-collapse)", calculated, [])
+    _run("500 random /8-/24 includes", _random_prefixes(500, 8, 24, rng), [])
+    _run("5000 random /16-/28 includes", _random_prefixes(5000, 16, 28, rng), [])
+    _run("default minus 1000 random excludes", ["0.0.0.0/0"], _random_prefixes(1000, 12, 28, rng))
+    _run("5000 includes minus 5000 excludes",
+         _random_prefixes(5000, 8, 20, rng), _random_prefixes(5000, 16, 30, rng))
+
+
+if __name__ == "__main__":
+    main()
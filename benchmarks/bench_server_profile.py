@@ -0,0 +1,91 @@
+"""
+Benchmark for server (hub) profiles with thousands of peers: validation,
+parsing into the profile model, `wg setconf` config, UAPI request and the
+`ip -batch` route install. sudo is stubbed, so this measures everything but
+the kernel. Validation starts from empty caches every round, as for a hub
+that was just edited; above validation.PEER_CACHE_SIZE peers it runs
+without them.
+
+Run from the repository root:  python benchmarks/bench_server_profile.py
+"""
+import base64
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault("WIREGUARD_APP_HOME", tempfile.mkdtemp(prefix="wg_bench_"))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import interface  # noqa: E402
+import profile_model  # noqa: E402
+import uapi  # noqa: E402
+import validation  # noqa: E402
+from wg_config import build_config  # noqa: E402
+
+PRIVATE_KEY = base64.b64encode(bytes(range(32))).decode()
+
+
+def _fields(count):
+    peers = []
+    for i in range(count):
+        peers.append({
+            "name": f"site{i}",
+            "key": base64.b64encode((i + 1).to_bytes(32, "big")).decode(),
+            "allowed_prefixes": f"10.{100 + i // 65536}.{i // 256 % 256}.{i % 256}/32",
+            "endpoint": "",
+            "presharedKey": "",
+        })
+    return {"profile_name": "hub", "interface_name": "wg_hub", "kind": "server", "listen_port": "51820",
+            "ip_address": "10.99.0.1/16", "private_key": PRIVATE_KEY, "dns_servers": "", "extra_routes": "",
+            "mtu": "", "peers": peers}
+
+
+def _best(fn, rounds):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _validate_cold(fields):
+    for cached in (validation._check_peer, validation.check_key, validation.check_network):
+        cached.cache_clear()
+    validation.check_profile(fields)
+
+
+def _route_batch(profile, iface):
+    prefixes, _, _ = profile.routes()
+    iface._ip_batch([["route", "replace", prefix, "dev", profile.interface_name] for prefix in prefixes])
+
+
+def main(rounds=3):
+    batches = []
+    interface.subprocess.run = lambda cmd, **kwargs: batches.append(cmd) or subprocess.CompletedProcess(cmd, 0)
+    iface = interface.Interface("")
+    print(f"{'peers':>6} {'stage':<22} {'best':>10} {'per peer':>10}")
+    for count in (1000, 2500, 5000, 10000):
+        fields = _fields(count)
+        profile = profile_model.Profile(fields)
+        stages = [
+            ("validate", lambda: _validate_cold(fields)),
+            ("parse model", lambda: profile_model.Profile(fields)),
+            ("wg setconf config", lambda: build_config(profile_model.Profile(fields), PRIVATE_KEY)),
+            ("uapi peers", lambda: uapi.profile_peers(profile_model.Profile(fields))),
+            ("route batch", lambda: _route_batch(profile_model.Profile(fields), iface)),
+        ]
+        for label, fn in stages:
+            best = _best(fn, rounds)
+            print(f"{count:>6} {label:<22} {best * 1000:8.2f} ms {best / count * 1e6:7.2f} us")
+        assert len(profile.routes()[0]) == count
+    # One sudo call per route install, whatever the peer count
+    assert all(cmd[-3:-1] == ["-force", "-batch"] for cmd in batches)
+
+
+if __name__ == "__main__":
+    main()
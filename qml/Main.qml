@@ -26,6 +26,8 @@ UITK.MainView {
         property bool finishedWizard: false
         property bool useUserspace: true
         property bool canUseKmod: false
+        property bool multiTunnel: false
+        property bool waitHandshake: true
     }
 
     Toast {
@@ -10,6 +10,7 @@ UITK.Page {
     property int handler: ContentHub.ContentHandler.Source
     
     signal importFinished(string filePath)
+    signal importManyFinished(var filePaths)
     signal importCancelled()
     
     header: UITK.PageHeader {
@@ -49,7 +50,7 @@ UITK.Page {
             
             // Create closure to keep context
             var selectedPeer = peer
-            selectedPeer.selectionType = ContentHub.ContentTransfer.Single
+            selectedPeer.selectionType = ContentHub.ContentTransfer.Multiple
             var transfer = selectedPeer.request()
             
             if (!transfer) {
@@ -98,30 +99,36 @@ UITK.Page {
             return
         }
         
-        var fileItem = transfer.items[0]
-        if (!fileItem || !fileItem.url) {
-            console.log("Invalid file item")
+        var filePaths = []
+        for (var i = 0; i < transfer.items.length; i++) {
+            var fileItem = transfer.items[i]
+            if (!fileItem || !fileItem.url) {
+                console.log("Invalid file item")
+                continue
+            }
+            // Convert URL to path, removing file:// prefix if present
+            var filePath = fileItem.url.toString()
+            if (filePath.startsWith("file://")) {
+                filePath = filePath.substring(7)
+            }
+            filePaths.push(filePath)
+        }
+
+        if (filePaths.length === 0) {
             importCancelled()
             pageStack.pop()
             return
         }
-        
-        var fileUrl = fileItem.url
-        console.log("File URL:", fileUrl)
-        
-        // Convert URL to path
-        var filePath = fileUrl.toString()
-        
-        // Remove file:// prefix if present
-        if (filePath.startsWith("file://")) {
-            filePath = filePath.substring(7)
-        }
-        
-        console.log("Final file path:", filePath)
-        
+
+        console.log("Final file paths:", filePaths)
+
         // Emit signal first, then return
-        importFinished(filePath)
-        
+        if (filePaths.length === 1) {
+            importFinished(filePaths[0])
+        } else {
+            importManyFinished(filePaths)
+        }
+
         // Small delay so signal is processed before pop
         Qt.callLater(function() {
             pageStack.pop()
@@ -22,6 +22,7 @@ UITK.Page {
                                    ? UITK.Theme.palette
                                    : null))
     property bool lastImportWasZip: false
+    property string importProgressText: ""
     property color bgColor: appPalette ? appPalette.normal.background : "#f7f7f7"
     property color baseColor: appPalette ? appPalette.normal.base : "#ffffff"
     property color textColor: appPalette ? appPalette.normal.foregroundText : "#111111"
@@ -30,10 +31,18 @@ UITK.Page {
     Settings {
         id: settings
         property bool useUserspace: true
+        property bool multiTunnel: false
+        property bool waitHandshake: true
     }
     property bool useUserspace: (typeof root !== "undefined" && root.settings)
                                ? root.settings.useUserspace
                                : settings.useUserspace
+    property bool multiTunnel: (typeof root !== "undefined" && root.settings)
+                               ? root.settings.multiTunnel
+                               : settings.multiTunnel
+    property bool waitHandshake: (typeof root !== "undefined" && root.settings)
+                               ? root.settings.waitHandshake
+                               : settings.waitHandshake
     property bool safePreUp: true
     header: UITK.PageHeader {
         id: header
@@ -58,6 +67,19 @@ UITK.Page {
         importPage.importFinished.connect(function(filePath) {
             importConfPath(filePath)
         })
+        importPage.importManyFinished.connect(function(filePaths) {
+            importPaths(filePaths)
+        })
+    }
+
+    // Several files or folders: stored in batches, the list stays usable
+    function importPaths(filePaths) {
+        console.log("Importing files:", filePaths.length)
+        lastImportWasZip = true
+        importProgressModal.open()
+        python.call('vpn.instance.import_many', [filePaths], function(result) {
+            handleImportResult(result)
+        })
     }
     
     function importConfPath(filePath) {
@@ -96,6 +118,19 @@ UITK.Page {
         })
     }
 
+    function activeProfileName(exceptIndex) {
+        for (var i = 0; i < listmodel.count; i++) {
+            if (i === exceptIndex) {
+                continue
+            }
+            const entry = listmodel.get(i)
+            if (entry.c_status && entry.c_status.init && !entry.c_status.connecting) {
+                return entry.profile_name
+            }
+        }
+        return null
+    }
+
     function connectProfile(index, profileName) {
         // визуально показать, что начали подключение
         listmodel.setProperty(index, 'c_status', {
@@ -104,18 +139,40 @@ UITK.Page {
                                    peers: [],
                                    started: Date.now() / 1000
                                })
-        python.call('vpn.instance._connect',
-                    [profileName, !useUserspace, safePreUp],
-                    function (error_msg) {
-                        if (error_msg) {
+        const fromProfile = multiTunnel ? null : activeProfileName(index)
+        if (fromProfile) {
+            python.call('vpn.instance.switch_profile',
+                        [fromProfile, profileName, !useUserspace, safePreUp],
+                        function (res) {
+                            if (res.error) {
+                                listmodel.setProperty(index, 'c_status', {
+                                                           init: false,
+                                                           connecting: false,
+                                                           peers: []
+                                                       })
+                                toast.show(i18n.tr("Failed:") + " " + res.error)
+                                return
+                            }
+                            console.log("switch_profile:", res.switch_ms, "ms, fast:", res.fast)
+                            toast.show(i18n.tr('Switched in %1 ms').arg(res.switch_ms))
+                            statusKickoff.restart()
+                            showStatus()
+                        })
+            return
+        }
+        python.call('vpn.instance.connect',
+                    [profileName, !useUserspace, safePreUp, multiTunnel, waitHandshake],
+                    function (res) {
+                        if (res.error) {
                             listmodel.setProperty(index, 'c_status', {
                                                        init: false,
                                                        connecting: false,
                                                        peers: []
                                                    })
-                            toast.show(i18n.tr("Failed:") + " " + error_msg)
+                            toast.show(i18n.tr("Failed:") + " " + res.error)
                             return
                         }
+                        console.log("connect:", res.connect_ms, "ms, handshake:", res.handshake_ms, "ms")
                         // сразу показать, что соединяемся/соединены; уточним после опроса
                         listmodel.setProperty(index, 'c_status', {
                                                    init: true,
@@ -123,7 +180,13 @@ UITK.Page {
                                                    peers: [],
                                                    started: Date.now() / 1000
                                                })
-                        toast.show(i18n.tr('Connecting..'))
+                        if (res.handshake_ms !== null && res.handshake_ms !== undefined) {
+                            toast.show(i18n.tr('Connected in %1 ms').arg(res.handshake_ms))
+                        } else if (res.waited) {
+                            toast.show(i18n.tr('Connected, no handshake yet'))
+                        } else {
+                            toast.show(i18n.tr('Connecting..'))
+                        }
                         statusKickoff.restart()
                         showStatus()
                     })
@@ -163,6 +226,7 @@ UITK.Page {
 
     function handleImportResult(result) {
         importProgressModal.close()
+        importProgressText = ""
         if (result.error) {
             console.log("Import error:", result.error)
             toast.show(i18n.tr("Import failed: ") + result.error)
@@ -170,9 +234,18 @@ UITK.Page {
         }
         console.log("Import success:", result)
         var count = (result.profiles && result.profiles.length) ? result.profiles.length : 0
-        toast.show(count > 1
-                   ? i18n.tr("Imported %1 profiles").arg(count)
-                   : i18n.tr("Profile imported successfully"))
+        var present = (result.present && result.present.length) ? result.present.length : 0
+        if (count === 0 && present > 0) {
+            toast.show(present > 1
+                       ? i18n.tr("%1 profiles are already present").arg(present)
+                       : i18n.tr("Profile %1 is already present").arg(result.present[0]))
+        } else if (result.warning) {
+            toast.show(i18n.tr("Imported %1 profiles").arg(count) + ". " + result.warning)
+        } else {
+            toast.show(count > 1
+                       ? i18n.tr("Imported %1 profiles").arg(count)
+                       : i18n.tr("Profile imported successfully"))
+        }
 
         populateProfiles(function() {
             if (!result.profiles || result.profiles.length === 0) {
@@ -195,6 +268,9 @@ UITK.Page {
                         "hasPrivateKey": entry.has_private_key || false,
                         "extraRoutes": entry.extra_routes || "",
                         "dnsServers": entry.dns_servers || "",
+                        "mtu": entry.mtu || "",
+                        "kind": entry.kind || "client",
+                        "listenPort": entry.listen_port || "",
                         "preUp": entry.pre_up || "",
                         "postUp": entry.post_up || "",
                         "preDown": entry.pre_down || "",
@@ -583,7 +659,7 @@ Component {
             
             Text {
                 anchors.horizontalCenter: parent.horizontalCenter
-                text: i18n.tr("Importing profile...")
+                text: importProgressText || i18n.tr("Importing profile...")
                 color: textColor
                 font.pixelSize: units.gu(1.5)
             }
@@ -694,6 +770,9 @@ Component {
                                            "hasPrivateKey": has_private_key || false,
                                            "extraRoutes": extra_routes,
                                            "dnsServers": dns_servers,
+                                           "mtu": mtu,
+                                           "kind": kind,
+                                           "listenPort": listen_port,
                                            "preUp": pre_up,
                                            "postUp": post_up,
                                            "preDown": pre_down,
@@ -1004,6 +1083,12 @@ Component {
         id: python
         Component.onCompleted: {
             addImportPath(Qt.resolvedUrl('../../src/'))
+            setHandler('importProgress', function (done, total) {
+                importProgressText = i18n.tr("Importing %1 of %2...").arg(done).arg(total)
+            })
+            setHandler('importManyProgress', function (files, configs) {
+                importProgressText = i18n.tr("Read %1 files, %2 configs...").arg(files).arg(configs)
+            })
             importModule('vpn', function () {
                 python.call('vpn.instance.set_pwd', [root.pwd], function(result){});
                 // First show UI promptly, then clean up userspace in background
@@ -18,6 +18,10 @@ UITK.Page {
     property bool hasPrivateKey: false
     property string extraRoutes
     property string dnsServers
+    property string mtu
+    // "server": a site hub that listens on listenPort; its peers may have no endpoint
+    property string kind: "client"
+    property string listenPort
     property string interfaceName
     property string preUp
     property string postUp
@@ -26,6 +30,25 @@ UITK.Page {
     property string privateKeyMask: "*************************************"
 
     property variant peers: []
+    // After a failed save, edits re-run the validation so the list of
+    // problems shrinks as they are fixed
+    property bool liveCheck: false
+
+    onIpAddressChanged: scheduleCheck()
+    onPrivateKeyChanged: scheduleCheck()
+    onExtraRoutesChanged: scheduleCheck()
+    onDnsServersChanged: scheduleCheck()
+    onMtuChanged: scheduleCheck()
+    onKindChanged: scheduleCheck()
+    onListenPortChanged: scheduleCheck()
+
+    Timer {
+        id: checkTimer
+        interval: 300
+        onTriggered: {
+            python.call('vpn.instance.check_profile', [currentFields()], showErrors)
+        }
+    }
 
     Settings {
         id: settings
@@ -127,6 +150,35 @@ UITK.Page {
                         dnsServers = text
                     }
                 }
+                MyTextField {
+                    title: i18n.tr("MTU")
+                    text: mtu
+                    placeholder: i18n.tr("1420 or auto")
+                    onChanged: {
+                        errorMsg = ''
+                        mtu = text
+                    }
+                }
+                SettingsItem {
+                    title: i18n.tr("Server")
+                    description: i18n.tr("Listen for peers; peer endpoints become optional")
+                    control: UITK.Switch {
+                        checked: kind === "server"
+                        onCheckedChanged: {
+                            errorMsg = ''
+                            kind = checked ? "server" : "client"
+                        }
+                    }
+                }
+                MyTextField {
+                    title: i18n.tr("Listen port")
+                    text: listenPort
+                    placeholder: kind === "server" ? "51820" : i18n.tr("Optional")
+                    onChanged: {
+                        errorMsg = ''
+                        listenPort = text
+                    }
+                }
                 MyTextField {
                     title: i18n.tr("PreUp command")
                     text: preUp
@@ -169,6 +221,8 @@ UITK.Page {
                 model: ListModel {
                     id: listmodel
                     dynamicRoles: true
+                    onDataChanged: scheduleCheck()
+                    onCountChanged: scheduleCheck()
                 }
                 delegate: Column {
                     id: peerCol
@@ -224,6 +278,16 @@ UITK.Page {
                         placeholder: "10.0.0.1/32, 192.168.1.0/24"
                     }
 
+                    MyTextField {
+                        title: i18n.tr("Excluded IP prefixes")
+                        text: excludedPrefixes
+                        onChanged: {
+                            errorMsg = ''
+                            excludedPrefixes = text
+                        }
+                        placeholder: "192.168.0.0/16"
+                    }
+
                     MyTextField {
                         title: i18n.tr("Endpoint with port")
                         text: endpoint
@@ -234,6 +298,26 @@ UITK.Page {
                         placeholder: "vpn.example.com:1234"
                     }
 
+                    MyTextField {
+                        title: i18n.tr("Alternative endpoints")
+                        text: endpoints
+                        onChanged: {
+                            errorMsg = ''
+                            endpoints = text
+                        }
+                        placeholder: "eu.example.com:1234, us.example.com:1234"
+                    }
+
+                    MyTextField {
+                        title: i18n.tr("Persistent keepalive")
+                        text: keepalive
+                        onChanged: {
+                            errorMsg = ''
+                            keepalive = text
+                        }
+                        placeholder: i18n.tr("5, off or auto")
+                    }
+
                     MyTextField {
                         title: i18n.tr("Preshared key")
                         placeholder: "c29tZSBzaWxseSBzdHVmZgo="
@@ -257,7 +341,10 @@ UITK.Page {
                                          "name": '',
                                          "key": '',
                                          "allowedPrefixes": '',
+                                         "excludedPrefixes": '',
                                          "endpoint": '',
+                                         "endpoints": '',
+                                         "keepalive": '',
                                          "presharedKey": ''
                                      })
                 }
@@ -285,20 +372,10 @@ UITK.Page {
                          && (privateKey || isEditing)
                 onClicked: {
                     errorMsg = ''
-                    let _peers = []
-                    for (var i = 0; i < listmodel.count; i++) {
-                        const p = listmodel.get(i)
-                        _peers.push({
-                                        "name": p.name,
-                                        "key": p.key,
-                                        "allowed_prefixes": p.allowedPrefixes,
-                                        "endpoint": p.endpoint,
-                                        "presharedKey": p.presharedKey
-                                    })
-                    }
+                    let _peers = currentPeers()
 
                     python.call('vpn.instance.save_profile',
-                                [profileName, ipAddress, privateKey, interfaceName, extraRoutes, dnsServers, preUp, postUp, preDown, postDown, _peers],
+                                [profileName, ipAddress, privateKey, interfaceName, extraRoutes, dnsServers, preUp, postUp, preDown, postDown, _peers, mtu, kind, listenPort],
                                 function (error) {
                                     if (!error) {
                                         if (!isEditing) {
@@ -311,6 +388,14 @@ UITK.Page {
                                     } else {
                                         console.log(error);
                                         errorMsg = error;
+                                        // Show every problem, not only the first one
+                                        python.call('vpn.instance.check_profile', [currentFields()],
+                                                    function (errors) {
+                                                        if (errors.length) {
+                                                            liveCheck = true
+                                                            showErrors(errors)
+                                                        }
+                                                    })
                                     }
                                 })
                 }
@@ -318,6 +403,48 @@ UITK.Page {
         }
     }
 
+    function currentPeers() {
+        let _peers = []
+        for (var i = 0; i < listmodel.count; i++) {
+            const p = listmodel.get(i)
+            _peers.push({
+                            "name": p.name,
+                            "key": p.key,
+                            "allowed_prefixes": p.allowedPrefixes,
+                            "excluded_prefixes": p.excludedPrefixes,
+                            "endpoint": p.endpoint,
+                            "endpoints": p.endpoints,
+                            "keepalive": p.keepalive,
+                            "presharedKey": p.presharedKey
+                        })
+        }
+        return _peers
+    }
+
+    function currentFields() {
+        return {
+            "profile_name": profileName,
+            "private_key": privateKey,
+            "ip_address": ipAddress,
+            "extra_routes": extraRoutes,
+            "dns_servers": dnsServers,
+            "mtu": mtu,
+            "kind": kind,
+            "listen_port": listenPort,
+            "peers": currentPeers()
+        }
+    }
+
+    function showErrors(errors) {
+        errorMsg = errors.map(function (e) { return e.message }).join('\n')
+    }
+
+    function scheduleCheck() {
+        if (liveCheck) {
+            checkTimer.restart()
+        }
+    }
+
     function normalizePeers(source) {
         if (!source) {
             return []
@@ -343,7 +470,10 @@ UITK.Page {
                                  "name": p.name,
                                  "key": p.key,
                                  "allowedPrefixes": p.allowed_prefixes,
+                                 "excludedPrefixes": p.excluded_prefixes || '',
                                  "endpoint": p.endpoint,
+                                 "endpoints": p.endpoints || '',
+                                 "keepalive": p.keepalive || '',
                                  "presharedKey": p.presharedKey
                              })
         }
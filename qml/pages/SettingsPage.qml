@@ -16,6 +16,8 @@ UITK.Page {
         property bool useUserspace: true
         property bool canUseKmod: false
         property bool allowExternalControl: false
+        property bool multiTunnel: false
+        property bool waitHandshake: true
     }
 
     property string versionLabel: "WireGuard for Ubuntu Touch"
@@ -142,12 +144,40 @@ UITK.Page {
                 }
             }
 
+            SettingsItem {
+                title: i18n.tr("Allow several tunnels at once")
+                description: i18n.tr("Each tunnel gets its own routing table; overlapping routes are refused")
+                control: UITK.Switch {
+                    checked: settings.multiTunnel
+                    onCheckedChanged: {
+                        settings.multiTunnel = checked
+                        if (typeof root !== "undefined" && root.settings) {
+                            root.settings.multiTunnel = checked
+                        }
+                    }
+                }
+            }
+
+            SettingsItem {
+                title: i18n.tr("Wait for first handshake")
+                description: i18n.tr("Report a tunnel as connected only once the peer has answered")
+                control: UITK.Switch {
+                    checked: settings.waitHandshake
+                    onCheckedChanged: {
+                        settings.waitHandshake = checked
+                        if (typeof root !== "undefined" && root.settings) {
+                            root.settings.waitHandshake = checked
+                        }
+                    }
+                }
+            }
+
             SettingsItem {
                 title: i18n.tr("Re-check kernel module")
                 description: i18n.tr("Run kernel and sudo check wizard")
                 onClicked: {
                     stack.clear()
-                    stack.push(Qt.resolvedUrl("WizardPage.qml"))
+                    stack.push(Qt.resolvedUrl("WizardPage.qml"), {"forceRecheck": true})
                 }
             }
 
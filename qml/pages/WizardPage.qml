@@ -9,6 +9,7 @@ import "../components"
 UITK.Page {
     property bool wizardRunning: true
     property bool kernelCheckDone: false
+    property bool forceRecheck: false
     property string errorMsg: ""
     header: UITK.PageHeader {
         id: header
@@ -123,7 +124,7 @@ for an example change to the kernel.")
             addImportPath(Qt.resolvedUrl('../../src/'))
             importModule('vpn', function () {
                 python.call('vpn.instance.set_pwd', [root.pwd], function(result){});
-                python.call('vpn.instance.can_use_kernel_module', [],
+                python.call('vpn.instance.can_use_kernel_module', [forceRecheck],
                             function (can_use_module) {
                                 if (kernelCheckDone) {
                                     return
@@ -0,0 +1,134 @@
+import json
+import os
+import shutil
+import threading
+
+from pathlib import Path
+
+from profile import CONFIG_DIR
+from vendor_paths import APP_ROOT
+
+# System capabilities only change with the kernel, the wireguard module or an
+# app update, so probes run once per such state instead of on every call.
+CACHE_FILE = CONFIG_DIR / 'capabilities.json'
+
+_lock = threading.Lock()
+_memory = None
+
+
+def app_version():
+    for name in ('manifest.json', 'manifest.json.in'):
+        try:
+            return json.loads((APP_ROOT / name).read_text()).get('version') or 'unknown'
+        except Exception:
+            continue
+    return 'unknown'
+
+
+def module_state():
+    return 'loaded' if Path('/sys/module/wireguard').exists() else 'absent'
+
+
+def cache_key():
+    try:
+        release = os.uname().release
+    except Exception:
+        release = 'unknown'
+    return f'{release}|{module_state()}|{app_version()}'
+
+
+def _load():
+    global _memory
+    key = cache_key()
+    if _memory is not None and _memory.get('key') == key:
+        return _memory
+    data = None
+    try:
+        data = json.loads(CACHE_FILE.read_text())
+    except Exception:
+        data = None
+    if not isinstance(data, dict) or data.get('key') != key:
+        data = {'key': key, 'caps': {}}
+    _memory = data
+    return data
+
+
+def _store(data):
+    try:
+        CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = CACHE_FILE.with_name(CACHE_FILE.name + '.tmp')
+        tmp.write_text(json.dumps(data, indent=4, sort_keys=True))
+        os.chmod(tmp, 0o600)
+        os.replace(tmp, CACHE_FILE)
+    except Exception:
+        pass
+
+
+def cached(name, probe, refresh=False):
+    """
+    Returns the cached value of capability `name`, running `probe()` when the
+    cache is empty, stale or `refresh` is set. A probe returning None is
+    treated as inconclusive and is not cached.
+    """
+    with _lock:
+        data = _load()
+        if not refresh and name in data['caps']:
+            return data['caps'][name]
+    value = probe()
+    if value is None:
+        return None
+    with _lock:
+        # The probe itself may have loaded the module and changed the key
+        data = _load()
+        data['caps'][name] = value
+        _store(data)
+    return value
+
+
+def invalidate():
+    global _memory
+    with _lock:
+        _memory = None
+        try:
+            CACHE_FILE.unlink()
+        except Exception:
+            pass
+
+
+def snapshot():
+    with _lock:
+        data = _load()
+        return dict(data['caps'])
+
+
+def _which(name):
+    resolved = shutil.which(name)
+    if resolved:
+        return resolved
+    for directory in ('/usr/sbin', '/sbin', '/usr/bin', '/bin'):
+        candidate = Path(directory) / name
+        if candidate.exists():
+            return str(candidate)
+    return ''
+
+
+def resolvectl_path(refresh=False):
+    return cached('resolvectl', lambda: _which('resolvectl'), refresh)
+
+
+def firewall_tools(refresh=False):
+    return cached('firewall', lambda: {'nft': _which('nft'), 'iptables': _which('iptables'),
+                                       'ip6tables': _which('ip6tables')}, refresh)
+
+
+def _probe_ipv6():
+    if not Path('/proc/net/if_inet6').exists():
+        return False
+    try:
+        return Path('/proc/sys/net/ipv6/conf/all/disable_ipv6').read_text().strip() == '0'
+    except Exception:
+        return True
+
+
+def has_ipv6(refresh=False):
+    return cached('ipv6', _probe_ipv6, refresh)
@@ -0,0 +1,225 @@
+import re
+from collections import namedtuple
+
+# Inline comments need whitespace before the marker, so "#" and ";" inside
+# a value (e.g. in a hook command) survive.
+_INLINE_COMMENT = re.compile(r'\s[;#].*$')
+
+Diagnostic = namedtuple('Diagnostic', 'line severity message')
+
+
+class ParsedPeer:
+    __slots__ = ('line', 'name', 'public_key', 'preshared_key', 'allowed_ips', 'excluded_ips',
+                 'endpoint', 'persistent_keepalive', 'extra')
+
+    def __init__(self, line):
+        self.line = line
+        self.name = ''
+        self.public_key = ''
+        self.preshared_key = ''
+        self.allowed_ips = []
+        # From the app's "#ExcludedIPs = ..." marker
+        self.excluded_ips = []
+        self.endpoint = ''
+        self.persistent_keepalive = None
+        # wg-quick keys the app has no field for: {key as written: value}
+        self.extra = {}
+
+
+class ParsedConfig:
+    __slots__ = ('profile_name', 'private_key', 'addresses', 'dns', 'listen_port', 'mtu', 'table',
+                 'fwmark', 'save_config', 'pre_up', 'post_up', 'pre_down', 'post_down', 'extra',
+                 'peers', 'diagnostics')
+
+    def __init__(self):
+        self.profile_name = None
+        self.private_key = ''
+        self.addresses = []
+        self.dns = []
+        self.listen_port = None
+        self.mtu = None
+        self.table = None
+        self.fwmark = None
+        self.save_config = None
+        self.pre_up = []
+        self.post_up = []
+        self.pre_down = []
+        self.post_down = []
+        self.extra = {}
+        self.peers = []
+        self.diagnostics = []
+
+    @property
+    def errors(self):
+        return [d for d in self.diagnostics if d.severity == 'error']
+
+    def wg_quick_extra(self):
+        """
+        Interface keys that are kept only to be written back on export:
+        {key as in wg-quick: value}.
+        """
+        found = {}
+        for key, attr in (('ListenPort', 'listen_port'), ('Table', 'table'),
+                          ('FwMark', 'fwmark'), ('SaveConfig', 'save_config')):
+            value = getattr(self, attr)
+            if value is not None:
+                found[key] = str(value)
+        found.update(self.extra)
+        return found
+
+
+def _csv(value):
+    return [x.strip() for x in value.split(',') if x.strip()]
+
+
+def _set(target, attr, value, line, diagnostics, key):
+    if getattr(target, attr) not in (None, ''):
+        diagnostics.append(Diagnostic(line, 'warning', f'{key} given twice, the last one wins'))
+    setattr(target, attr, value)
+
+
+def _set_int(low, high):
+    def handler(target, attr, value, line, diagnostics, key):
+        if not value.isdigit() or not low <= int(value) <= high:
+            diagnostics.append(Diagnostic(line, 'error', f'{key} must be a number from {low} to {high}'))
+            return
+        _set(target, attr, int(value), line, diagnostics, key)
+    return handler
+
+
+def _extend(target, attr, value, line, diagnostics, key):
+    getattr(target, attr).extend(_csv(value))
+
+
+def _append(target, attr, value, line, diagnostics, key):
+    getattr(target, attr).append(value)
+
+
+def _keepalive(target, attr, value, line, diagnostics, key):
+    lowered = value.lower()
+    if lowered != 'off' and not (lowered.isdigit() and int(lowered) <= 65535):
+        diagnostics.append(Diagnostic(line, 'error', f'{key} must be "off" or a number up to 65535'))
+        return
+    # An earlier "#Keepalive = auto" marker wins over the exported interval
+    if target.persistent_keepalive != 'auto':
+        target.persistent_keepalive = 'off' if lowered in ('off', '0') else lowered
+
+
+# lowercase key -> (attribute, handler, key as written by wg-quick)
+INTERFACE_KEYS = {
+    'privatekey': ('private_key', _set, 'PrivateKey'),
+    'address': ('addresses', _extend, 'Address'),
+    'dns': ('dns', _extend, 'DNS'),
+    'listenport': ('listen_port', _set_int(0, 65535), 'ListenPort'),
+    'mtu': ('mtu', _set_int(576, 9000), 'MTU'),
+    'table': ('table', _set, 'Table'),
+    'fwmark': ('fwmark', _set, 'FwMark'),
+    'saveconfig': ('save_config', _set, 'SaveConfig'),
+    'preup': ('pre_up', _append, 'PreUp'),
+    'postup': ('post_up', _append, 'PostUp'),
+    'predown': ('pre_down', _append, 'PreDown'),
+    'postdown': ('post_down', _append, 'PostDown'),
+}
+PEER_KEYS = {
+    'publickey': ('public_key', _set, 'PublicKey'),
+    'presharedkey': ('preshared_key', _set, 'PresharedKey'),
+    'allowedips': ('allowed_ips', _extend, 'AllowedIPs'),
+    'endpoint': ('endpoint', _set, 'Endpoint'),
+    'persistentkeepalive': ('persistent_keepalive', _keepalive, 'PersistentKeepalive'),
+}
+# Hook keys may be empty ("PostUp =") without a diagnostic
+_MAY_BE_EMPTY = {'preup', 'postup', 'predown', 'postdown'}
+
+
+def _meta_comment(line, config, peer):
+    """
+    "#Profile = x" anywhere, "#Name = x", "#Keepalive = auto" and
+    "#ExcludedIPs = a, b" in a peer.
+    """
+    key, sep, value = line[1:].partition('=')
+    if not sep:
+        return
+    key = key.strip().lower()
+    value = value.strip()
+    if key == 'profile':
+        config.profile_name = value
+    elif peer is not None and key == 'name':
+        peer.name = value
+    elif peer is not None and key == 'keepalive' and value.lower() == 'auto':
+        peer.persistent_keepalive = 'auto'
+    elif peer is not None and key == 'excludedips':
+        peer.excluded_ips.extend(_csv(value))
+
+
+def parse(lines):
+    """
+    Single pass over a wg-quick config. Returns a ParsedConfig; problems are
+    collected in `diagnostics` with their 1-based line number instead of
+    stopping the parse.
+    """
+    config = ParsedConfig()
+    diagnostics = config.diagnostics
+    section = None
+    peer = None
+    target = config
+    keys = INTERFACE_KEYS
+    seen_interface = False
+    for number, raw in enumerate(lines, 1):
+        line = raw.strip()
+        if not line:
+            continue
+        first = line[0]
+        if first == '#' or first == ';':
+            _meta_comment(line, config, peer)
+            continue
+        if first == '[':
+            header = line.lower()
+            if header == '[interface]':
+                if seen_interface:
+                    diagnostics.append(Diagnostic(number, 'warning', 'Second [Interface] section'))
+                seen_interface = True
+                section, peer, target, keys = 'interface', None, config, INTERFACE_KEYS
+            elif header == '[peer]':
+                peer = ParsedPeer(number)
+                config.peers.append(peer)
+                section, target, keys = 'peer', peer, PEER_KEYS
+            else:
+                diagnostics.append(Diagnostic(number, 'warning', f'Unknown section {line}, ignored'))
+                section, peer, target, keys = 'unknown', None, None, None
+            continue
+
+        key, sep, value = line.partition('=')
+        if not sep:
+            diagnostics.append(Diagnostic(number, 'error', 'Expected "Key = Value"'))
+            continue
+        key = key.strip()
+        if '#' in value or ';' in value:
+            value = _INLINE_COMMENT.sub('', value)
+        value = value.strip()
+        if section is None:
+            diagnostics.append(Diagnostic(number, 'warning', f'{key} outside of a section, read as [Interface]'))
+            section = 'interface'
+        if section == 'unknown':
+            continue
+        lowered = key.lower()
+        if not value:
+            if lowered not in _MAY_BE_EMPTY:
+                diagnostics.append(Diagnostic(number, 'warning', f'{key} has no value'))
+            continue
+        entry = keys.get(lowered)
+        if entry is None:
+            target.extra[key] = value
+            diagnostics.append(Diagnostic(number, 'warning', f'Unknown key {key}, kept as is'))
+            continue
+        attr, handler, name = entry
+        handler(target, attr, value, number, diagnostics, name)
+
+    for peer in config.peers:
+        if not peer.public_key:
+            diagnostics.append(Diagnostic(peer.line, 'error', '[Peer] without PublicKey'))
+    diagnostics.sort(key=lambda d: d.line)
+    return config
+
+
+def format_diagnostic(diagnostic):
+    return f'line {diagnostic.line}: {diagnostic.message}'
@@ -1,30 +1,27 @@
-import struct
-import socket
-import subprocess
-import time
 import os
 import sys
-import logging
-
-import interface
-import vpn
-
-from pathlib import Path
+import time
 
-from vendor_paths import resolve_vendor_binary
+# Keep module-level imports minimal: this file runs as its own long-lived
+# process, so heavy modules are imported where they are used.
+_MODULE_START = time.monotonic()
 
-WG_PATH = resolve_vendor_binary("wireguard")
 APP_ID = 'wireguard.sysadmin'
-APP_HOME = Path(os.environ.get("WIREGUARD_APP_HOME", "/home/phablet"))
-LOG_DIR = APP_HOME / ".cache" / APP_ID
-LOG_DIR.mkdir(parents=True, exist_ok=True)
-try:
-    os.chmod(LOG_DIR, 0o700)
-except Exception:
-    pass
+APP_HOME = os.environ.get("WIREGUARD_APP_HOME", "/home/phablet")
+LOG_DIR = os.path.join(APP_HOME, ".cache", APP_ID)
 log = None
 
+# A handshake older than this (rekey interval plus retries) makes an endpoint
+# suspect; fresher ones prove it still works, so it is not looked up again.
+ENDPOINT_SUSPECT_AGE = 135
+# A peer with alternative endpoints that completed no handshake this long
+# after its tunnel was (re)configured gets its endpoints raced. Races only
+# start when there is no session to lose, and are polled this often.
+RACE_AFTER = 15
+RACE_POLL_INTERVAL = 0.25
+
 def _parse_default_gw(cmd):
+    import subprocess
     try:
         output = subprocess.check_output(cmd).decode(errors='ignore').splitlines()
     except Exception:
@@ -52,6 +49,8 @@ def _get_default_gw_ipv4():
                 # If not default route or not RTF_GATEWAY, skip it
                 continue
 
+            import socket
+            import struct
             _ip = socket.inet_ntoa(struct.pack("<L", int(line[2], 16)))
             _metric = int(line[6])
             if _metric > metric:
@@ -71,58 +70,777 @@ def get_preferred_def_route():
     return (_get_default_gw_ipv4(), _get_default_gw_ipv6())
 
 
-def keep_tunnel(profile_name, sudo_pwd):
+def _process_age_ms():
+    # Time since exec (including interpreter start-up), from /proc
+    try:
+        with open('/proc/self/stat') as fd:
+            start_ticks = int(fd.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as fd:
+            uptime = float(fd.read().split()[0])
+        return int((uptime - start_ticks / os.sysconf('SC_CLK_TCK')) * 1000)
+    except Exception:
+        return int((time.monotonic() - _MODULE_START) * 1000)
+
+
+def _max_rss_kb():
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except Exception:
+        return -1
 
-    _vpn = vpn.Vpn()
-    _vpn.set_pwd(sudo_pwd)
 
-    PROFILE_DIR = vpn.PROFILES_DIR / profile_name
-    CONFIG_FILE = PROFILE_DIR / 'config.ini'
+class Tunnel:
+    __slots__ = ('profile', 'interface_name', 'proc', 'started', 'configured', 'watchdog', 'endpoints',
+                 'races', 'keepalives')
 
-    route = get_preferred_def_route()
-    profile = _vpn.get_profile(profile_name)
-    interface_name = profile['interface_name']
-    interface_file = Path('/sys/class/net/') / interface_name
-    if not bring_up_interface(interface_name, sudo_pwd):
-        log.info("Interface %s could not be created. Exiting", interface_name)
-        return
+    def __init__(self, profile, proc):
+        import keepalive
+        import profile_model
+        import watchdog
+
+        # Parsed once here and on reload-profile; every reconfigure reuses it
+        profile = profile_model.Profile.coerce(profile)
+        self.profile = profile
+        self.interface_name = profile.interface_name
+        self.proc = proc
+        self.started = time.time()
+        # Last (re)configuration, which drops every session
+        self.configured = self.started
+        self.watchdog = watchdog.HandshakeWatchdog(watchdog.thresholds_from(profile))
+        # peer public key -> addresses its endpoint hostname resolved to
+        self.endpoints = {}
+        # peer public key -> last endpoint race (chosen endpoint and RTTs)
+        self.races = {}
+        # peer public key -> AdaptiveKeepalive of peers set to "auto"
+        self.keepalives = keepalive.adaptive_peers(profile)
+
+
+class Supervisor:
+    """
+    One process for all userspace tunnels: it owns every wireguard-go child,
+    keeps the registry in `daemon_client.STATE_PATH` up to date, accepts new
+    tunnels on a Unix socket and runs a single default-route watcher.
+    """
+
+    # Control socket commands -> handler method
+    COMMANDS = {
+        'ping': '_cmd_ping',
+        'up': '_cmd_up',
+        'down': '_cmd_down',
+        'status': '_cmd_status',
+        'reconfigure': '_cmd_reconfigure',
+        'reload-profile': '_cmd_reload_profile',
+        'set-log-level': '_cmd_set_log_level',
+        'stop': '_cmd_stop',
+    }
+
+    def __init__(self, sudo_pwd, poll_interval=2.0, watchdog_interval=10.0,
+                 route_window=1.0, flap_poll_interval=0.25):
+        import interface
+        from debounce import Debouncer
+
+        self._interface_mod = interface
+        self.sudo_pwd = sudo_pwd
+        self.interface = interface.Interface(sudo_pwd)
+        self.poll_interval = poll_interval
+        self.watchdog_interval = watchdog_interval
+        self.flap_poll_interval = flap_poll_interval
+        self.tunnels = {}
+        self.route = get_preferred_def_route()
+        self.seen_route = self.route
+        # Handovers flap the default route several times a second: only the
+        # route that stays put for `route_window` seconds is applied.
+        self.route_debouncer = Debouncer(self.apply_route, window=route_window)
+        self.route_debouncer.applied_state = self.route
+        self.listener = None
+        self.stats = {}
+        self.stats_time = 0.0
+        # (interface name, peer public key) -> (Tunnel, Future) of running races
+        self.races = {}
+        self._race_pool = None
+
+    def listen(self):
+        import socket
+        import daemon_client
+
+        path = daemon_client.SOCKET_PATH
+        if os.path.exists(path):
+            try:
+                daemon_client.request({'cmd': 'ping'}, timeout=1.0)
+                return False
+            except Exception:
+                os.unlink(path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)
+        try:
+            listener.bind(path)
+        finally:
+            os.umask(old_umask)
+        listener.listen(8)
+        self.listener = listener
+        return True
+
+    def _config_file(self, profile):
+        from profile import PROFILES_DIR
+        return PROFILES_DIR / profile['profile_name'] / 'config.ini'
+
+    def save_state(self):
+        import daemon_client
+
+        state = {
+            'pid': os.getpid(),
+            'tunnels': {
+                name: {
+                    'profile_name': t.profile.get('profile_name'),
+                    'pid': t.proc.pid,
+                    'state': 'up',
+                    'started': int(t.started),
+                }
+                for name, t in self.tunnels.items()
+            },
+        }
+        try:
+            daemon_client.write_state(state)
+        except Exception as e:
+            log.warning('Failed to write tunnel registry: %s', e)
+
+    def add_tunnel(self, profile, sudo_pwd=None):
+        import profile_model
+
+        try:
+            profile = profile_model.Profile.coerce(profile)
+        except profile_model.ProfileError as e:
+            return str(e)
+        if sudo_pwd and sudo_pwd != self.sudo_pwd:
+            self.sudo_pwd = sudo_pwd
+            self.interface = self._interface_mod.Interface(sudo_pwd)
+        interface_name = profile.interface_name
+        if interface_name in self.tunnels:
+            self.remove_tunnel(interface_name)
+        proc = start_wireguard_go(interface_name, self.sudo_pwd)
+        if not proc:
+            return f'Interface {interface_name} could not be created'
+        tunnel = Tunnel(profile, proc)
+        self.tunnels[interface_name] = tunnel
+        log.info('Setting up tunnel %s', interface_name)
+        err = self.interface.config_interface(profile, self._config_file(profile))
+        if err:
+            log.error('Failed to configure %s: %s', interface_name, err)
+            self.remove_tunnel(interface_name)
+            return err
+        tunnel.configured = time.time()
+        self._record_endpoints(tunnel)
+        self.save_state()
+        log.info('Tunnel %s is up (%d tunnels, max RSS %d KiB)',
+                 interface_name, len(self.tunnels), _max_rss_kb())
+        return None
+
+    def remove_tunnel(self, interface_name):
+        tunnel = self.tunnels.pop(interface_name, None)
+        if not tunnel:
+            return False
+        stop_process(tunnel.proc, self.sudo_pwd)
+        self.save_state()
+        log.info('Tunnel %s removed', interface_name)
+        return True
 
-    log.info('Setting up tunnel')
-    _vpn.interface.config_interface(profile, CONFIG_FILE)
-    log.info('Tunnel is up')
+    def check_tunnels(self):
+        gone = []
+        for name, tunnel in self.tunnels.items():
+            if tunnel.proc.poll() is not None or not os.path.exists(os.path.join('/sys/class/net', name)):
+                gone.append(name)
+        for name in gone:
+            log.info('Interface %s no longer exists', name)
+            self.remove_tunnel(name)
 
-    while interface_file.exists():
+    def check_route(self):
         new_route = get_preferred_def_route()
-        if route == new_route:
-            log.debug('Routes did not change, sleeping')
-            time.sleep(2)
-            continue
-        log.info('New route via %s, reconfiguring interface', new_route)
-        route = new_route
-        _vpn.interface.config_interface(profile, CONFIG_FILE)
-    log.info("Interface %s no longer exists. Exiting", interface_name)
-
-def bring_up_interface(interface_name, sudo_pwd):
+        if new_route == self.seen_route:
+            return
+        log.debug('Route changed to %s', new_route)
+        self.seen_route = new_route
+        self.route_debouncer.event(new_route)
+
+    def apply_route(self, route):
+        log.info('New route via %s, reconfiguring %d tunnels', route, len(self.tunnels))
+        self.route = route
+        for tunnel in list(self.tunnels.values()):
+            if not self.interface.config_interface(tunnel.profile, self._config_file(tunnel.profile)):
+                # The best endpoint depends on the network: peers that get no
+                # handshake on it are raced by check_handshakes()
+                tunnel.configured = time.time()
+                self._record_endpoints(tunnel)
+                self.apply_keepalives(tunnel)
+
+    def reconfigure(self, interface_name=None):
+        names = [interface_name] if interface_name else list(self.tunnels)
+        errors = []
+        for name in names:
+            tunnel = self.tunnels.get(name)
+            if not tunnel:
+                errors.append(f'Unknown tunnel: {name}')
+                continue
+            log.info('Reconfiguring %s', name)
+            err = self.interface.config_interface(tunnel.profile, self._config_file(tunnel.profile))
+            if err:
+                errors.append(f'{name}: {err}')
+            else:
+                tunnel.configured = time.time()
+                self._record_endpoints(tunnel)
+                self.apply_keepalives(tunnel)
+        return '; '.join(errors) or None
+
+    def refresh_stats(self, max_age=1.0):
+        # Stats are read on demand and shared by all clients asking within
+        # `max_age`, so a polling UI costs one UAPI read (through the
+        # privileged relay) or `wg show` per interval.
+        if time.monotonic() - self.stats_time < max_age:
+            return self.stats
+        import uapi
+
+        stats = {}
+        legacy = []
+        for name in self.tunnels:
+            if not uapi.available(name, self.sudo_pwd):
+                legacy.append(name)
+                continue
+            try:
+                stats[name] = uapi.status(name, sudo_pwd=self.sudo_pwd)
+            except (uapi.UapiError, OSError, ValueError) as e:
+                log.warning('UAPI status of %s failed: %s', name, e)
+        if legacy:
+            lines = [line for line in self.interface._get_wg_status()
+                     if line.split('\t', 1)[0].strip() in legacy]
+            try:
+                stats.update(self._interface_mod.parse_wg_dump(lines))
+            except ValueError as e:
+                log.warning('Bad wg dump: %s', e)
+        self.stats = stats
+        self.stats_time = time.monotonic()
+        return self.stats
+
+    def check_handshakes(self):
+        import metrics
+
+        stats = self.refresh_stats(max_age=0)
+        for name, tunnel in list(self.tunnels.items()):
+            peers = (stats.get(name) or {}).get('peers') or []
+            self.check_endpoints(tunnel, peers)
+            if tunnel.profile.is_server:
+                # Peers that dial in are idle, not broken, when they go quiet
+                table = tunnel.profile.peer_table
+                peers = [p for p in peers if getattr(table.get(p.get('public_key')), 'endpoint', None)]
+            known = len(tunnel.watchdog.history)
+            for action, public_key in tunnel.watchdog.check(peers, self._keepalive_intervals(tunnel)):
+                log.warning('%s: stale handshake of peer %s, running %s', name, public_key, action)
+                self.recover(tunnel, action, public_key)
+            for record in tunnel.watchdog.history[known:]:
+                log.info('%s: peer %s recovered after %.1f s (%s)', name, record['public_key'],
+                         record['time_to_recover'], ', '.join(record['actions']))
+                metrics.record('recovery', interface=name,
+                               profile=tunnel.profile.get('profile_name'), **record)
+            self._race_unanswered(tunnel, peers)
+            self.adapt_keepalives(tunnel, peers)
+
+    def _race_unanswered(self, tunnel, peers):
+        """
+        Races the endpoints of peers that completed no handshake since the
+        tunnel was (re)configured RACE_AFTER seconds ago, once per
+        configuration: without a session nothing is lost by switching.
+        """
+        if time.time() - tunnel.configured < RACE_AFTER:
+            return
+        keys = [p.get('public_key') for p in peers
+                if int(p.get('latest_handshake') or 0) < tunnel.configured
+                and tunnel.races.get(p.get('public_key'), {}).get('time', 0) < tunnel.configured]
+        if keys:
+            self.race_endpoints(tunnel, keys)
+
+    def _keepalive_intervals(self, tunnel):
+        import keepalive
+
+        intervals = {key: keepalive.peer_interval(peer) for key, peer in tunnel.profile.peer_table.items()}
+        intervals.update((key, adaptive.interval) for key, adaptive in tunnel.keepalives.items())
+        return intervals
+
+    def adapt_keepalives(self, tunnel, peers):
+        changed = []
+        for peer in peers:
+            adaptive = tunnel.keepalives.get(peer.get('public_key'))
+            if adaptive is None:
+                continue
+            interval = adaptive.observe(peer.get('latest_handshake'))
+            if interval is not None:
+                log.info('%s: keepalive of peer %s set to %d s', tunnel.interface_name,
+                         peer['public_key'], interval)
+                changed.append(peer['public_key'])
+        if changed:
+            self.apply_keepalives(tunnel, changed)
+
+    def apply_keepalives(self, tunnel, keys=None):
+        """
+        Pushes the adaptive keepalive intervals (all of them, or those of
+        `keys`) to the device; configuring a peer resets it to the initial one.
+        """
+        import uapi
+
+        name = tunnel.interface_name
+        keys = list(tunnel.keepalives) if keys is None else keys
+        if not keys or not uapi.available(name, self.sudo_pwd):
+            return
+        peers = [{'public_key': key, 'update_only': True,
+                  'persistent_keepalive': tunnel.keepalives[key].interval} for key in keys]
+        try:
+            uapi.set_device(name, peers=peers, sudo_pwd=self.sudo_pwd)
+        except (uapi.UapiError, OSError, ValueError) as e:
+            log.warning('%s: failed to set keepalive: %s', name, e)
+
+    def _endpoint_host(self, peer):
+        import resolver
+
+        host, port = resolver.split_endpoint(peer.get('endpoint'))
+        if not host or port is None or resolver.is_literal(host):
+            return None, None
+        return host, port
+
+    def _record_endpoints(self, tunnel):
+        import resolver
+
+        tunnel.endpoints = {}
+        for peer in tunnel.profile.get('peers', []):
+            host, port = resolver.split_endpoint(peer.get('endpoint'))
+            if host and port is not None:
+                tunnel.endpoints[(peer.get('key') or '').strip()] = tuple(resolver.default.resolve(host))
+
+    def _move_endpoint_routes(self, tunnel, peer, old, new):
+        first = next((p for p in tunnel.profile.get('peers', []) if p.get('endpoint')), None)
+        # config_interface only excludes the first peer's endpoint, and only
+        # outside multi-tunnel mode
+        if first is not peer or tunnel.profile.get('routing_table'):
+            return
+        for ip in set(old) - set(new):
+            self.interface.move_endpoint_route(ip, None)
+        for ip in new:
+            if ip not in old:
+                self.interface.move_endpoint_route(None, ip)
+
+    def check_endpoints(self, tunnel, peers):
+        """
+        Looks DDNS endpoints up again once their cache entry expired, but only
+        for peers whose handshake is getting old.
+        """
+        import resolver
+
+        handshakes = {p.get('public_key'): int(p.get('latest_handshake') or 0) for p in peers}
+        now = time.time()
+        for peer in tunnel.profile.get('peers', []):
+            host, _ = self._endpoint_host(peer)
+            if not host or not resolver.default.expired(host):
+                continue
+            key = (peer.get('key') or '').strip()
+            age = now - (handshakes.get(key) or tunnel.started)
+            if age >= ENDPOINT_SUSPECT_AGE:
+                self.refresh_endpoint(tunnel, peer)
+
+    def refresh_endpoint(self, tunnel, peer):
+        """
+        Re-resolves one peer's endpoint hostname. When the address changed,
+        only that peer's endpoint is updated and the endpoint exclusion route
+        follows it. Returns True on a change.
+        """
+        import resolver
+        import uapi
+
+        host, port = self._endpoint_host(peer)
+        if not host:
+            return False
+        key = (peer.get('key') or '').strip()
+        old = tunnel.endpoints.get(key, ())
+        new = tuple(resolver.default.resolve(host, refresh=True))
+        if not new or new == old:
+            return False
+        name = tunnel.interface_name
+        log.info('%s: endpoint %s moved from %s to %s', name, host, ', '.join(old), ', '.join(new))
+        if not uapi.available(name, self.sudo_pwd):
+            self.reconfigure(name)
+            return True
+        try:
+            uapi.set_device(name, peers=[{'public_key': key, 'update_only': True,
+                                          'endpoint': resolver.format_endpoint(new[0], port)}],
+                            sudo_pwd=self.sudo_pwd)
+        except (uapi.UapiError, OSError, ValueError) as e:
+            log.warning('%s: endpoint update of %s failed: %s', name, key, e)
+            return False
+        tunnel.endpoints[key] = new
+        self._move_endpoint_routes(tunnel, peer, old, new)
+        return True
+
+    def _handshake_via(self, name, peer, endpoint, timeout):
+        """
+        Re-adds the peer with `endpoint`, which drops its session and starts
+        a handshake right away (persistent keepalive), and waits up to
+        `timeout` seconds for it to complete.
+        """
+        import uapi
+
+        key = (peer.get('key') or '').strip()
+        entry = uapi.profile_peers({'peers': [peer.replace(endpoint=endpoint)]})[0]
+        uapi.remove_peer(name, key, sudo_pwd=self.sudo_pwd)
+        uapi.set_device(name, peers=[entry], sudo_pwd=self.sudo_pwd)
+        deadline = time.monotonic() + timeout
+        delay = 0.02
+        while time.monotonic() < deadline:
+            time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+            delay = min(delay * 2, 0.2)
+            for state in uapi.get_device(name, sudo_pwd=self.sudo_pwd)['peers']:
+                if state['public_key'] == key and state.get('last_handshake_time_sec'):
+                    return True
+        return False
+
+    def race_endpoints(self, tunnel, keys=None):
+        """
+        Starts an endpoint race for the peers with alternative endpoints (all
+        of them, or those of `keys`) that are not racing yet. A race drops
+        the peer's session once per candidate and waits seconds for each
+        handshake, so it runs in a worker thread while the loop keeps
+        serving; collect_races() applies the winner. Returns the keys of the
+        peers that are racing.
+        """
+        import concurrent.futures
+        import endpoint_race
+        import uapi
+
+        name = tunnel.interface_name
+        if not uapi.available(name, self.sudo_pwd):
+            return []
+        racing = []
+        for key, peer in tunnel.profile.peer_table.items():
+            if (keys is not None and key not in keys) or len(endpoint_race.candidates(peer)) < 2:
+                continue
+            if (name, key) not in self.races:
+                if self._race_pool is None:
+                    self._race_pool = concurrent.futures.ThreadPoolExecutor(thread_name_prefix='race')
+                self.races[(name, key)] = (tunnel, self._race_pool.submit(self._race_peer, name, peer))
+            racing.append(key)
+        return racing
+
+    def _race_peer(self, name, peer):
+        """
+        Worker side of a race: the endpoint in use is tried first and kept
+        when it answers; otherwise each alternative gets a handshake in turn
+        and the peer is left on the fastest. Returns (chosen, rtts).
+        """
+        import endpoint_race
+        import uapi
+
+        candidates = endpoint_race.candidates(peer)
+        last = []
+
+        def attempt(endpoint, timeout):
+            last[:] = [endpoint]
+            try:
+                return self._handshake_via(name, peer, endpoint, timeout)
+            except (uapi.UapiError, OSError, ValueError) as e:
+                log.warning('%s: endpoint %s failed: %s', name, endpoint, e)
+                return False
+
+        rtts = endpoint_race.race_handshakes(candidates, attempt, keep_first=True)
+        chosen = endpoint_race.fastest(rtts) or candidates[0]
+        if last != [chosen]:
+            attempt(chosen, 0)
+        return chosen, rtts
+
+    def collect_races(self, wait=False):
+        """
+        Applies the finished endpoint races (all of them with `wait`): the
+        peer keeps every candidate while pointing at the winner and the
+        exclusion route follows it. Races of a tunnel that was removed or
+        replaced meanwhile are dropped.
+        """
+        import endpoint_race
+        import resolver
+
+        for (name, key), (tunnel, future) in list(self.races.items()):
+            if not wait and not future.done():
+                continue
+            del self.races[(name, key)]
+            try:
+                chosen, rtts = future.result()
+            except Exception as e:
+                log.warning('%s: endpoint race of %s failed: %s', name, key, e)
+                continue
+            peer = tunnel.profile.peer_table.get(key)
+            if self.tunnels.get(name) is not tunnel or peer is None:
+                continue
+            tunnel.races[key] = {'chosen': chosen, 'rtts': rtts, 'time': int(time.time())}
+            log.info('%s: picked endpoint %s (%s)', name, chosen,
+                     ', '.join(f'{ep}={rtt}' for ep, rtt in rtts.items()))
+            updated = peer.replace(endpoints=', '.join(endpoint_race.candidates(peer)), endpoint=chosen)
+            tunnel.profile = tunnel.profile.replace_peer(peer, updated)
+            old = tunnel.endpoints.get(key, ())
+            host, _ = resolver.split_endpoint(chosen)
+            new = tuple(resolver.default.resolve(host))
+            tunnel.endpoints[key] = new
+            self._move_endpoint_routes(tunnel, updated, old, new)
+            # Re-adding the peer reset its keepalive
+            if key in tunnel.keepalives:
+                self.apply_keepalives(tunnel, [key])
+
+    def recover(self, tunnel, action, public_key):
+        import uapi
+
+        name = tunnel.interface_name
+        peer = tunnel.profile.peer_table.get(public_key)
+        if action != 'reconfigure' and self.race_endpoints(tunnel, [public_key]):
+            # The session is gone: race the alternatives instead of retrying
+            # the same endpoint
+            return None
+        if action == 'reconfigure' or peer is None or not uapi.available(name, self.sudo_pwd):
+            return self.reconfigure(name)
+        try:
+            if action == 'resolve':
+                self.refresh_endpoint(tunnel, peer)
+            else:
+                # Dropping the peer discards its session, the re-add starts
+                # a fresh handshake
+                uapi.remove_peer(name, public_key, sudo_pwd=self.sudo_pwd)
+                uapi.set_device(name, peers=uapi.profile_peers({'peers': [peer]}), sudo_pwd=self.sudo_pwd)
+        except (uapi.UapiError, OSError, ValueError) as e:
+            log.warning('%s: %s of peer %s failed: %s', name, action, public_key, e)
+            return str(e)
+        if public_key in tunnel.keepalives:
+            self.apply_keepalives(tunnel, [public_key])
+        return None
+
+    def handle(self, req):
+        cmd = req.get('cmd')
+        handler = self.COMMANDS.get(cmd)
+        if not handler:
+            return {'error': f'Unknown command: {cmd}'}
+        return getattr(self, handler)(req)
+
+    def _cmd_ping(self, req):
+        return {'error': None, 'pid': os.getpid(), 'tunnels': sorted(self.tunnels)}
+
+    def _cmd_up(self, req):
+        profile = req.get('profile')
+        if not isinstance(profile, dict) or not profile.get('interface_name'):
+            return {'error': 'Missing profile'}
+        return {'error': self.add_tunnel(profile, req.get('sudo_pwd'))}
+
+    def _cmd_down(self, req):
+        if not self.remove_tunnel(req.get('interface_name')):
+            return {'error': 'Unknown tunnel'}
+        return {'error': None}
+
+    def _cmd_status(self, req):
+        stats = self.refresh_stats()
+        tunnels = {}
+        for name, tunnel in self.tunnels.items():
+            entry = dict(stats.get(name) or {'peers': []})
+            entry.update({
+                'profile_name': tunnel.profile.get('profile_name'),
+                'pid': tunnel.proc.pid,
+                'started': int(tunnel.started),
+                'recoveries': tunnel.watchdog.history[-10:],
+                'endpoints': {key: list(ips) for key, ips in tunnel.endpoints.items()},
+                'endpoint_race': tunnel.races,
+                'keepalive': self._keepalive_status(tunnel),
+            })
+            tunnels[name] = entry
+        return {'error': None, 'tunnels': tunnels, 'route_debounce': self.route_debouncer.stats()}
+
+    def _keepalive_status(self, tunnel):
+        import keepalive
+
+        found = {}
+        for peer in tunnel.profile.get('peers', []):
+            key = (peer.get('key') or '').strip()
+            if key in tunnel.keepalives:
+                found[key] = tunnel.keepalives[key].state()
+            elif key:
+                found[key] = {'interval': keepalive.peer_interval(peer), 'adaptive': False}
+        return found
+
+    def _cmd_reconfigure(self, req):
+        return {'error': self.reconfigure(req.get('interface_name'))}
+
+    def _cmd_reload_profile(self, req):
+        profile = req.get('profile')
+        if not isinstance(profile, dict) or not profile.get('interface_name'):
+            return {'error': 'Missing profile'}
+        tunnel = self.tunnels.get(profile['interface_name'])
+        if not tunnel:
+            return {'error': 'Unknown tunnel'}
+        # Fields the UI does not know about (routing table, hook policy)
+        # are kept from the running profile
+        import keepalive
+        import profile_model
+        import watchdog
+
+        try:
+            merged = tunnel.profile.replace(**profile)
+        except profile_model.ProfileError as e:
+            return {'error': str(e)}
+        tunnel.profile = merged
+        tunnel.watchdog.thresholds = watchdog.thresholds_from(merged)
+        tunnel.keepalives = keepalive.adaptive_peers(merged, tunnel.keepalives)
+        self.save_state()
+        return {'error': self.reconfigure(tunnel.interface_name)}
+
+    def _cmd_set_log_level(self, req):
+        import logging
+
+        level = str(req.get('level') or '').upper()
+        if not isinstance(logging.getLevelName(level), int):
+            return {'error': f'Bad log level: {level}'}
+        logging.getLogger().setLevel(level)
+        return {'error': None}
+
+    def _cmd_stop(self, req):
+        # The serve loop ends once no tunnel is left
+        for name in list(self.tunnels):
+            self.remove_tunnel(name)
+        return {'error': None}
+
+    def _serve_one(self):
+        import json
+
+        conn, _ = self.listener.accept()
+        try:
+            conn.settimeout(5.0)
+            data = b''
+            while not data.endswith(b'\n'):
+                chunk = conn.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+            try:
+                req = json.loads(data.decode() or '{}')
+                reply = self.handle(req if isinstance(req, dict) else {})
+            except Exception as e:
+                log.exception(e)
+                reply = {'error': str(e)}
+            conn.sendall(json.dumps(reply).encode() + b'\n')
+        except OSError as e:
+            log.warning('Control connection failed: %s', e)
+        finally:
+            conn.close()
+
+    def serve(self):
+        import select
+
+        next_poll = time.monotonic() + self.poll_interval
+        next_watchdog = time.monotonic() + self.watchdog_interval
+        while self.tunnels:
+            wake = min(next_poll, next_watchdog)
+            if self.route_debouncer.pending:
+                wake = min(wake, self.route_debouncer.deadline())
+            if self.races:
+                wake = min(wake, time.monotonic() + RACE_POLL_INTERVAL)
+            timeout = max(0.0, wake - time.monotonic())
+            readable, _, _ = select.select([self.listener], [], [], timeout)
+            if readable:
+                self._serve_one()
+            if self.races:
+                self.collect_races()
+            if time.monotonic() >= next_poll:
+                # One liveness check and one route check per interval,
+                # however many tunnels there are.
+                self.check_tunnels()
+                if self.tunnels:
+                    self.check_route()
+                # Follow a flapping route closely until it settles
+                interval = self.flap_poll_interval if self.route_debouncer.pending else self.poll_interval
+                next_poll = time.monotonic() + interval
+            if self.tunnels:
+                self.route_debouncer.run_pending()
+            if self.tunnels and time.monotonic() >= next_watchdog:
+                self.check_handshakes()
+                next_watchdog = time.monotonic() + self.watchdog_interval
+        self.close()
+
+    def close(self):
+        import daemon_client
+
+        for name in list(self.tunnels):
+            self.remove_tunnel(name)
+        if self._race_pool:
+            self._race_pool.shutdown(wait=False)
+            self._race_pool = None
+        self.races = {}
+        if self.listener:
+            self.listener.close()
+            self.listener = None
+            try:
+                os.unlink(daemon_client.SOCKET_PATH)
+            except OSError:
+                pass
+        try:
+            os.unlink(daemon_client.STATE_PATH)
+        except OSError:
+            pass
+
+
+def start_wireguard_go(interface_name, sudo_pwd, timeout=5.0):
+    """
+    Runs wireguard-go in the foreground as our child (through sudo, which
+    relays signals), and waits for its link to appear.
+    """
+    import subprocess
+    from vendor_paths import resolve_vendor_binary
+
     log.info('Bringing up %s', interface_name)
     p = subprocess.Popen(['/usr/bin/sudo', '-S', '-E',
-                          str(WG_PATH),
-                          interface_name],
-                         stdout=subprocess.PIPE,
-                         stderr=subprocess.PIPE,
+                          str(resolve_vendor_binary("wireguard")),
+                          '-f', interface_name],
+                         stdout=subprocess.DEVNULL,
+                         stderr=subprocess.DEVNULL,
                          stdin=subprocess.PIPE,
                          env={'WG_I_PREFER_BUGGY_USERSPACE_TO_POLISHED_KMOD': '1',
                               'WG_SUDO': '1',
                               },
                          start_new_session=True,
                       )
-    stdout, stderr = p.communicate(input=((sudo_pwd or "") + "\n").encode())
+    try:
+        p.stdin.write(((sudo_pwd or "") + "\n").encode())
+        p.stdin.close()
+    except OSError:
+        pass
+
+    link = os.path.join('/sys/class/net', interface_name)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if os.path.exists(link):
+            return p
+        if p.poll() is not None:
+            break
+        time.sleep(0.05)
+    log.error('Failed to execute wireguard for %s (exit %s)', interface_name, p.poll())
+    stop_process(p, sudo_pwd)
+    return None
+
+
+def stop_process(proc, sudo_pwd, timeout=3.0):
+    """
+    Stops a wireguard-go child. The child is a root owned sudo process, so
+    the signal goes through `sudo kill`; sudo relays it to wireguard-go.
+    """
+    import subprocess
+
+    if proc.poll() is not None:
+        return
+    try:
+        subprocess.run(['/usr/bin/sudo', '-S', 'kill', '-TERM', str(proc.pid)],
+                       input=((sudo_pwd or "") + "\n").encode(),
+                       stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL,
+                       check=False, timeout=timeout)
+        proc.wait(timeout)
+    except Exception as e:
+        log.warning('Failed to stop process %s: %s', proc.pid, e)
 
-    if p.returncode != 0:
-        log.error('Failed to execute wireguard')
-        log.error('stdout: %s', stdout)
-        log.error('stderr: %s', stderr)
-        return False
-    return True
 
 def daemonize():
     """
@@ -159,33 +877,64 @@ def daemonize():
     sys.stderr.flush()
 
 
-def _read_pwd_from_stdin():
+def _read_handoff():
+    """
+    The UI hands over everything the daemon needs as one JSON line on stdin:
+    {"sudo_pwd": ..., "profile": {... "private_key": ...}}.
+    """
+    import json
     try:
-        data = sys.stdin.readline()
+        data = json.loads(sys.stdin.readline() or "{}")
     except Exception:
-        return ""
-    return (data or "").rstrip("\n")
+        return None, ""
+    if not isinstance(data, dict) or not isinstance(data.get('profile'), dict):
+        return None, ""
+    return data['profile'], data.get('sudo_pwd') or ""
 
 
 if __name__ == '__main__':
+    import logging
+
     if len(sys.argv) < 2:
         sys.stderr.write("Missing profile name\n")
         sys.exit(2)
+    # Forked children get a new start time, so remember the exec time now
+    started = time.monotonic() - _process_age_ms() / 1000
     profile_name = sys.argv[1]
-    if len(sys.argv) >= 3:
-        sudo_pwd = sys.argv[2]
-    else:
-        sudo_pwd = _read_pwd_from_stdin()
-    logging.basicConfig(filename=str(LOG_DIR / 'daemon-{}.log'.format(profile_name)),
+    profile, sudo_pwd = _read_handoff()
+    if not profile:
+        sys.stderr.write("Missing profile on stdin\n")
+        sys.exit(2)
+    os.makedirs(LOG_DIR, mode=0o700, exist_ok=True)
+    logging.basicConfig(filename=os.path.join(LOG_DIR, 'daemon.log'),
                         level=logging.INFO,
                         format='%(asctime)s [%(levelname)s] %(name)s %(message)s')
     log = logging.getLogger()
-    log.info('Started daemon for profile: %s', profile_name)
+
+    import daemon_client
+    request = {'cmd': 'up', 'profile': profile, 'sudo_pwd': sudo_pwd}
+    try:
+        # A supervisor is already running: it takes the tunnel over
+        reply = daemon_client.request(request, timeout=30.0)
+        log.info('Handed %s to running supervisor: %s', profile_name, reply)
+        sys.exit(0)
+    except daemon_client.DaemonUnavailable:
+        pass
+
+    log.info('Started supervisor for profile: %s', profile_name)
     log.info('Daemonizing')
     daemonize()
     log.info('Successfully daemonized')
     try:
-        keep_tunnel(profile_name, sudo_pwd)
+        supervisor = Supervisor(sudo_pwd)
+        if not supervisor.listen():
+            reply = daemon_client.request(request, timeout=30.0)
+            log.info('Lost start-up race, handed %s over: %s', profile_name, reply)
+            sys.exit(0)
+        supervisor.add_tunnel(profile)
+        log.info('Supervisor ready (startup %d ms, max RSS %d KiB)',
+                 int((time.monotonic() - started) * 1000), _max_rss_kb())
+        supervisor.serve()
     except Exception as e:
         log.exception(e)
     log.info('Exiting')
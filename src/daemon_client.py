@@ -0,0 +1,90 @@
+import json
+import os
+import socket
+
+# Shared by the UI process and the tunnel supervisor (daemon.py), so this
+# module must stay cheap to import.
+APP_ID = 'wireguard.sysadmin'
+APP_HOME = os.environ.get("WIREGUARD_APP_HOME", "/home/phablet")
+LOG_DIR = os.path.join(APP_HOME, ".cache", APP_ID)
+SOCKET_PATH = os.path.join(LOG_DIR, 'daemon.sock')
+STATE_PATH = os.path.join(LOG_DIR, 'tunnels.json')
+
+
+class DaemonUnavailable(Exception):
+    pass
+
+
+def pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except (TypeError, ValueError, OSError):
+        return False
+    return True
+
+
+def read_state():
+    """
+    Returns the supervisor registry: {"pid": ..., "tunnels": {iface: {...}}}.
+    """
+    try:
+        with open(STATE_PATH) as fd:
+            state = json.load(fd)
+    except Exception:
+        return {}
+    if not isinstance(state, dict) or not isinstance(state.get('tunnels'), dict):
+        return {}
+    return state
+
+
+def running_tunnels(state=None):
+    """
+    Registry entries whose wireguard-go process is still alive. These are
+    also reported when the supervisor itself died and left them behind.
+    """
+    if state is None:
+        state = read_state()
+    return {name: t for name, t in state.get('tunnels', {}).items()
+            if isinstance(t, dict) and pid_alive(t.get('pid'))}
+
+
+def write_state(state):
+    tmp = STATE_PATH + '.tmp'
+    with open(tmp, 'w') as fd:
+        json.dump(state, fd, indent=4, sort_keys=True)
+    os.chmod(tmp, 0o600)
+    os.replace(tmp, STATE_PATH)
+
+
+def request(payload, timeout=5.0):
+    """
+    Sends one JSON request to the supervisor and returns its JSON reply.
+    Raises DaemonUnavailable when no supervisor is listening.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        try:
+            sock.connect(SOCKET_PATH)
+        except OSError as e:
+            raise DaemonUnavailable(str(e))
+        sock.sendall(json.dumps(payload).encode() + b'\n')
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            if chunk.endswith(b'\n'):
+                break
+    finally:
+        sock.close()
+    if not chunks:
+        raise DaemonUnavailable('empty reply')
+    return json.loads(b''.join(chunks).decode())
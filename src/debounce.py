@@ -0,0 +1,72 @@
+import threading
+import time
+
+
+class Debouncer:
+    """
+    Coalesces bursts of state changes: `action(state)` runs once the state
+    has been quiet for `window` seconds (or `max_delay` after the first
+    change of a burst), with the last state only. Runs never overlap, and a
+    burst that ends in the state applied last is dropped.
+    """
+
+    def __init__(self, action, window=1.0, max_delay=5.0, clock=time.monotonic):
+        self.action = action
+        self.window = window
+        self.max_delay = max_delay
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._pending = False
+        self._state = None
+        self._first = None
+        self._last = None
+        self.applied_state = None
+        self.events = 0
+        self.applied = 0
+        self.suppressed = 0
+
+    def event(self, state):
+        now = self.clock()
+        self.events += 1
+        if self._pending:
+            # The previous change of the burst will never be applied
+            self.suppressed += 1
+        else:
+            self._first = now
+        self._pending = True
+        self._state = state
+        self._last = now
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def deadline(self):
+        if not self._pending:
+            return None
+        return min(self._last + self.window, self._first + self.max_delay)
+
+    def run_pending(self):
+        """
+        Runs the action if a burst has settled. Returns True when it ran.
+        """
+        if not self._pending or self.clock() < self.deadline():
+            return False
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            state = self._state
+            self._pending = False
+            if state == self.applied_state:
+                self.suppressed += 1
+                return False
+            self.action(state)
+            self.applied_state = state
+            self.applied += 1
+            return True
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        return {'window': self.window, 'events': self.events, 'applied': self.applied,
+                'suppressed': self.suppressed, 'pending': self._pending}
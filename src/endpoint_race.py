@@ -0,0 +1,51 @@
+import time
+
+PROBE_TIMEOUT = 2.0
+
+
+def candidates(peer):
+    """
+    The peer's endpoint followed by its alternatives (`endpoints`, comma or
+    space separated), without duplicates.
+    """
+    raw = [peer.get('endpoint') or '']
+    raw += str(peer.get('endpoints') or '').replace(',', ' ').split()
+    found = []
+    for endpoint in raw:
+        endpoint = endpoint.strip()
+        if endpoint and endpoint not in found:
+            found.append(endpoint)
+    return found
+
+
+def fastest(rtts):
+    """
+    The endpoint with the lowest RTT, or None when no candidate answered.
+    """
+    answered = [(rtt, endpoint) for endpoint, rtt in rtts.items() if rtt is not None]
+    if not answered:
+        return None
+    return min(answered)[1]
+
+
+def race_handshakes(endpoints, attempt, timeout=PROBE_TIMEOUT, keep_first=False):
+    """
+    A peer has one endpoint at a time, so candidates get a fresh handshake
+    in turn: `attempt(endpoint, timeout)` returns True once it completed.
+    A candidate only gets as long as the best time so far, since a slower
+    one cannot win. With `keep_first` the first candidate (the endpoint in
+    use) wins as soon as it answers and the others are not tried. Returns
+    {endpoint: rtt ms or None}.
+    """
+    rtts = {}
+    budget = timeout
+    for i, endpoint in enumerate(endpoints):
+        started = time.monotonic()
+        ok = attempt(endpoint, budget)
+        rtt = (time.monotonic() - started) * 1000
+        rtts[endpoint] = round(rtt, 1) if ok else None
+        if ok:
+            if keep_first and i == 0:
+                break
+            budget = min(budget, rtt / 1000)
+    return rtts
@@ -0,0 +1,416 @@
+import collections
+import concurrent.futures
+import os
+import zipfile
+
+import conf_parser
+import profile_model
+import secrets_store
+import validation
+from profile import PROFILES_DIR
+
+WORKERS = min(4, os.cpu_count() or 1)
+# Never imported, kept from the stored profile on an in-place update
+HOOKS = ('pre_up', 'post_up', 'pre_down', 'post_down')
+# Progress events are sent to QML at most this often (files)
+PROGRESS_STEP = 10
+# run_many() parses and stores this many configs at a time
+BATCH = 200
+
+
+def _send(event, *args):
+    try:
+        import pyotherside
+    except ImportError:
+        return
+    pyotherside.send(event, *args)
+
+
+def _send_progress(done, total):
+    _send('importProgress', done, total)
+
+
+def _send_many_progress(files, configs):
+    _send('importManyProgress', files, configs)
+
+
+class ImportLimitError(ValueError):
+    pass
+
+
+# Caps for one import: bytes of one config, decompressed bytes of all
+# configs, number of configs and the compression ratio of a zip member.
+# WireGuard configs are a few hundred bytes and compress about 2:1.
+Limits = collections.namedtuple('Limits', 'member_bytes total_bytes members ratio')
+LIMITS = Limits(member_bytes=1 << 20, total_bytes=32 << 20, members=5000, ratio=100)
+CHUNK = 64 * 1024
+
+
+def _read_capped(f, limit, what):
+    chunks = []
+    size = 0
+    while True:
+        chunk = f.read(min(CHUNK, limit + 1 - size))
+        if not chunk:
+            return b''.join(chunks)
+        size += len(chunk)
+        if size > limit:
+            raise ImportLimitError(f'{what} is larger than {limit} bytes')
+        chunks.append(chunk)
+
+
+def _check_members(infos, limits):
+    # Sizes in the zip directory are checked before anything is read; reads
+    # are capped as well, since the directory can lie.
+    if len(infos) > limits.members:
+        raise ImportLimitError(f'Too many configs in zip: {len(infos)} (at most {limits.members})')
+    total = 0
+    for info in infos:
+        if info.file_size > limits.member_bytes:
+            raise ImportLimitError(f'{info.filename} is larger than {limits.member_bytes} bytes')
+        if info.file_size > limits.ratio * max(info.compress_size, 1):
+            raise ImportLimitError(f'{info.filename}: compression ratio over {limits.ratio}')
+        total += info.file_size
+    if total > limits.total_bytes:
+        raise ImportLimitError(f'Configs in zip are larger than {limits.total_bytes} bytes')
+
+
+def read_sources(path, limits=LIMITS):
+    """
+    Yields (source name, config text) for every .conf of a zip, or for the
+    file itself. Zip members are streamed one at a time within `limits`;
+    ImportLimitError is raised before the first member is read when the zip
+    directory is over them, or as soon as a read goes over.
+    """
+    if not path.endswith('.zip'):
+        with open(path, 'rb') as f:
+            yield os.path.basename(path), _read_capped(f, limits.member_bytes, path).decode('utf-8', errors='ignore')
+        return
+    with zipfile.ZipFile(path) as z:
+        infos = [info for info in z.infolist() if not info.is_dir() and info.filename.endswith('.conf')]
+        _check_members(infos, limits)
+        left = limits.total_bytes
+        for info in infos:
+            with z.open(info) as f:
+                data = _read_capped(f, min(limits.member_bytes, left), info.filename)
+            left -= len(data)
+            yield info.filename, data.decode('utf-8', errors='ignore')
+
+
+def parse_source(vpn, source, text):
+    """
+    Parse and validate stage: returns an entry dict with the profile fields,
+    or with `error` set. Runs in the worker pool, so it must not touch the
+    file system or the key store.
+    """
+    default_name = os.path.splitext(os.path.basename(source))[0] or 'imported'
+    entry = {'source': source, 'profile_name': None, 'error': None, 'errors': [], 'warnings': []}
+    try:
+        fields, diagnostics = vpn.parse_conf(text.splitlines(), default_name)
+    except Exception as e:
+        entry['error'] = f'Parse error: {e}'
+        entry['errors'].append(entry['error'])
+        return entry
+    for diagnostic in diagnostics:
+        message = conf_parser.format_diagnostic(diagnostic)
+        if diagnostic.severity == 'error':
+            entry['errors'].append(message)
+            entry['error'] = entry['error'] or message
+        else:
+            entry['warnings'].append(message)
+    if entry['error']:
+        return entry
+    ip_address = fields['ip_address']
+    if not ip_address.strip():
+        entry['error'] = 'Missing Address in [Interface]'
+        entry['errors'].append(entry['error'])
+        return entry
+    # All problems at once, so a file needs one round of fixes
+    entry['errors'] = [error.message for error in validation.check_profile(fields)]
+    if entry['errors']:
+        entry['error'] = entry['errors'][0]
+        return entry
+    validation.normalize_peers(fields['peers'])
+    private_key = fields['private_key'].strip()
+    mtu = fields['mtu']
+    peers = fields['peers']
+    entry.update({
+        'wanted_name': fields['profile_name'],
+        'wanted_interface': fields['interface_name'],
+        'private_key': private_key,
+        # Hooks are never imported, for safety
+        'profile': {
+            'peers': peers,
+            'ip_address': ip_address.strip(),
+            'dns_servers': fields['dns_servers'],
+            'extra_routes': fields['extra_routes'],
+            'pre_up': '',
+            'post_up': '',
+            'pre_down': '',
+            'post_down': '',
+        },
+    })
+    if mtu:
+        entry['profile']['mtu'] = mtu
+    if fields['kind'] == profile_model.SERVER:
+        entry['profile']['kind'] = fields['kind']
+    if fields['listen_port']:
+        entry['profile']['listen_port'] = int(fields['listen_port'])
+    if fields['wg_quick']:
+        entry['profile']['wg_quick'] = fields['wg_quick']
+    return entry
+
+
+def allocate(vpn, entry, used_names, used_ifaces):
+    """
+    Gives a parsed entry a free profile name and interface name, checked
+    against in-memory sets that are updated as names are taken.
+    """
+    original = entry['wanted_name']
+    name = original
+    suffix = 1
+    while name in used_names:
+        name = f'{original}_{suffix}'
+        suffix += 1
+    iface = vpn._unique_interface_name(entry['wanted_interface'] or f'wg_{name}', used_ifaces)
+    used_names.add(name)
+    used_ifaces.add(iface)
+    entry['profile_name'] = name
+    entry['profile'].update({'profile_name': name, 'interface_name': iface})
+
+
+def _existing_names():
+    try:
+        return {p.name for p in PROFILES_DIR.iterdir()}
+    except FileNotFoundError:
+        return set()
+
+
+def stored_hashes():
+    """
+    Content hash index of the store: {content hash: [profile dir names]}.
+    Profiles are read through the profile_model cache, so repeated imports
+    only parse files that changed.
+    """
+    index = {}
+    for path in sorted(PROFILES_DIR.glob('*/profile.json')):
+        try:
+            profile = profile_model.load(path)
+        except (OSError, ValueError):
+            continue
+        index.setdefault(profile.get('content_hash') or profile.content_hash, []).append(path.parent.name)
+    return index
+
+
+def dedupe(vpn, entries):
+    """
+    Matches parsed entries against the store by content hash and private
+    key. The same config and key as a stored profile (or an earlier entry)
+    is "present" and nothing is written. A stored profile of the wanted name
+    with the same key but another config is "updated" in place, keeping its
+    name, interface and hooks; if that profile cannot be read the entry is
+    left new. Stored keys are read with one privileged call. Returns the
+    [(profile_name, profile, None)] writes of the updates.
+    """
+    index = stored_hashes()
+    candidates = set()
+    for entry in entries:
+        entry['content_hash'] = profile_model.Profile(entry['profile']).content_hash
+        candidates.update(index.get(entry['content_hash'], ()))
+        if (PROFILES_DIR / entry['wanted_name'] / 'profile.json').exists():
+            candidates.add(entry['wanted_name'])
+    # Without the stored keys nothing can be matched: everything is new
+    keys = secrets_store.get_private_keys(sorted(candidates), vpn._sudo_pwd)[0] if candidates else {}
+
+    seen = {}
+    updated = set()
+    updates = []
+    for entry in entries:
+        identity = (entry['content_hash'], entry['private_key'])
+        if identity in seen:
+            entry['status'] = 'present'
+            entry['duplicate_of'] = seen[identity]
+            continue
+        seen[identity] = entry
+        name = next((name for name in index.get(entry['content_hash'], ())
+                     if keys.get(name) == entry['private_key']), None)
+        if name:
+            entry['status'] = 'present'
+            entry['profile_name'] = name
+            continue
+        name = entry['wanted_name']
+        if keys.get(name) == entry['private_key'] and name not in updated:
+            try:
+                stored = profile_model.load(PROFILES_DIR / name / 'profile.json')
+            except (OSError, ValueError):
+                # Unreadable or invalid: leave it alone and import the entry as new
+                continue
+            updated.add(name)
+            data = dict(stored.to_dict())
+            for field in ('mtu', 'wg_quick', 'kind', 'listen_port'):
+                data.pop(field, None)
+            data.update((field, value) for field, value in entry['profile'].items() if field not in HOOKS)
+            entry['status'] = 'updated'
+            entry['profile_name'] = name
+            updates.append((name, data, None))
+    return updates
+
+
+def commit(vpn, entries, used_ifaces):
+    """
+    Stores the parsed `entries` (see parse_source()): configs that are
+    already stored are reported instead of saved again (see dedupe()), the
+    others get free names and are written with one key write; their
+    interfaces are added to `used_ifaces`. Returns {"error", "profiles",
+    "present", "results"}; results are in input order.
+    """
+    good = [entry for entry in entries if not entry['error']]
+    updates = dedupe(vpn, good)
+    new = [entry for entry in good if not entry['error'] and 'status' not in entry]
+    used_names = _existing_names()
+    for entry in new:
+        allocate(vpn, entry, used_names, used_ifaces)
+        entry['status'] = 'imported'
+    writes = updates + [(entry['profile_name'], entry['profile'], entry['private_key']) for entry in new]
+    error = vpn._commit_profiles(writes) if writes else None
+    if error:
+        for entry in good:
+            if entry.get('status') in ('imported', 'updated'):
+                entry['error'] = error
+                entry['status'] = None
+                entry['profile_name'] = None
+    for entry in good:
+        first = entry.get('duplicate_of')
+        if first is not None:
+            entry['profile_name'] = first['profile_name']
+            if first['error']:
+                entry['error'] = first['error']
+                entry['status'] = None
+
+    results = [{'source': entry['source'], 'profile_name': entry['profile_name'], 'status': entry.get('status'),
+                'error': entry['error'], 'errors': entry['errors'], 'warnings': entry['warnings']}
+               for entry in entries]
+    return _report(results)
+
+
+def _report(results, items=None):
+    # The import result: profiles written, configs already present, and the
+    # first failure as `error` when nothing was imported at all.
+    profiles = [result['profile_name'] for result in results if result['status'] in ('imported', 'updated')]
+    present = [result['profile_name'] for result in results if result['status'] == 'present']
+    failed = [(result['source'], result['error']) for result in results if result['error']]
+    unread = [(item['path'], item['error']) for item in items or () if item['error']]
+    res = {'error': None, 'profiles': profiles, 'present': present, 'results': results}
+    if items is not None:
+        res['items'] = items
+    if not profiles and not present:
+        source, error = (failed + unread)[0]
+        res['error'] = error if len(failed + unread) == 1 and len(results) <= 1 else f'{source}: {error}'
+        return res
+    warnings = []
+    if failed:
+        warnings.append(f"Skipped {len(failed)} of {len(results)} configs")
+    if unread:
+        warnings.append(f"{len(unread)} files could not be read")
+    if warnings:
+        res['warning'] = '; '.join(warnings)
+    return res
+
+
+def run(vpn, path, used_ifaces, progress=_send_progress, workers=WORKERS, limits=LIMITS):
+    """
+    Imports every config of `path` (a .conf or a zip of them). Bad files are
+    reported per file and do not stop the others; an archive over `limits`
+    is rejected as a whole before anything is stored. See commit() for the
+    result.
+    """
+    entries = []
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(parse_source, vpn, source, text) for source, text in read_sources(path, limits)]
+            total = len(futures)
+            for done, future in enumerate(futures, 1):
+                entries.append(future.result())
+                if progress and (done % PROGRESS_STEP == 0 or done == total):
+                    progress(done, total)
+    except ImportLimitError as e:
+        return {'error': str(e), 'profiles': [], 'present': [], 'results': []}
+    if not entries:
+        return {'error': 'No .conf in zip', 'profiles': [], 'present': [], 'results': []}
+    return commit(vpn, entries, used_ifaces)
+
+
+def walk(paths):
+    """
+    Lazily yields every file to import from `paths`: files as given, .conf
+    and .zip files under directories recursively, in name order.
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith(('.conf', '.zip')):
+                    yield os.path.join(root, name)
+
+
+def _submit_file(pool, vpn, path, item, limits):
+    # Parse jobs for every config of one file; a file is imported whole or
+    # not at all, so a read error drops the jobs already submitted.
+    futures = []
+    try:
+        for source, text in read_sources(path, limits):
+            source = os.path.join(path, source) if path.endswith('.zip') else path
+            futures.append(pool.submit(parse_source, vpn, source, text))
+    except FileNotFoundError:
+        item['error'] = 'File not found'
+    except zipfile.BadZipFile:
+        item['error'] = 'Bad zip file'
+    except (ImportLimitError, OSError) as e:
+        item['error'] = str(e)
+    else:
+        if not futures:
+            item['error'] = 'No .conf in zip'
+    if item['error']:
+        for future in futures:
+            future.cancel()
+        return []
+    item['configs'] = len(futures)
+    return futures
+
+
+def run_many(vpn, paths, used_ifaces, progress=_send_many_progress, workers=WORKERS, limits=LIMITS,
+             batch=BATCH):
+    """
+    Imports files, zips and directories of them. Files are read lazily and
+    their configs parsed and stored `batch` at a time, so memory stays flat
+    for large migrations. A file that cannot be read (missing, bad zip, over
+    `limits`) is reported in `items` and the others go on. Returns the
+    commit() result over all configs plus `items`: one {"path", "error",
+    "configs"} per file.
+    """
+    items = []
+    results = []
+    pending = []
+
+    def flush():
+        entries = [future.result() for future in pending]
+        pending.clear()
+        if entries:
+            results.extend(commit(vpn, entries, used_ifaces)['results'])
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        for path in walk(paths):
+            item = {'path': path, 'error': None, 'configs': 0}
+            items.append(item)
+            pending.extend(_submit_file(pool, vpn, path, item, limits))
+            if len(pending) >= batch:
+                flush()
+            if progress:
+                progress(len(items), len(results) + len(pending))
+        flush()
+    if not items:
+        return {'error': 'No .conf or .zip found', 'profiles': [], 'present': [], 'results': [], 'items': []}
+    return _report(results, items)
@@ -5,14 +5,23 @@ import socket
 import json
 import re
 import tempfile
+import threading
 import shlex
 import shutil
+import time
 
 from pathlib import Path
 
 from vendor_paths import resolve_vendor_binary
-from profile import PROFILES_DIR
+from profile import CONFIG_DIR, PROFILES_DIR
 from wg_config import build_config
+import policy_routing
+import capabilities
+import daemon_client
+import uapi
+import resolver
+import pmtu
+import profile_model
 
 WG_PATH = resolve_vendor_binary("wg")
 WIREGUARD_GO_PATH = resolve_vendor_binary("wireguard")
@@ -29,6 +38,28 @@ SAFE_PREUP_ALLOWED = {
 }
 SAFE_PREUP_BLOCK_CHARS = set("|&><`$(){}[]")
 
+# Physical gateway and device under each tunnel, recorded at bring-up: a full
+# tunnel replaces the default route, so they can't be read back later.
+UNDERLAY_FILE = CONFIG_DIR / 'underlay.json'
+
+
+def _load_underlay():
+    try:
+        data = json.loads(UNDERLAY_FILE.read_text())
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _save_underlay(data):
+    try:
+        UNDERLAY_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = UNDERLAY_FILE.with_suffix('.tmp')
+        tmp.write_text(json.dumps(data))
+        os.replace(tmp, UNDERLAY_FILE)
+    except OSError as e:
+        log.warning('Failed to save underlay routes: %s', e)
+
 def _resolve_preup_binary(name):
     if not name:
         return None
@@ -67,6 +98,52 @@ def _validate_preup_command(cmd, hook_name="PreUp"):
     args[0] = resolved
     return args, None
 
+
+def parse_wg_dump(data):
+    """
+    Parses `wg show all dump` lines into {iface: {'my_privkey', 'peers'}}.
+    """
+    last_interface = None
+    interface_status = {}
+    status_by_interface = {}
+
+    for line in data:
+        parts = line.split('\t')
+        iface = parts[0]
+
+        if iface != last_interface and interface_status:
+            status_by_interface[last_interface] = interface_status
+            interface_status = {}
+
+        if len(parts) == 5:
+            iface, private_key, public_key, listen_port, fwmark = parts
+            interface_status = {
+                'my_privkey': private_key,
+                'peers': []
+            }
+            last_interface = iface
+
+        elif len(parts) == 9:
+            iface, public_key, preshared_key, endpoint, allowed_ips, latest_handshake, transfer_rx, transfer_tx, persistent_keepalive = parts
+            peer_data = {
+                'public_key': public_key,
+                'rx': int(transfer_rx),
+                'tx': int(transfer_tx),
+                'latest_handshake': int(latest_handshake),
+                'up': int(latest_handshake) > 0,
+            }
+            interface_status.setdefault('peers', []).append(peer_data)
+            interface_status['peers'].sort(key=lambda x: not x['up'])
+
+        else:
+            raise ValueError(f"Can't parse line: {line}")
+
+    if last_interface:
+        status_by_interface[last_interface] = interface_status
+
+    return status_by_interface
+
+
 class Interface:
     def __init__(self, sudo_pwd):
         # Sudo password is kept in-memory and passed via stdin (no argv leaks).
@@ -94,28 +171,26 @@ class Interface:
             return endpoint.rsplit(':', 1)[0]
         return endpoint
 
-    def _resolve_endpoint_ips(self, endpoint):
+    def _resolve_endpoint_ips(self, endpoint, refresh=False):
+        """
+        Addresses of the endpoint's host. Routes that are being installed
+        pass `refresh`: the shared cache may predate a DDNS change, while
+        removals want the answer the route was installed with.
+        """
         host = self._parse_endpoint_host(endpoint)
         if not host:
             return []
-        try:
-            infos = socket.getaddrinfo(host, None)
-        except Exception:
-            return []
-        ips = []
-        for info in infos:
-            ip = info[4][0]
-            if ip not in ips:
-                ips.append(ip)
-        return ips
+        return resolver.default.resolve(host, refresh=refresh)
 
     def _connect(self, profile, config_file, use_kmod):
-        interface_name = profile['interface_name']
+        profile = profile_model.Profile.coerce(profile)
+        interface_name = profile.interface_name
+        multi_tunnel = bool(profile.routing_table)
         if self.interface_exists(interface_name):
             self.disconnect(interface_name)
 
         if use_kmod:
-            if self.userspace_running():
+            if not multi_tunnel and self.userspace_running():
                 self.stop_userspace_daemons()
             subprocess.run(self._sudo_cmd() + ['ip', 'link', 'add', interface_name, 'type', 'wireguard'],
                            input=self._sudo_input(),
@@ -128,16 +203,19 @@ class Interface:
                     pass
                 return err
         else:
-            if self.userspace_running():
+            if not multi_tunnel and self.userspace_running():
                 self.stop_userspace_daemons()
             err = self.check_userspace_binary()
             if err:
                 return err
-            self.start_daemon(profile, config_file)
+            return self.start_daemon(profile, config_file)
 
         return None
 
-    def check_userspace_binary(self):
+    def check_userspace_binary(self, refresh=False):
+        return capabilities.cached('userspace_binary', self._probe_userspace_binary, refresh) or None
+
+    def _probe_userspace_binary(self):
         try:
             p = subprocess.run(
                 [str(WIREGUARD_GO_PATH)],
@@ -153,10 +231,22 @@ class Interface:
         stderr = p.stderr.decode(errors='ignore')
         if "GLIBC_" in stderr or "not found" in stderr:
             return "Userspace binary incompatible: " + stderr.strip()
-        return None
+        return ""
 
 
     def start_daemon(self, profile, config_file):
+        # The daemon gets the resolved profile (with its key) over stdin so it
+        # never has to touch the profile store or the key store itself.
+        profile = profile_model.plain(profile)
+        request = {'cmd': 'up', 'sudo_pwd': self._sudo_pwd or "", 'profile': profile}
+        try:
+            # Hand the tunnel to the running supervisor instead of starting
+            # another Python process for it.
+            reply = daemon_client.request(request, timeout=30.0)
+            return reply.get('error')
+        except daemon_client.DaemonUnavailable:
+            pass
+        handoff = json.dumps({'sudo_pwd': request['sudo_pwd'], 'profile': profile})
         p = subprocess.Popen(['/usr/bin/python3', 'src/daemon.py', profile['profile_name']],
                              stdout=subprocess.PIPE,
                              stderr=subprocess.PIPE,
@@ -165,33 +255,37 @@ class Interface:
                             )
         try:
             if p.stdin:
-                p.stdin.write((self._sudo_pwd or "") .encode() + b"\n")
+                p.stdin.write(handoff.encode() + b"\n")
                 p.stdin.flush()
         finally:
             if p.stdin:
                 p.stdin.close()
         print('started daemon')
+        return None
 
     def userspace_running(self):
         try:
-            p = subprocess.run(
-                ['pgrep', '-f', str(WIREGUARD_GO_PATH)],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                check=False,
-            )
-            return p.returncode == 0
-        except FileNotFoundError:
-            p = subprocess.run(
-                ['ps', '-eo', 'cmd'],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                check=False,
-            )
-            if p.returncode != 0:
-                return False
-            haystack = p.stdout.decode(errors='ignore')
-            return str(WIREGUARD_GO_PATH) in haystack
+            reply = daemon_client.request({'cmd': 'ping'}, timeout=2.0)
+            return bool(reply.get('tunnels'))
+        except (daemon_client.DaemonUnavailable, ValueError):
+            # No supervisor: only tunnels it left behind can still be running
+            return bool(daemon_client.running_tunnels())
+
+    def reload_userspace_profile(self, profile):
+        """
+        Pushes an edited profile to the supervisor, which reconfigures the
+        running tunnel without restarting wireguard-go.
+        """
+        try:
+            return daemon_client.request({'cmd': 'reload-profile', 'profile': profile}, timeout=30.0).get('error')
+        except (daemon_client.DaemonUnavailable, ValueError) as e:
+            return f'Tunnel daemon not running: {e}'
+
+    def set_daemon_log_level(self, level):
+        try:
+            return daemon_client.request({'cmd': 'set-log-level', 'level': level}).get('error')
+        except (daemon_client.DaemonUnavailable, ValueError) as e:
+            return f'Tunnel daemon not running: {e}'
 
     def interface_exists(self, interface_name):
         try:
@@ -205,10 +299,17 @@ class Interface:
             return False
 
     def stop_userspace_daemons(self):
-        if not self.userspace_running():
+        try:
+            daemon_client.request({'cmd': 'stop'}, timeout=15.0)
+        except (daemon_client.DaemonUnavailable, ValueError, OSError):
+            pass
+        # Tunnels left behind by a dead supervisor: the registry holds the
+        # sudo pid of each wireguard-go and sudo relays the signal.
+        pids = [str(t['pid']) for t in daemon_client.running_tunnels().values()]
+        if not pids:
             return
         subprocess.run(
-            self._sudo_cmd() + ['pkill', '-f', str(WIREGUARD_GO_PATH)],
+            self._sudo_cmd() + ['kill', '-TERM'] + pids,
             input=self._sudo_input(),
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
@@ -226,6 +327,7 @@ class Interface:
             output = subprocess.check_output(cmd).decode(errors='ignore').splitlines()
         except Exception:
             return None, None
+        tunnels = None
         for line in output:
             parts = line.split()
             if not parts:
@@ -242,6 +344,12 @@ class Interface:
                     dev = parts[parts.index('dev') + 1]
                 except Exception:
                     dev = None
+            if dev:
+                # The default route of a full tunnel is not the way out
+                if tunnels is None:
+                    tunnels = set(self.list_wireguard_interfaces()) | set(_load_underlay())
+                if dev in tunnels:
+                    continue
             return gw, dev
         return None, None
 
@@ -261,6 +369,40 @@ class Interface:
         _, dev = self._get_default_route(socket.AF_INET6)
         return dev
 
+    def underlay(self, interface_name=None):
+        """
+        (gateway, device, gateway_v6, device_v6) of the physical network.
+        A family whose default route currently goes into a tunnel falls back
+        to what was recorded when interface_name (or any tunnel) came up.
+        """
+        gw, dev = self._get_default_route(socket.AF_INET)
+        gw6, dev6 = self._get_default_route(socket.AF_INET6)
+        if dev and dev6:
+            return gw, dev, gw6, dev6
+        recorded = _load_underlay()
+        saved = recorded.get(interface_name) if interface_name else None
+        if not saved and not interface_name and recorded:
+            saved = next(iter(recorded.values()))
+        if isinstance(saved, list) and len(saved) == 4:
+            if not dev:
+                gw, dev = saved[0], saved[1]
+            if not dev6:
+                gw6, dev6 = saved[2], saved[3]
+        return gw, dev, gw6, dev6
+
+    def _record_underlay(self, interface_name, underlay):
+        data = _load_underlay()
+        if underlay[1] or underlay[3]:
+            data[interface_name] = list(underlay)
+        else:
+            data.pop(interface_name, None)
+        _save_underlay(data)
+
+    def _forget_underlay(self, interface_name):
+        data = _load_underlay()
+        if data.pop(interface_name, None) is not None:
+            _save_underlay(data)
+
     def list_wireguard_interfaces(self):
         try:
             p = subprocess.run(
@@ -295,32 +437,20 @@ class Interface:
         return ifaces
 
 
-    def config_interface(self, profile, config_file):
-        interface_name = profile['interface_name']
-        log.info('Configuring interface %s', interface_name)
-
-        def sudo_run(cmd, check=True):
-            return subprocess.run(
-                self._sudo_cmd() + cmd,
-                input=self._sudo_input(),
-                check=check
-            )
-
-        # Remove default routes before changes
-        default_gw = self.get_default_gateway()
-        real_iface = self.get_default_interface()
-        default_gw_v6 = self.get_default_gateway_v6()
-        real_iface_v6 = self.get_default_interface_v6()
-
-        # 1. interface down
-        sudo_run(['ip', 'link', 'set', 'down', 'dev', interface_name], check=False)
-
-        # 2. setconf (use temp config to avoid writing secrets to disk)
+    def _setconf(self, interface_name, profile, config_file):
         private_key = (profile.get('private_key') or "").strip()
         if not private_key:
             err = f'Private key not found for {profile.get("profile_name", interface_name)}'
             log.error(err)
             return err
+        if uapi.available(interface_name, self._sudo_pwd):
+            # Userspace backend: one UAPI transaction instead of `wg setconf`
+            try:
+                uapi.configure(interface_name, profile, private_key, sudo_pwd=self._sudo_pwd)
+                return None
+            except (uapi.UapiError, OSError, ValueError) as e:
+                log.error('UAPI configuration of %s failed: %s', interface_name, e)
+                return str(e)
         config_text = build_config(profile, private_key)
         tmp_path = None
         try:
@@ -349,16 +479,128 @@ class Interface:
                     os.remove(tmp_path)
                 except Exception:
                     pass
+        return None
+
+    def _ip_batch(self, commands, config_file=None):
+        """
+        Runs `ip` commands (argument lists without the leading "ip") with a
+        single `ip -force -batch` under sudo; a failing line does not stop
+        the others. The batch is passed as a temp file, stdin carries the
+        sudo password. Address families follow from the prefixes.
+        """
+        if not commands:
+            return None
+        tmp_path = None
+        try:
+            tmp_dir = Path(config_file).parent if config_file else None
+            with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.ip',
+                                             dir=str(tmp_dir) if tmp_dir else None) as tf:
+                tf.write(''.join(' '.join(cmd) + '\n' for cmd in commands))
+                tmp_path = tf.name
+            res = subprocess.run(self._sudo_cmd() + ['ip', '-force', '-batch', tmp_path],
+                                 input=self._sudo_input(),
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE,
+                                 check=False)
+            if res.returncode != 0:
+                err = (res.stderr or b'').decode(errors='ignore').strip()
+                log.warning('ip batch of %d commands: %s', len(commands), err)
+                return err or 'ip batch failed'
+        finally:
+            if tmp_path:
+                try:
+                    os.remove(tmp_path)
+                except Exception:
+                    pass
+        return None
+
+    def _profile_mtu(self, profile, dev, gateway):
+        """
+        The profile's MTU: a number, or for "auto" the tunnel MTU cached for
+        the path to the first endpoint on this network. None keeps the link
+        default; an "auto" MTU that is not cached yet is probed once the
+        link is up (see _probe_mtu_later()).
+        """
+        if profile.mtu.isdigit():
+            return int(profile.mtu)
+        target = self._mtu_target(profile, dev)
+        return pmtu.cached_tunnel_mtu(target, dev, gateway)[1] if target else None
+
+    def _mtu_target(self, profile, dev):
+        """The endpoint address to probe for an "auto" MTU, or None."""
+        if profile.mtu != 'auto' or not dev or not profile.first_endpoint:
+            return None
+        ips = self._resolve_endpoint_ips(profile.first_endpoint)
+        return ips[0] if ips else None
+
+    def _probe_mtu_later(self, profile, dev, gateway):
+        """
+        Probes the path MTU of an "auto" profile that has no cached value for
+        this network in a background thread, and sets the result on the link
+        while it still exists. The pings can take seconds when ICMP is
+        filtered, so they must not hold up the connect. Returns the thread,
+        or None when there is nothing to probe.
+        """
+        target = self._mtu_target(profile, dev)
+        if not target or pmtu.cached_tunnel_mtu(target, dev, gateway)[0]:
+            return None
+        interface_name = profile.interface_name
+
+        def probe():
+            mtu = pmtu.tunnel_mtu(target, dev, gateway)
+            if not mtu or not self.interface_exists(interface_name):
+                return
+            subprocess.run(
+                self._sudo_cmd() + ['ip', 'link', 'set', 'dev', interface_name, 'mtu', str(mtu)],
+                input=self._sudo_input(),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                check=False
+            )
+            log.info('Probed MTU %s set on %s', mtu, interface_name)
+
+        thread = threading.Thread(target=probe, name=f'pmtu-{interface_name}', daemon=True)
+        thread.start()
+        return thread
+
+    def config_interface(self, profile, config_file):
+        profile = profile_model.Profile.coerce(profile)
+        interface_name = profile.interface_name
+        log.info('Configuring interface %s', interface_name)
+
+        def sudo_run(cmd, check=True):
+            return subprocess.run(
+                self._sudo_cmd() + cmd,
+                input=self._sudo_input(),
+                check=check
+            )
+
+        # Remove default routes before changes
+        underlay = self.underlay(interface_name)
+        default_gw, real_iface, default_gw_v6, real_iface_v6 = underlay
+        self._record_underlay(interface_name, underlay)
+
+        # 1. interface down
+        sudo_run(['ip', 'link', 'set', 'down', 'dev', interface_name], check=False)
+
+        # 2. setconf (use temp config to avoid writing secrets to disk)
+        err = self._setconf(interface_name, profile, config_file)
+        if err:
+            return err
+
+        # 2b. MTU (fixed, or cached for the current network with "auto")
+        mtu = self._profile_mtu(profile, real_iface, default_gw)
+        if mtu:
+            sudo_run(['ip', 'link', 'set', 'dev', interface_name, 'mtu', str(mtu)], check=False)
+            log.info('MTU %s set on %s', mtu, interface_name)
 
         # 3. address
-        ip_raw = profile.get('ip_address', '').strip()
-        if not ip_raw:
+        addr_list = profile.address_list
+        if not addr_list:
             err = f'No IP address configured for {profile.get("name", interface_name)}'
             log.error(err)
             return err
 
-        addr_list = [a for a in re.split(r'[\\s,]+', ip_raw) if a]
-
         # Replace the first address, add the rest (so multi-IP configs work)
         sudo_run(['ip', 'address', 'replace', addr_list[0], 'dev', interface_name])
         for extra_addr in addr_list[1:]:
@@ -390,15 +632,17 @@ class Interface:
 
         # ---------- ROUTING ----------
 
-        # 5. endpoint exclusion
-        endpoint = None
-        for peer in profile.get('peers', []):
-            if peer.get('endpoint'):
-                endpoint = peer['endpoint']
-                break
+        # Multi-tunnel mode: routes live in the profile's own table and are
+        # selected by `ip rule`; the fwmark keeps our own packets out of it.
+        table = profile.routing_table
+        table_args = ['table', str(table)] if table else []
+        if table:
+            self._clear_policy_rules(table)
 
-        if endpoint:
-            endpoint_ips = self._resolve_endpoint_ips(endpoint)
+        # 5. endpoint exclusion
+        endpoint = profile.first_endpoint
+        if endpoint and not table:
+            endpoint_ips = self._resolve_endpoint_ips(endpoint, refresh=True)
             if not endpoint_ips:
                 log.warning('Failed to resolve endpoint: %s', endpoint)
             for endpoint_ip in endpoint_ips:
@@ -424,39 +668,34 @@ class Interface:
                 except Exception as e:
                     log.warning('Failed to add endpoint route: %s', e)
 
-        # 6. AllowedIPs
-        add_default_v4 = False
-        add_default_v6 = False
-        for peer in profile.get('peers', []):
-            for prefix in peer.get('allowed_prefixes', '').split(','):
-                prefix = prefix.strip()
-                if not prefix:
-                    continue
-                if prefix == '0.0.0.0/0':
-                    add_default_v4 = True
-                    continue
-                if prefix == '::/0':
-                    add_default_v6 = True
-                    continue
-                if ':' in prefix:
-                    sudo_run(['ip', '-6', 'route', 'replace', prefix, 'dev', interface_name], check=False)
-                else:
-                    sudo_run(['ip', 'route', 'replace', prefix, 'dev', interface_name], check=False)
+        # 6. AllowedIPs (extra routes follow after DNS), one sudo call for
+        # all of them: a server has a route per peer
+        prefixes, add_default_v4, add_default_v6 = profile.routes()
+        extra_routes = {str(net) for net in profile.extra_routes}
+        self._ip_batch([['route', 'replace', prefix, 'dev', interface_name] + table_args
+                        for prefix in prefixes if prefix not in extra_routes], config_file)
 
         # 7. default route via wg
         if add_default_v4:
-            sudo_run(['ip', 'route', 'replace', 'default', 'dev', interface_name], check=False)
+            sudo_run(['ip', 'route', 'replace', 'default', 'dev', interface_name] + table_args, check=False)
             log.info('Default IPv4 route via %s enabled', interface_name)
         if add_default_v6:
-            sudo_run(['ip', '-6', 'route', 'replace', 'default', 'dev', interface_name], check=False)
+            sudo_run(['ip', '-6', 'route', 'replace', 'default', 'dev', interface_name] + table_args, check=False)
             log.info('Default IPv6 route via %s enabled', interface_name)
 
+        # An "auto" MTU seen for the first time on this network is probed
+        # now that the endpoint route is in place, without waiting for it
+        self._probe_mtu_later(profile, real_iface, default_gw)
+
         # ---------- DNS ----------
-        dns_servers = [dns.strip() for dns in profile.get('dns_servers', '').split(',') if dns.strip()]
+        dns_servers = list(profile.dns)
         if dns_servers:
-            if Path('/usr/bin/resolvectl').exists():
+            if capabilities.resolvectl_path():
                 res = sudo_run(['resolvectl', 'dns', interface_name] + dns_servers, check=False)
-                res2 = sudo_run(['resolvectl', 'domain', interface_name, '~.'], check=False)
+                res2 = res
+                # A split tunnel next to other tunnels must not take over all lookups
+                if not table or add_default_v4 or add_default_v6:
+                    res2 = sudo_run(['resolvectl', 'domain', interface_name, '~.'], check=False)
                 if res.returncode != 0 or res2.returncode != 0:
                     log.warning('resolvectl failed for %s', interface_name)
                 else:
@@ -465,14 +704,13 @@ class Interface:
                 log.warning('resolvectl not found; skipping DNS setup for %s', interface_name)
 
         # ---------- EXTRA ROUTES ----------
-        for extra_route in profile.get('extra_routes', '').split(','):
-            extra_route = extra_route.strip()
-            if not extra_route:
-                continue
-            if ':' in extra_route:
-                sudo_run(['ip', '-6', 'route', 'replace', extra_route, 'dev', interface_name], check=False)
-            else:
-                sudo_run(['ip', 'route', 'replace', extra_route, 'dev', interface_name], check=False)
+        self._ip_batch([['route', 'replace', str(net), 'dev', interface_name] + table_args
+                        for net in profile.extra_routes], config_file)
+
+        if table:
+            for cmd in policy_routing.rule_commands(table, profile):
+                sudo_run(cmd, check=False)
+            log.info('Policy routing via table %s enabled for %s', table, interface_name)
 
         # PostUp hooks (wg-quick compatible)
         post_up = (profile.get('post_up') or '').strip()
@@ -495,15 +733,183 @@ class Interface:
 
         return None
 
+    def move_endpoint_route(self, old_ip, new_ip):
+        """
+        Points the endpoint exclusion route at a peer's new address, without
+        touching the rest of the configuration.
+        """
+        def sudo_run(cmd):
+            return subprocess.run(self._sudo_cmd() + cmd, input=self._sudo_input(),
+                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+
+        if old_ip:
+            family, plen = (['-6'], 128) if ':' in old_ip else ([], 32)
+            sudo_run(['ip'] + family + ['route', 'del', f'{old_ip}/{plen}'])
+        if not new_ip:
+            return
+        if ':' in new_ip:
+            _, _, gw, dev = self.underlay()
+            cmd = ['ip', '-6', 'route', 'replace', f'{new_ip}/128']
+        else:
+            gw, dev, _, _ = self.underlay()
+            cmd = ['ip', 'route', 'replace', f'{new_ip}/32']
+        if gw and dev:
+            sudo_run(cmd + ['via', gw, 'dev', dev])
+            log.info('Endpoint route moved: %s -> %s via %s (%s)', old_ip, new_ip, gw, dev)
+
+    def _policy_rules(self, table):
+        rules = []
+        for family in ('-4', '-6'):
+            try:
+                output = subprocess.check_output(['ip', family, 'rule', 'show']).decode(errors='ignore')
+            except Exception:
+                continue
+            for prio, selector in policy_routing.owned_rules(table, output):
+                rules.append((family, prio, selector))
+        return rules
+
+    def policy_rules_active(self, table):
+        """
+        True while `ip rule`s of a multi-tunnel routing table are installed.
+        """
+        return bool(table) and bool(self._policy_rules(table))
+
+    def _clear_policy_rules(self, table):
+        for family, prio, selector in self._policy_rules(table):
+            lookup = str(table) if f'lookup {table}' in selector else 'main'
+            subprocess.run(
+                self._sudo_cmd() + ['ip', family, 'rule', 'del', 'priority', str(prio), 'lookup', lookup],
+                input=self._sudo_input(),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                check=False
+            )
+
+    def switch_profile(self, old_profile, new_profile, config_file):
+        """
+        Moves a connected kernel-module tunnel from old_profile to new_profile
+        without deleting the link: keys and peers are swapped with one
+        `wg setconf`, addresses, endpoint routes and AllowedIPs routes are
+        diffed and DNS is replaced in place.
+        Returns (error, elapsed_ms).
+        """
+        started = time.monotonic()
+        old_profile = profile_model.Profile.coerce(old_profile)
+        new_profile = profile_model.Profile.coerce(new_profile)
+        old_iface = old_profile.interface_name
+        new_iface = new_profile.interface_name
 
-    def disconnect(self, interface_name):
-        # Always stop userspace daemons to avoid stale wireguard-go processes
-        try:
-            self.stop_userspace_daemons()
-        except Exception:
-            # Best-effort cleanup – ignore failures so we can still tear down the interface
-            pass
+        def sudo_run(cmd, check=False):
+            return subprocess.run(
+                self._sudo_cmd() + cmd,
+                input=self._sudo_input(),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                check=check
+            )
+
+        def elapsed_ms():
+            return int((time.monotonic() - started) * 1000)
+
+        old_addrs = old_profile.address_list
+        new_addrs = new_profile.address_list
+        if not new_addrs:
+            return f'No IP address configured for {new_profile.profile_name or new_iface}', elapsed_ms()
+        old_routes, old_def4, old_def6 = old_profile.routes()
+        new_routes, new_def4, new_def6 = new_profile.routes()
+
+        # Read before anything changes; with a full tunnel up the default
+        # route is the old link, so this comes from the bring-up record.
+        underlay = self.underlay(old_iface)
+        default_gw, real_iface, default_gw_v6, real_iface_v6 = underlay
+
+        renamed = old_iface != new_iface
+        if renamed:
+            # A link can only be renamed while down; the kernel drops its
+            # routes with it, so everything routed is re-added below.
+            if self.interface_exists(new_iface):
+                return f'Interface {new_iface} already exists', elapsed_ms()
+            sudo_run(['ip', 'link', 'set', 'down', 'dev', old_iface])
+            res = sudo_run(['ip', 'link', 'set', 'dev', old_iface, 'name', new_iface])
+            if res.returncode != 0:
+                sudo_run(['ip', 'link', 'set', 'up', 'dev', old_iface])
+                return (res.stderr or b'').decode(errors='ignore').strip() or 'Failed to rename link', elapsed_ms()
+            old_routes, old_def4, old_def6 = [], False, False
+            self._forget_underlay(old_iface)
+            self._record_underlay(new_iface, underlay)
+
+        err = self._setconf(new_iface, new_profile, config_file)
+        if err:
+            return err, elapsed_ms()
+
+        mtu = self._profile_mtu(new_profile, real_iface, default_gw)
+        if mtu:
+            sudo_run(['ip', 'link', 'set', 'dev', new_iface, 'mtu', str(mtu)])
+
+        for addr in old_addrs:
+            if addr not in new_addrs:
+                sudo_run(['ip', 'address', 'del', addr, 'dev', new_iface])
+        for addr in new_addrs:
+            if addr not in old_addrs:
+                sudo_run(['ip', 'address', 'add', addr, 'dev', new_iface])
+
+        if renamed:
+            sudo_run(['ip', 'link', 'set', 'up', 'dev', new_iface])
+
+        # Endpoint exclusion routes live on the physical link and survive
+        # the switch, so only the difference is touched.
+        old_eps = set()
+        new_eps = set()
+        for profile, eps, refresh in ((old_profile, old_eps, False), (new_profile, new_eps, True)):
+            if profile.first_endpoint:
+                eps.update(self._resolve_endpoint_ips(profile.first_endpoint, refresh=refresh))
+        for ip in old_eps - new_eps:
+            if ':' in ip:
+                sudo_run(['ip', '-6', 'route', 'del', f'{ip}/128'])
+            else:
+                sudo_run(['ip', 'route', 'del', f'{ip}/32'])
+        for ip in new_eps - old_eps:
+            if ':' in ip and default_gw_v6 and real_iface_v6:
+                sudo_run(['ip', '-6', 'route', 'replace', f'{ip}/128', 'via', default_gw_v6, 'dev', real_iface_v6])
+            elif ':' not in ip and default_gw and real_iface:
+                sudo_run(['ip', 'route', 'replace', f'{ip}/32', 'via', default_gw, 'dev', real_iface])
+        self._probe_mtu_later(new_profile, real_iface, default_gw)
+
+        # One sudo call for the whole diff, however many peers changed
+        old_set = set(old_routes)
+        new_set = set(new_routes)
+        self._ip_batch([['route', 'del', prefix, 'dev', new_iface]
+                        for prefix in old_routes if prefix not in new_set]
+                       + [['route', 'replace', prefix, 'dev', new_iface]
+                          for prefix in new_routes if prefix not in old_set], config_file)
+
+        if new_def4 and not old_def4:
+            sudo_run(['ip', 'route', 'replace', 'default', 'dev', new_iface])
+        elif old_def4 and not new_def4 and default_gw and real_iface:
+            sudo_run(['ip', 'route', 'replace', 'default', 'via', default_gw, 'dev', real_iface])
+        if new_def6 and not old_def6:
+            sudo_run(['ip', '-6', 'route', 'replace', 'default', 'dev', new_iface])
+        elif old_def6 and not new_def6 and default_gw_v6 and real_iface_v6:
+            sudo_run(['ip', '-6', 'route', 'replace', 'default', 'via', default_gw_v6, 'dev', real_iface_v6])
+        if renamed and not new_def4 and default_gw and real_iface:
+            # The tunnel default route vanished with the link going down
+            sudo_run(['ip', 'route', 'replace', 'default', 'via', default_gw, 'dev', real_iface])
+
+        # resolved keys DNS settings by ifindex, so replacing the server list
+        # on the same link switches resolvers without a gap.
+        dns_servers = list(new_profile.dns)
+        if capabilities.resolvectl_path():
+            if dns_servers:
+                sudo_run(['resolvectl', 'dns', new_iface] + dns_servers)
+                sudo_run(['resolvectl', 'domain', new_iface, '~.'])
+            else:
+                sudo_run(['resolvectl', 'revert', new_iface])
+
+        ms = elapsed_ms()
+        log.info('Switched %s -> %s in %d ms', old_iface, new_iface, ms)
+        return None, ms
 
+    def disconnect(self, interface_name):
         def sudo_run(cmd, check=False):
             return subprocess.run(
                 self._sudo_cmd() + cmd,
@@ -518,13 +924,24 @@ class Interface:
         if PROFILES_DIR.exists():
             for profile_json in PROFILES_DIR.glob('*/profile.json'):
                 try:
-                    data = json.loads(profile_json.read_text())
+                    data = profile_model.load(profile_json)
                 except Exception:
                     continue
                 if data.get('interface_name') == interface_name:
                     profile = data
                     break
 
+        table = profile.get('routing_table') if profile else None
+        # Stop userspace daemons to avoid stale wireguard-go processes. Other
+        # tunnels of a multi-tunnel session keep running; wireguard-go exits
+        # on its own once its link is deleted below.
+        if not table:
+            try:
+                self.stop_userspace_daemons()
+            except Exception:
+                # Best-effort cleanup – ignore failures so we can still tear down the interface
+                pass
+
         safe_preup = profile.get('safe_preup', True) if profile else True
 
         # PreDown hooks (wg-quick compatible)
@@ -553,7 +970,13 @@ class Interface:
             stderr=subprocess.DEVNULL
         ).returncode == 0
 
+        if table:
+            self._clear_policy_rules(table)
+
         if iface_exists:
+            if table:
+                sudo_run(['ip', 'route', 'flush', 'table', str(table)])
+                sudo_run(['ip', '-6', 'route', 'flush', 'table', str(table)])
             sudo_run(['ip', 'route', 'flush', 'dev', interface_name])
             sudo_run(['ip', '-6', 'route', 'flush', 'dev', interface_name], check=False)
             sudo_run(['resolvectl', 'revert', interface_name])
@@ -561,10 +984,8 @@ class Interface:
             sudo_run(['ip', 'link', 'del', 'dev', interface_name])
 
         # Drop endpoint routes via physical interface
-        default_gw = self.get_default_gateway()
-        real_iface = self.get_default_interface()
-        default_gw_v6 = self.get_default_gateway_v6()
-        real_iface_v6 = self.get_default_interface_v6()
+        default_gw, real_iface, default_gw_v6, real_iface_v6 = self.underlay(interface_name)
+        self._forget_underlay(interface_name)
 
         if profile and 'peers' in profile:
             for peer in profile['peers']:
@@ -662,44 +1083,70 @@ class Interface:
     wg1	peer_pubkey	(none)	143.178.241.68:1194	10.88.88.1/32,192.168.2.0/24	0	0	0	off
     '''.strip().splitlines()
 
-    def current_status_by_interface(self):
-        last_interface = None
-        data = self._get_wg_status()
-        interface_status = {}
-        status_by_interface = {}
-
-        for line in data:
-            parts = line.split('\t')
-            iface = parts[0]
-
-            if iface != last_interface and interface_status:
-                status_by_interface[last_interface] = interface_status
-                interface_status = {}
-
-            if len(parts) == 5:
-                iface, private_key, public_key, listen_port, fwmark = parts
-                interface_status = {
-                    'my_privkey': private_key,
-                    'peers': []
-                }
-                last_interface = iface
-
-            elif len(parts) == 9:
-                iface, public_key, preshared_key, endpoint, allowed_ips, latest_handshake, transfer_rx, transfer_tx, persistent_keepalive = parts
-                peer_data = {
-                    'public_key': public_key,
-                    'rx': int(transfer_rx),
-                    'tx': int(transfer_tx),
-                    'latest_handshake': int(latest_handshake),
-                    'up': int(latest_handshake) > 0,
-                }
-                interface_status.setdefault('peers', []).append(peer_data)
-                interface_status['peers'].sort(key=lambda x: not x['up'])
-
-            else:
-                raise ValueError(f"Can't parse line: {line}")
+    def latest_handshakes(self, interface_name):
+        """
+        {peer public key: latest handshake (unix time, 0 = never)}; empty
+        while the link is not up yet.
+        """
+        if uapi.available(interface_name, self._sudo_pwd):
+            try:
+                return {p['public_key']: p['latest_handshake']
+                        for p in uapi.status(interface_name, sudo_pwd=self._sudo_pwd)['peers']}
+            except (uapi.UapiError, OSError, ValueError):
+                return {}
+        try:
+            p = subprocess.run(
+                self._sudo_cmd() + [str(WG_PATH), 'show', interface_name, 'latest-handshakes'],
+                input=self._sudo_input(),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                check=False,
+                timeout=5,
+            )
+        except (OSError, subprocess.TimeoutExpired):
+            return {}
+        if p.returncode != 0:
+            return {}
+        handshakes = {}
+        for line in p.stdout.decode(errors='ignore').splitlines():
+            parts = line.split()
+            if len(parts) == 2 and parts[1].isdigit():
+                handshakes[parts[0]] = int(parts[1])
+        return handshakes
+
+    def wait_for_handshake(self, interface_name, timeout=10.0, since=0):
+        """
+        Waits until a peer completes a handshake at or after `since` (unix
+        time). Polls quickly at first and backs off, since most handshakes
+        finish within a round trip or two. Returns True on success.
+        """
+        deadline = time.monotonic() + timeout
+        delay = 0.05
+        while True:
+            if any(ts and ts >= int(since) for ts in self.latest_handshakes(interface_name).values()):
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.5)
 
-        if last_interface:
-            status_by_interface[last_interface] = interface_status
+    def userspace_status(self):
+        """
+        Stats of the userspace tunnels, from the supervisor (no sudo).
+        """
+        try:
+            reply = daemon_client.request({'cmd': 'status'})
+        except (daemon_client.DaemonUnavailable, ValueError):
+            return {}
+        return reply.get('tunnels') or {}
 
+    def current_status_by_interface(self):
+        status_by_interface = self.userspace_status()
+        if status_by_interface:
+            kernel_ifaces = [i for i in self.list_wireguard_interfaces() if i not in status_by_interface]
+            if not kernel_ifaces:
+                return status_by_interface
+        for iface, status in parse_wg_dump(self._get_wg_status()).items():
+            status_by_interface.setdefault(iface, status)
         return status_by_interface
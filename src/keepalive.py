@@ -0,0 +1,124 @@
+import time
+
+# Per-peer `keepalive` profile setting: "" (default interval), a number of
+# seconds, "off" / "0", or "auto" (adaptive, userspace tunnels only). Peers
+# without an endpoint (clients of a server profile) default to off.
+DEFAULT_INTERVAL = 5
+MAX_INTERVAL = 65535
+
+# Adaptive mode starts below the common 30 s UDP NAT timeout, doubles the
+# interval after a few handshakes in a row and halves it once the handshake
+# goes stale. Growth stops short of an interval that failed before.
+ADAPTIVE_INITIAL = 25
+ADAPTIVE_MIN = 10
+ADAPTIVE_MAX = 120
+STABLE_HANDSHAKES = 3
+STALE_AGE = 180
+
+
+def normalize(value):
+    value = str(value if value is not None else '').strip().lower()
+    return 'off' if value == '0' else value
+
+
+def validate(value):
+    """
+    Returns an error message, or None when `value` is a valid setting.
+    """
+    value = normalize(value)
+    if value in ('', 'off', 'auto'):
+        return None
+    if not value.isdigit() or int(value) > MAX_INTERVAL:
+        return f'must be a number of seconds up to {MAX_INTERVAL}, "off" or "auto"'
+    return None
+
+
+def is_adaptive(peer):
+    return normalize(peer.get('keepalive')) == 'auto'
+
+
+def peer_interval(peer):
+    """
+    Interval the peer is configured with, in seconds (0 = off). Adaptive
+    peers start at ADAPTIVE_INITIAL; without an endpoint the default is off.
+    """
+    value = normalize(peer.get('keepalive'))
+    if value == 'auto':
+        return ADAPTIVE_INITIAL
+    if value == 'off':
+        return 0
+    if value.isdigit():
+        return int(value)
+    return DEFAULT_INTERVAL if str(peer.get('endpoint') or '').strip() else 0
+
+
+def adaptive_peers(profile, previous=None):
+    """
+    {public key: AdaptiveKeepalive} for the profile's adaptive peers; state
+    from `previous` is kept for peers that are still adaptive.
+    """
+    previous = previous or {}
+    found = {}
+    for peer in profile.get('peers', []):
+        key = (peer.get('key') or '').strip()
+        if key and is_adaptive(peer):
+            found[key] = previous.get(key) or AdaptiveKeepalive()
+    return found
+
+
+class AdaptiveKeepalive:
+    """
+    Picks the keepalive interval of one peer from the handshakes it keeps
+    completing. `observe()` is fed the peer's latest handshake (unix time,
+    0 = never) and returns the new interval when it changed.
+    """
+
+    def __init__(self, interval=ADAPTIVE_INITIAL, minimum=ADAPTIVE_MIN, maximum=ADAPTIVE_MAX,
+                 stable_handshakes=STABLE_HANDSHAKES, stale_age=STALE_AGE, clock=time.time):
+        self.interval = interval
+        self.minimum = minimum
+        self.maximum = maximum
+        self.stable_handshakes = stable_handshakes
+        self.stale_age = stale_age
+        self.clock = clock
+        self.started = clock()
+        self.last_handshake = 0
+        self.stable = 0
+        self.stale = False
+        # Interval in use the last time the handshake went stale
+        self.failed = None
+        self.changes = 0
+
+    def ceiling(self):
+        if self.failed is None:
+            return self.maximum
+        return max(self.minimum, min(self.maximum, self.failed * 3 // 4))
+
+    def _set(self, interval):
+        if interval == self.interval:
+            return None
+        self.interval = interval
+        self.changes += 1
+        return interval
+
+    def observe(self, latest_handshake):
+        latest_handshake = int(latest_handshake or 0)
+        if latest_handshake and latest_handshake != self.last_handshake:
+            self.last_handshake = latest_handshake
+            self.stale = False
+            self.stable += 1
+            if self.stable < self.stable_handshakes:
+                return None
+            self.stable = 0
+            return self._set(min(self.ceiling(), self.interval * 2))
+        age = self.clock() - (latest_handshake or self.started)
+        if age < self.stale_age or self.stale:
+            return None
+        self.stale = True
+        self.stable = 0
+        self.failed = self.interval
+        return self._set(max(self.minimum, self.interval // 2))
+
+    def state(self):
+        return {'interval': self.interval, 'adaptive': True, 'ceiling': self.ceiling(),
+                'changes': self.changes}
@@ -0,0 +1,40 @@
+import json
+import os
+import time
+
+import daemon_client
+
+# Connection metrics (recoveries, connect latency, ...) as JSON lines, so
+# they can be compared across app versions.
+METRICS_FILE = os.path.join(daemon_client.LOG_DIR, 'metrics.jsonl')
+MAX_SIZE = 1024 * 1024
+
+
+def record(kind, **fields):
+    entry = {'kind': kind, 'time': int(time.time())}
+    entry.update(fields)
+    try:
+        os.makedirs(os.path.dirname(METRICS_FILE), mode=0o700, exist_ok=True)
+        if os.path.exists(METRICS_FILE) and os.path.getsize(METRICS_FILE) > MAX_SIZE:
+            os.replace(METRICS_FILE, METRICS_FILE + '.1')
+        with open(METRICS_FILE, 'a') as fd:
+            fd.write(json.dumps(entry, sort_keys=True) + '\n')
+    except OSError:
+        pass
+    return entry
+
+
+def read(kind=None):
+    entries = []
+    try:
+        with open(METRICS_FILE) as fd:
+            for line in fd:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if kind is None or entry.get('kind') == kind:
+                    entries.append(entry)
+    except OSError:
+        pass
+    return entries
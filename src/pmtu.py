@@ -0,0 +1,130 @@
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+
+from profile import CONFIG_DIR
+
+# Path MTU per endpoint and underlying network, keyed by default interface,
+# gateway and endpoint address.
+CACHE_FILE = CONFIG_DIR / 'pmtu.json'
+CACHE_TTL = 24 * 3600
+# A path that could not be probed (ICMP filtered) is retried after an hour
+FAILED_TTL = 3600
+
+MIN_LINK_MTU = 1280
+MAX_LINK_MTU = 1500
+# Outer IP + UDP + WireGuard headers
+WG_OVERHEAD = {4: 60, 6: 80}
+# Outer IP + ICMP headers of a ping
+PING_OVERHEAD = {4: 28, 6: 48}
+
+_lock = threading.Lock()
+
+
+def _ping(target, mtu, dev=None):
+    """
+    Sends one don't-fragment ping of `mtu` bytes on the wire, out of `dev`
+    when given (so it takes the physical path once a tunnel is up). Returns
+    (ok, mtu reported by a "message too long" error or None).
+    """
+    version = 6 if ':' in target else 4
+    cmd = ['ping', '-6' if version == 6 else '-4', '-M', 'do', '-c', '1', '-W', '1',
+           '-s', str(mtu - PING_OVERHEAD[version])]
+    if dev:
+        cmd += ['-I', dev]
+    cmd.append(target)
+    try:
+        p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False, timeout=3)
+    except (OSError, subprocess.TimeoutExpired):
+        return False, None
+    if p.returncode == 0:
+        return True, None
+    match = re.search(r'mtu\s*=\s*(\d+)', (p.stdout + p.stderr).decode(errors='ignore'))
+    return False, int(match.group(1)) if match else None
+
+
+def probe_path_mtu(target, low=MIN_LINK_MTU, high=MAX_LINK_MTU, ping=_ping):
+    """
+    Largest packet size that reaches `target` unfragmented (binary search),
+    or None when not even `low` gets through (e.g. ICMP is filtered).
+    """
+    ok, reported = ping(target, high)
+    if ok:
+        return high
+    if reported and low <= reported < high:
+        # The kernel already knows the path MTU from an earlier ICMP error
+        high = reported
+        ok, _ = ping(target, high)
+        if ok:
+            return high
+    best = None
+    lo, hi = low, high - 1
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        ok, _ = ping(target, mid)
+        if ok:
+            best = mid
+            lo = mid + 1
+        else:
+            hi = mid - 1
+    return best
+
+
+def _load():
+    try:
+        data = json.loads(CACHE_FILE.read_text())
+    except Exception:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _store(data):
+    try:
+        CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = CACHE_FILE.with_name(CACHE_FILE.name + '.tmp')
+        tmp.write_text(json.dumps(data, indent=4, sort_keys=True))
+        os.replace(tmp, CACHE_FILE)
+    except Exception:
+        pass
+
+
+def _key(target, dev, gateway):
+    return f'{dev}|{gateway}|{target}'
+
+
+def cached_tunnel_mtu(target, dev, gateway):
+    """
+    The cached tunnel MTU towards `target` on the current network, without
+    probing: (True, mtu) on a fresh entry, where mtu is None for a path that
+    could not be probed; (False, None) when it has to be probed.
+    """
+    with _lock:
+        entry = _load().get(_key(target, dev, gateway))
+    if not isinstance(entry, dict):
+        return False, None
+    ttl = CACHE_TTL if entry.get('mtu') else FAILED_TTL
+    if time.time() - entry.get('time', 0) >= ttl:
+        return False, None
+    return True, entry.get('mtu')
+
+
+def tunnel_mtu(target, dev, gateway, refresh=False, ping=None):
+    """
+    Tunnel MTU for the current network: the path MTU towards `target` (the
+    peer endpoint) minus the WireGuard overhead. Cached per endpoint and
+    default interface/gateway; None when the path could not be probed.
+    """
+    if not refresh:
+        hit, mtu = cached_tunnel_mtu(target, dev, gateway)
+        if hit:
+            return mtu
+    path_mtu = probe_path_mtu(target, ping=ping or (lambda target, mtu: _ping(target, mtu, dev)))
+    mtu = path_mtu - WG_OVERHEAD[6 if ':' in target else 4] if path_mtu else None
+    with _lock:
+        data = _load()
+        data[_key(target, dev, gateway)] = {'mtu': mtu, 'path_mtu': path_mtu, 'time': int(time.time())}
+        _store(data)
+    return mtu
@@ -0,0 +1,158 @@
+from ipaddress import ip_network
+
+from prefix_compiler import peer_allowed_ips
+
+# Each policy-routed tunnel owns one routing table; the fwmark set on the
+# WireGuard socket uses the same number so its own encrypted packets skip
+# the tunnel rules (same trick as wg-quick).
+TABLE_BASE = 51820
+MAX_TABLES = 200
+
+# Split tunnels get `to <prefix> lookup <table>` rules which must win over the
+# catch-all rule of a full tunnel, so they live in a lower priority band.
+SPLIT_PRIORITY_BASE = 10000
+FULL_PRIORITY_BASE = 20000
+
+
+def _split_csv(val):
+    return [x.strip() for x in str(val or "").split(",") if x.strip()]
+
+
+def table_slot(table):
+    return int(table) - TABLE_BASE
+
+
+def allocate_table(preferred, used):
+    if preferred:
+        try:
+            preferred = int(preferred)
+        except (TypeError, ValueError):
+            preferred = None
+    if preferred and preferred not in used and 0 <= table_slot(preferred) < MAX_TABLES:
+        return preferred
+    for slot in range(MAX_TABLES):
+        table = TABLE_BASE + slot
+        if table not in used:
+            return table
+    return None
+
+
+def route_plan(profile):
+    """
+    Returns (full_v4, full_v6, prefixes) for the profile: whether it wants the
+    IPv4/IPv6 default route and the remaining routed networks.
+    """
+    full_v4 = False
+    full_v6 = False
+    prefixes = []
+    raw = []
+    for peer in profile.get('peers', []):
+        raw += peer_allowed_ips(peer)
+    raw += _split_csv(profile.get('extra_routes'))
+    for prefix in raw:
+        try:
+            net = ip_network(prefix, strict=False)
+        except ValueError:
+            continue
+        if net.prefixlen == 0:
+            if net.version == 4:
+                full_v4 = True
+            else:
+                full_v6 = True
+            continue
+        if net not in prefixes:
+            prefixes.append(net)
+    return full_v4, full_v6, prefixes
+
+
+def find_conflicts(profile, active_profiles, endpoint_ips=None):
+    """
+    Checks a profile against the profiles that are already up in
+    multi-tunnel mode. `endpoint_ips` maps profile name -> resolved endpoint
+    addresses and is used to catch tunnels routing another tunnel's endpoint.
+    Returns a list of human readable conflicts (empty when none).
+    """
+    endpoint_ips = endpoint_ips or {}
+    name = profile.get('profile_name')
+    full_v4, full_v6, prefixes = route_plan(profile)
+    conflicts = []
+    for other in active_profiles:
+        other_name = other.get('profile_name')
+        o_full_v4, o_full_v6, o_prefixes = route_plan(other)
+        if full_v4 and o_full_v4:
+            conflicts.append(f'{name} and {other_name} both route all IPv4 traffic')
+        if full_v6 and o_full_v6:
+            conflicts.append(f'{name} and {other_name} both route all IPv6 traffic')
+        for net in prefixes:
+            for other_net in o_prefixes:
+                if net.version == other_net.version and net.overlaps(other_net):
+                    conflicts.append(f'{name} route {net} overlaps {other_name} route {other_net}')
+        for a_name, a_prefixes, b_name in ((name, prefixes, other_name), (other_name, o_prefixes, name)):
+            for ip in endpoint_ips.get(b_name, []):
+                try:
+                    addr = ip_network(ip)
+                except ValueError:
+                    continue
+                for net in a_prefixes:
+                    if net.version == addr.version and addr.subnet_of(net):
+                        conflicts.append(f'{a_name} route {net} captures the endpoint {ip} of {b_name}')
+    return conflicts
+
+
+def rule_commands(table, profile):
+    """
+    Returns the `ip rule` argv lists (without sudo) that steer traffic into
+    the tunnel's table.
+    """
+    slot = table_slot(table)
+    full_v4, full_v6, prefixes = route_plan(profile)
+    cmds = []
+    for net in prefixes:
+        family = '-6' if net.version == 6 else '-4'
+        cmds.append(['ip', family, 'rule', 'add', 'to', str(net), 'lookup', str(table),
+                     'priority', str(SPLIT_PRIORITY_BASE + slot)])
+    for family, enabled in (('-4', full_v4), ('-6', full_v6)):
+        if not enabled:
+            continue
+        prio = FULL_PRIORITY_BASE + slot * 2
+        cmds.append(['ip', family, 'rule', 'add', 'lookup', 'main', 'suppress_prefixlength', '0',
+                     'priority', str(prio)])
+        cmds.append(['ip', family, 'rule', 'add', 'not', 'fwmark', str(table), 'lookup', str(table),
+                     'priority', str(prio + 1)])
+    return cmds
+
+
+def rule_priorities(table):
+    slot = table_slot(table)
+    prio = FULL_PRIORITY_BASE + slot * 2
+    return {SPLIT_PRIORITY_BASE + slot, prio, prio + 1}
+
+
+def parse_rules(output):
+    """
+    Parses `ip rule show` output into (priority, selector text) tuples.
+    """
+    rules = []
+    for line in output.splitlines():
+        prio, sep, rest = line.partition(':')
+        if not sep:
+            continue
+        try:
+            rules.append((int(prio.strip()), rest.strip()))
+        except ValueError:
+            continue
+    return rules
+
+
+def owned_rules(table, output):
+    """
+    Returns the `ip rule show` entries that belong to the tunnel's table.
+    """
+    prios = rule_priorities(table)
+    owned = []
+    for prio, selector in parse_rules(output):
+        if prio not in prios:
+            continue
+        if f'lookup {table}' in selector or 'suppress_prefixlength 0' in selector:
+            owned.append((prio, selector))
+    return owned
@@ -0,0 +1,91 @@
+import functools
+
+from ipaddress import IPv4Address, IPv6Address, collapse_addresses, ip_network, summarize_address_range
+
+
+def _split_csv(val):
+    return [x.strip() for x in str(val or "").split(",") if x.strip()]
+
+
+def parse_prefixes(values):
+    """
+    Parses a comma separated string (or an iterable of strings) into networks,
+    grouped by IP version. Raises ValueError on a bad prefix.
+    """
+    if isinstance(values, str):
+        values = _split_csv(values)
+    nets = {4: [], 6: []}
+    for value in values:
+        net = ip_network(value, strict=False)
+        nets[net.version].append(net)
+    return nets
+
+
+def _ranges(nets):
+    # collapse_addresses merges duplicates, nested and adjacent networks, so
+    # the resulting ranges are sorted and disjoint.
+    return [(int(n.network_address), int(n.broadcast_address)) for n in collapse_addresses(nets)]
+
+
+def _subtract(include, exclude):
+    out = []
+    j = 0
+    for start, end in include:
+        cur = start
+        while j < len(exclude) and exclude[j][1] < cur:
+            j += 1
+        k = j
+        while k < len(exclude) and exclude[k][0] <= end and cur <= end:
+            ex_start, ex_end = exclude[k]
+            if ex_start > cur:
+                out.append((cur, ex_start - 1))
+            cur = max(cur, ex_end + 1)
+            k += 1
+        if cur <= end:
+            out.append((cur, end))
+    return out
+
+
+def _to_networks(ranges, version):
+    cls = IPv4Address if version == 4 else IPv6Address
+    nets = []
+    for start, end in ranges:
+        nets.extend(summarize_address_range(cls(start), cls(end)))
+    return nets
+
+
+def compile_prefixes(include, exclude=()):
+    """
+    Returns the minimal list of networks covering `include` minus `exclude`.
+    IPv4 networks come first, each family sorted by address.
+    """
+    inc = parse_prefixes(include)
+    exc = parse_prefixes(exclude)
+    result = []
+    for version in (4, 6):
+        if not inc[version]:
+            continue
+        ranges = _ranges(inc[version])
+        if exc[version]:
+            ranges = _subtract(ranges, _ranges(exc[version]))
+        result.extend(_to_networks(ranges, version))
+    return result
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_cached(include, exclude):
+    return tuple(str(net) for net in compile_prefixes(include, exclude))
+
+
+def peer_allowed_ips(peer):
+    """
+    Compiled AllowedIPs of a profile peer (`allowed_prefixes` minus
+    `excluded_prefixes`) as strings. Invalid input is passed through untouched
+    so that `wg setconf` reports it.
+    """
+    include = (peer.get('allowed_prefixes') or '').strip()
+    exclude = (peer.get('excluded_prefixes') or '').strip()
+    try:
+        return list(_compile_cached(include, exclude))
+    except ValueError:
+        return _split_csv(include)
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import zipfile
+
+import secrets_store
+from profile_model import ProfileError
+from profile import CONFIG_DIR, PROFILES_DIR
+from wg_config import build_quick_config
+
+# Content hash of every profile as of its last export, for incremental exports
+INDEX_FILE = CONFIG_DIR / 'export_index.json'
+
+
+def load_profiles(names=None):
+    """
+    [(profile dir name, profile dict)] sorted by name, optionally only the
+    profiles in `names` (directory or profile names).
+    """
+    wanted = set(names) if names is not None else None
+    found = []
+    for path in sorted(PROFILES_DIR.glob('*/profile.json')):
+        try:
+            data = json.loads(path.read_text())
+        except Exception:
+            continue
+        name = path.parent.name
+        if wanted is not None and name not in wanted and data.get('profile_name') not in wanted:
+            continue
+        found.append((name, data))
+    return found
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def load_index():
+    try:
+        index = json.loads(INDEX_FILE.read_text())
+    except Exception:
+        return {}
+    return index if isinstance(index, dict) else {}
+
+
+def store_index(index):
+    try:
+        INDEX_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = INDEX_FILE.with_name(INDEX_FILE.name + '.tmp')
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(index, f, indent=4, sort_keys=True)
+        os.replace(tmp, INDEX_FILE)
+    except Exception:
+        pass
+
+
+def _preview(names):
+    preview = ", ".join(names[:5])
+    if len(names) > 5:
+        preview = f"{preview} (+{len(names)-5} more)"
+    return preview
+
+
+def export_zip(vpn, fileobj, names=None, incremental=False):
+    """
+    Writes the selected profiles (all by default) as wg-quick configs into a
+    zip on `fileobj`, one entry at a time; the private keys are read with a
+    single privileged call beforehand. With `incremental`, profiles whose
+    config is unchanged since their last export are skipped. Returns a
+    report with `exported`, `unchanged` and `warning`.
+    """
+    profiles = load_profiles(names)
+    keys, keys_err = secrets_store.get_private_keys([name for name, _ in profiles], vpn._sudo_pwd)
+    index = load_index()
+    hashes = {}
+    exported = []
+    unchanged = []
+    missing = []
+    missing_keys = []
+    bad_password = []
+    invalid = []
+
+    with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_DEFLATED) as z:
+        for name, data in profiles:
+            raw_name = data.get('profile_name') or name
+            safe_name = vpn._sanitize_profile_name(raw_name, name)
+            if not (data.get('ip_address') or '').strip():
+                missing.append(safe_name)
+                continue
+            privkey = keys.get(name)
+            if not privkey:
+                if keys_err == 'BAD_PASSWORD':
+                    bad_password.append(safe_name)
+                    continue
+                # Not in the key store yet: legacy profiles are migrated here
+                privkey, err = vpn._get_private_key_status(name, data)
+                if not privkey:
+                    (bad_password if err == 'BAD_PASSWORD' else missing_keys).append(safe_name)
+                    continue
+
+            try:
+                text = build_quick_config(dict(data, profile_name=raw_name), privkey)
+            except ProfileError:
+                invalid.append(safe_name)
+                continue
+            digest = content_hash(text)
+            if incremental and index.get(name) == digest:
+                unchanged.append(name)
+                continue
+            z.writestr(f'{safe_name}.conf', text)
+            hashes[name] = digest
+            exported.append(name)
+
+    warnings = []
+    if missing:
+        warnings.append(f"Skipped {len(missing)} profiles missing Address: {_preview(missing)}")
+    if missing_keys:
+        warnings.append(f"Skipped {len(missing_keys)} profiles missing private key: {_preview(missing_keys)}")
+    if bad_password:
+        warnings.append(f"Skipped {len(bad_password)} profiles (wrong password): {_preview(bad_password)}")
+    if invalid:
+        warnings.append(f"Skipped {len(invalid)} invalid profiles: {_preview(invalid)}")
+    return {
+        'exported': exported,
+        'unchanged': unchanged,
+        'hashes': hashes,
+        'warning': '; '.join(warnings) or None,
+    }
+
+
+def record_export(hashes):
+    if hashes:
+        index = load_index()
+        index.update(hashes)
+        store_index(index)
@@ -0,0 +1,298 @@
+import hashlib
+import json
+import os
+import re
+from collections.abc import Mapping
+from ipaddress import ip_interface, ip_network
+
+import keepalive
+from prefix_compiler import peer_allowed_ips
+
+# profile.json path -> ((mtime_ns, size, inode), parsed Profile)
+_cache = {}
+
+# `kind` of a profile: a client dials its peers; a server (site hub) listens
+# on `listen_port` and its peers may have no endpoint.
+CLIENT = 'client'
+SERVER = 'server'
+KINDS = (CLIENT, SERVER)
+
+
+class ProfileError(ValueError):
+    pass
+
+
+def _split_csv(val):
+    return [x.strip() for x in str(val or "").split(",") if x.strip()]
+
+
+def _networks(values, what):
+    nets = []
+    for value in values:
+        try:
+            nets.append(ip_network(value, strict=False))
+        except ValueError as e:
+            raise ProfileError(f'Bad {what} {value}: {e}') from None
+    return tuple(nets)
+
+
+class Peer(Mapping):
+    """
+    One profile peer with its prefixes parsed and its AllowedIPs compiled
+    once. It reads like the stored peer dict (`peer.get('key')`); use
+    `replace()` instead of item assignment.
+    """
+    __slots__ = ('_data', 'name', 'key', 'preshared_key', 'endpoint', 'endpoints', 'keepalive',
+                 'allowed_prefixes', 'excluded_prefixes', 'allowed_ips')
+
+    def __init__(self, data):
+        self._data = dict(data)
+        self.name = str(data.get('name') or '').strip()
+        self.key = str(data.get('key') or '').strip()
+        self.preshared_key = str(data.get('presharedKey') or '').strip()
+        self.endpoint = str(data.get('endpoint') or '').strip()
+        self.endpoints = tuple(str(data.get('endpoints') or '').replace(',', ' ').split())
+        self.keepalive = keepalive.normalize(data.get('keepalive'))
+        label = f'peer ({self.name or self.key})'
+        self.allowed_prefixes = _networks(_split_csv(data.get('allowed_prefixes')), f'{label} prefix')
+        self.excluded_prefixes = _networks(_split_csv(data.get('excluded_prefixes')),
+                                           f'{label} excluded prefix')
+        if len(self.allowed_prefixes) == 1 and not self.excluded_prefixes:
+            # Nothing to collapse; the common case of a server's peers
+            self.allowed_ips = (str(self.allowed_prefixes[0]),)
+        else:
+            self.allowed_ips = tuple(peer_allowed_ips(data))
+
+    @classmethod
+    def coerce(cls, peer):
+        return peer if isinstance(peer, cls) else cls(peer)
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f'Peer({self._data!r})'
+
+    def replace(self, **fields):
+        return Peer(dict(self._data, **fields))
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+# Stored fields Profile parses into attributes
+_FIELDS = frozenset(('peers', 'profile_name', 'interface_name', 'kind', 'listen_port', 'ip_address',
+                     'dns_servers', 'extra_routes', 'mtu', 'routing_table'))
+
+
+class Profile(Mapping):
+    """
+    A profile parsed once: addresses, routes and peers as ip objects, the
+    serialized form cached. Reads like the stored profile dict, so code that
+    only calls `.get()` takes either; use `replace()` for changes.
+    """
+    __slots__ = ('_data', '_serialized', '_routes', '_hash', '_peer_table', 'profile_name', 'interface_name',
+                 'kind', 'listen_port', 'addresses', 'dns', 'extra_routes', 'peers', 'mtu', 'routing_table')
+
+    def __init__(self, data):
+        self._data = dict(data)
+        self._peer_table = None
+        self._parse(_FIELDS)
+
+    def _parse(self, changed):
+        """
+        Parses the stored fields named in `changed` into attributes and drops
+        the derived values they feed.
+        """
+        data = self._data
+        self._serialized = None
+        self._hash = None
+        if 'peers' in changed or 'extra_routes' in changed:
+            self._routes = None
+        if 'peers' in changed:
+            self.peers = tuple(Peer.coerce(peer) for peer in data.get('peers') or ())
+            data['peers'] = self.peers
+            self._peer_table = None
+        if 'profile_name' in changed:
+            self.profile_name = str(data.get('profile_name') or '')
+        if 'interface_name' in changed:
+            self.interface_name = str(data.get('interface_name') or '')
+        if 'kind' in changed:
+            self.kind = str(data.get('kind') or CLIENT).strip().lower()
+            if self.kind not in KINDS:
+                raise ProfileError(f"Bad profile kind {data.get('kind')}")
+        if 'listen_port' in changed:
+            try:
+                self.listen_port = int(data.get('listen_port') or 0) or None
+            except (TypeError, ValueError):
+                raise ProfileError(f"Bad listen port {data.get('listen_port')}") from None
+        if 'ip_address' in changed:
+            addresses = []
+            for addr in re.split(r'[\s,]+', str(data.get('ip_address') or '').strip()):
+                if not addr:
+                    continue
+                try:
+                    addresses.append(ip_interface(addr))
+                except ValueError as e:
+                    raise ProfileError(f'Bad ip address {addr}: {e}') from None
+            self.addresses = tuple(addresses)
+        if 'dns_servers' in changed:
+            self.dns = tuple(_split_csv(data.get('dns_servers')))
+        if 'extra_routes' in changed:
+            self.extra_routes = _networks(_split_csv(data.get('extra_routes')), 'route')
+        if 'mtu' in changed:
+            self.mtu = str(data.get('mtu') or '').strip().lower()
+        if 'routing_table' in changed:
+            try:
+                self.routing_table = int(data.get('routing_table') or 0) or None
+            except (TypeError, ValueError):
+                raise ProfileError(f"Bad routing table {data.get('routing_table')}") from None
+
+    @classmethod
+    def coerce(cls, profile):
+        return profile if isinstance(profile, cls) else cls(profile)
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f'Profile({self.profile_name!r}, {self.interface_name!r})'
+
+    def replace(self, **fields):
+        """
+        Copy with top-level fields changed. Only those are parsed again: the
+        other attributes, unchanged peers and the routes and peer table (when
+        peers and extra routes stay) are shared with this profile.
+        """
+        copy = Profile.__new__(Profile)
+        for slot in Profile.__slots__:
+            setattr(copy, slot, getattr(self, slot))
+        copy._data = dict(self._data, **fields)
+        copy._parse(fields)
+        return copy
+
+    def replace_peer(self, old, new):
+        return self.replace(peers=tuple(new if peer is old else peer for peer in self.peers))
+
+    @property
+    def is_server(self):
+        return self.kind == SERVER
+
+    @property
+    def peer_table(self):
+        """
+        {public key: Peer}, built once; servers look peers up by key among
+        thousands.
+        """
+        if self._peer_table is None:
+            self._peer_table = {peer.key: peer for peer in self.peers}
+        return self._peer_table
+
+    @property
+    def address_list(self):
+        return [addr.with_prefixlen for addr in self.addresses]
+
+    @property
+    def first_endpoint(self):
+        return next((peer.endpoint for peer in self.peers if peer.endpoint), None)
+
+    def routes(self):
+        """
+        (prefixes, add_default_v4, add_default_v6) for AllowedIPs and extra
+        routes, computed once in time linear in the number of prefixes.
+        """
+        if self._routes is None:
+            # dict keeps the first-seen order and makes the dedupe O(1)
+            prefixes = {}
+            add_default_v4 = False
+            add_default_v6 = False
+            for peer in self.peers:
+                for prefix in peer.allowed_ips:
+                    if prefix == '0.0.0.0/0':
+                        add_default_v4 = True
+                    elif prefix == '::/0':
+                        add_default_v6 = True
+                    else:
+                        prefixes.setdefault(prefix)
+            for net in self.extra_routes:
+                prefixes.setdefault(str(net))
+            self._routes = (tuple(prefixes), add_default_v4, add_default_v6)
+        prefixes, add_default_v4, add_default_v6 = self._routes
+        return list(prefixes), add_default_v4, add_default_v6
+
+    @property
+    def content_hash(self):
+        """
+        sha256 of the normalized tunnel config: addresses, DNS, routes, MTU,
+        kind, listen port, kept wg-quick keys and peers. Names, hooks, the
+        routing table and the private key are left out, so the same config
+        imported twice under different names hashes the same.
+        """
+        if self._hash is None:
+            peers = sorted(
+                [peer.key, peer.preshared_key, peer.endpoint, sorted(peer.endpoints),
+                 'auto' if peer.keepalive == 'auto' else keepalive.peer_interval(peer), sorted(peer.allowed_ips)]
+                for peer in self.peers)
+            normalized = {
+                'addresses': sorted(addr.with_prefixlen for addr in self.addresses),
+                'dns': list(self.dns),
+                'extra_routes': sorted(str(net) for net in self.extra_routes),
+                'mtu': self.mtu,
+                'wg_quick': self._data.get('wg_quick') or {},
+                'peers': peers,
+            }
+            # Only when set, so hashes stored before servers existed still match
+            if self.is_server:
+                normalized['kind'] = self.kind
+            if self.listen_port:
+                normalized['listen_port'] = self.listen_port
+            text = json.dumps(normalized, sort_keys=True, separators=(',', ':'))
+            self._hash = hashlib.sha256(text.encode()).hexdigest()
+        return self._hash
+
+    def to_dict(self):
+        """
+        The plain JSON form. It is built once and shared: copy it before
+        changing it.
+        """
+        if self._serialized is None:
+            data = dict(self._data)
+            data['peers'] = [peer.to_dict() for peer in self.peers]
+            self._serialized = data
+        return self._serialized
+
+
+def plain(profile):
+    """
+    `profile` as something json.dumps() takes.
+    """
+    return profile.to_dict() if isinstance(profile, Profile) else profile
+
+
+def load(path):
+    """
+    The profile stored at `path`. It is parsed once per change of the file;
+    until then every call returns the same Profile.
+    """
+    key = str(path)
+    st = os.stat(key)
+    stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+    cached = _cache.get(key)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    with open(key) as fd:
+        profile = Profile(json.load(fd))
+    _cache[key] = (stamp, profile)
+    return profile
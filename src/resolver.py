@@ -0,0 +1,93 @@
+import ipaddress
+import socket
+import time
+
+# getaddrinfo() does not expose record TTLs, so answers are kept for a fixed
+# time; failed lookups are retried sooner.
+DEFAULT_TTL = 300
+NEGATIVE_TTL = 30
+
+
+def split_endpoint(endpoint):
+    """
+    "host:port" / "[v6]:port" -> (host, port); port is None when missing.
+    """
+    endpoint = (endpoint or '').strip()
+    if endpoint.startswith('['):
+        host, _, rest = endpoint[1:].partition(']')
+        port = rest[1:] if rest.startswith(':') else ''
+    elif endpoint.count(':') == 1:
+        host, _, port = endpoint.partition(':')
+    else:
+        host, port = endpoint, ''
+    return host, (int(port) if port.isdigit() else None)
+
+
+def is_literal(host):
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+def format_endpoint(ip, port):
+    return f'[{ip}]:{port}' if ':' in ip else f'{ip}:{port}'
+
+
+class Resolver:
+    def __init__(self, ttl=DEFAULT_TTL, negative_ttl=NEGATIVE_TTL, clock=time.monotonic, lookup=None):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        self.lookup = lookup or self._getaddrinfo
+        self.lookups = 0
+        self._cache = {}
+
+    @staticmethod
+    def _getaddrinfo(host):
+        ips = []
+        for info in socket.getaddrinfo(host, None, type=socket.SOCK_DGRAM):
+            ip = info[4][0]
+            if ip not in ips:
+                ips.append(ip)
+        return ips
+
+    def expired(self, host):
+        if is_literal(host):
+            return False
+        entry = self._cache.get(host)
+        return entry is None or self.clock() >= entry[1]
+
+    def resolve(self, host, refresh=False):
+        """
+        Addresses of `host` in resolver order (an IP literal is returned as
+        is). Served from the cache until the TTL runs out unless `refresh`.
+        """
+        if not host:
+            return []
+        if is_literal(host):
+            return [host]
+        if not refresh and not self.expired(host):
+            return list(self._cache[host][0])
+        self.lookups += 1
+        try:
+            ips = list(self.lookup(host))
+        except (OSError, UnicodeError):
+            ips = []
+        if ips:
+            self._cache[host] = (tuple(ips), self.clock() + self.ttl)
+            return ips
+        stale = self._cache.get(host)
+        # Keep serving the previous answer while DNS is unreachable
+        self._cache[host] = (stale[0] if stale else (), self.clock() + self.negative_ttl)
+        return list(self._cache[host][0])
+
+    def invalidate(self, host=None):
+        if host is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(host, None)
+
+
+default = Resolver()
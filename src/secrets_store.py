@@ -30,6 +30,12 @@ def key_path(profile_name):
     return KEY_DIR / f"{_sanitize_profile_name(profile_name)}.key"
 
 
+def pending_key_path(profile_name):
+    """Where set_private_keys() puts a key that replaces one later."""
+    path = key_path(profile_name)
+    return path.with_name(path.name + ".new")
+
+
 def _sudo_run(args, sudo_pwd, input_data=None):
     def run(cmd, data):
         return subprocess.run(
@@ -132,6 +138,78 @@ def set_private_key(profile_name, private_key, sudo_pwd):
     return True, None
 
 
+def set_private_keys(keys, sudo_pwd, pending=()):
+    """
+    Stores {profile_name: private_key} with a single privileged write. Each
+    key goes to a temporary file first and the files are renamed into place
+    only once all of them were written, so a failure stores nothing. Keys of
+    the profiles in `pending` go to pending_key_path() instead and replace
+    the current key only with swap_private_keys(), so the caller can still
+    back out.
+    """
+    lines = []
+    for profile_name, private_key in keys.items():
+        if isinstance(private_key, bytes):
+            private_key = private_key.decode()
+        private_key = (private_key or "").strip()
+        if not private_key:
+            return False, "Private key is required"
+        if any(c.isspace() for c in private_key):
+            return False, "Bad private key"
+        path = pending_key_path(profile_name) if profile_name in pending else key_path(profile_name)
+        lines.append(f"{path.name} {private_key}\n")
+    if not lines:
+        return True, None
+
+    # Files are moved by name from the stage's list, not with a glob: a
+    # glob skips dotfiles, so the key of a profile named ".work" would be
+    # dropped with the stage.
+    key_dir = shlex.quote(str(KEY_DIR))
+    script = (
+        "umask 077; "
+        f"mkdir -p {key_dir} && chmod 700 {key_dir} && chown root:root {key_dir} || exit 1; "
+        f"stage=$(mktemp -d {key_dir}/.import.XXXXXX) || exit 1; "
+        "while read -r name key; do "
+        "printf '%s\\n' \"$key\" > \"$stage/$name\" && printf '%s\\n' \"$name\" >> \"$stage/.names\" "
+        "|| { rm -rf \"$stage\"; exit 1; }; "
+        "done; "
+        "status=0; "
+        "while read -r name; do "
+        "chmod 600 \"$stage/$name\" && chown root:root \"$stage/$name\" || { status=1; break; }; "
+        "done < \"$stage/.names\"; "
+        "[ $status = 0 ] && while read -r name; do "
+        f"mv -f \"$stage/$name\" {key_dir}/\"$name\" || {{ status=1; break; }}; "
+        "done < \"$stage/.names\"; "
+        "rm -rf \"$stage\"; exit $status"
+    )
+    res, err = _sudo_run(["/bin/sh", "-c", script], sudo_pwd, input_data="".join(lines).encode())
+    if err:
+        return False, err
+    return True, None
+
+
+def swap_private_keys(profile_names, sudo_pwd):
+    """
+    Moves the pending keys of `profile_names` (see set_private_keys()) over
+    their current keys with a single privileged call.
+    """
+    names = [key_path(name).name for name in profile_names]
+    if not names:
+        return True, None
+    key_dir = shlex.quote(str(KEY_DIR))
+    script = (
+        "status=0; "
+        "while read -r name; do "
+        f"mv -f {key_dir}/\"$name.new\" {key_dir}/\"$name\" || status=1; "
+        "done; exit $status"
+    )
+    data = "".join(f"{name}\n" for name in names).encode()
+    res, err = _sudo_run(["/bin/sh", "-c", script], sudo_pwd, input_data=data)
+    if err:
+        return False, err
+    return True, None
+
+
 def get_private_key(profile_name, sudo_pwd, return_error=False):
     if not sudo_pwd:
         return (None, "NO_PASSWORD") if return_error else None
@@ -145,6 +223,35 @@ def get_private_key(profile_name, sudo_pwd, return_error=False):
     return (key, None) if return_error else key
 
 
+def get_private_keys(profile_names, sudo_pwd):
+    """
+    Reads the keys of many profiles with a single privileged call. Returns
+    ({profile_name: key}, error); profiles without a key are left out.
+    """
+    by_file = {key_path(name).name: name for name in profile_names}
+    if not by_file:
+        return {}, None
+    if not sudo_pwd:
+        return {}, "NO_PASSWORD"
+    key_dir = shlex.quote(str(KEY_DIR))
+    script = (
+        "while read -r name; do "
+        f"[ -f {key_dir}/\"$name\" ] && printf '%s %s\\n' \"$name\" \"$(cat {key_dir}/\"$name\")\"; "
+        "done; exit 0"
+    )
+    data = "".join(f"{name}\n" for name in by_file).encode()
+    res, err = _sudo_run(["/bin/sh", "-c", script], sudo_pwd, input_data=data)
+    if err:
+        return {}, err
+    keys = {}
+    for line in res.stdout.decode(errors="ignore").splitlines():
+        name, _, key = line.partition(" ")
+        key = key.strip()
+        if name in by_file and key:
+            keys[by_file[name]] = key
+    return keys, None
+
+
 def delete_private_key(profile_name, sudo_pwd):
     path = key_path(profile_name)
     if os.geteuid() == 0:
@@ -162,6 +269,32 @@ def delete_private_key(profile_name, sudo_pwd):
     return True, None
 
 
+def delete_private_keys(profile_names, sudo_pwd, pending=()):
+    """
+    Deletes the keys of `profile_names` and the pending keys of `pending`
+    with a single privileged call.
+    """
+    paths = [str(key_path(name)) for name in profile_names]
+    paths += [str(pending_key_path(name)) for name in pending]
+    if not paths:
+        return True, None
+    if os.geteuid() == 0:
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                return False, str(e)
+        return True, None
+    if not sudo_pwd:
+        return False, "NO_PASSWORD"
+    res, err = _sudo_run(["/bin/rm", "-f"] + paths, sudo_pwd)
+    if err:
+        return False, err
+    return True, None
+
+
 # ---- Legacy encrypted store (read-only, for migration) ----
 
 def _legacy_secret_path(profile_name):
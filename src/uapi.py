@@ -0,0 +1,368 @@
+import base64
+import os
+import select
+import socket
+import subprocess
+import threading
+import time
+
+import keepalive
+import resolver
+from profile_model import Profile
+
+# Cross-platform userspace API of wireguard-go (and the kernel-less backends):
+# https://www.wireguard.com/xplatform/
+SOCKET_DIR = '/var/run/wireguard'
+
+
+class UapiError(Exception):
+    def __init__(self, message, errno=None):
+        super().__init__(message)
+        self.errno = errno
+
+
+def socket_path(interface_name):
+    return os.path.join(SOCKET_DIR, f'{interface_name}.sock')
+
+
+# wireguard-go's socket is root-only and stays that way: without access the
+# requests go through one long-lived helper started under sudo, so a request
+# costs a pipe round trip rather than a sudo and interpreter start. sudo -S
+# takes the password from the first stdin line; when sudo has cached
+# credentials that line reaches the helper, which skips everything up to the
+# RELAY line. It only reaches sockets of SOCKET_DIR (argv[1]).
+# Frames: "<interface>\t<timeout>\t<size>\n" + request, answered by
+# "ok|err\t<size>\n" + reply or error message.
+RELAY = (
+    "import os, socket, sys\n"
+    "inp, out = sys.stdin.buffer, sys.stdout.buffer\n"
+    "for line in inp:\n"
+    "    if line == b'RELAY\\n':\n"
+    "        break\n"
+    "out.write(b'ready\\n')\n"
+    "out.flush()\n"
+    "for head in inp:\n"
+    "    name, timeout, size = head.decode().rstrip('\\n').split('\\t')\n"
+    "    request = inp.read(int(size))\n"
+    "    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)\n"
+    "    try:\n"
+    "        if '/' in name or name.startswith('.'):\n"
+    "            raise OSError('bad interface name')\n"
+    "        s.settimeout(float(timeout))\n"
+    "        s.connect(os.path.join(sys.argv[1], name + '.sock'))\n"
+    "        s.sendall(request)\n"
+    "        data = b''\n"
+    "        while not data.endswith(b'\\n\\n'):\n"
+    "            chunk = s.recv(65536)\n"
+    "            if not chunk:\n"
+    "                break\n"
+    "            data += chunk\n"
+    "        status = b'ok'\n"
+    "    except OSError as e:\n"
+    "        data, status = str(e).encode(), b'err'\n"
+    "    finally:\n"
+    "        s.close()\n"
+    "    out.write(status + b'\\t' + str(len(data)).encode() + b'\\n' + data)\n"
+    "    out.flush()\n"
+)
+
+
+class _Relay:
+    """
+    The privileged helper of one sudo password. Requests are serialized, so
+    the supervisor loop and its race worker can share it.
+    """
+
+    def __init__(self, sudo_pwd, timeout=10.0):
+        self.sudo_pwd = sudo_pwd
+        self.lock = threading.Lock()
+        self.buffer = b''
+        self.closed = False
+        self.proc = subprocess.Popen(['/usr/bin/sudo', '-S', '-p', '', '/usr/bin/python3', '-c', RELAY, SOCKET_DIR],
+                                     stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.DEVNULL,
+                                     bufsize=0)
+        try:
+            self.proc.stdin.write((sudo_pwd + '\n').encode() + b'RELAY\n')
+            if self._read_line(time.monotonic() + timeout) != b'ready':
+                raise UapiError('UAPI relay did not start')
+        except (OSError, UapiError):
+            self.close()
+            raise UapiError('UAPI relay could not be started (sudo failed?)')
+
+    def _read_line(self, deadline):
+        while b'\n' not in self.buffer:
+            self._fill(deadline)
+        line, _, self.buffer = self.buffer.partition(b'\n')
+        return line
+
+    def _read_exact(self, size, deadline):
+        while len(self.buffer) < size:
+            self._fill(deadline)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def _fill(self, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not select.select([self.proc.stdout], [], [], remaining)[0]:
+            raise UapiError('UAPI relay timed out')
+        chunk = os.read(self.proc.stdout.fileno(), 65536)
+        if not chunk:
+            raise UapiError('UAPI relay exited')
+        self.buffer += chunk
+
+    def alive(self):
+        return not self.closed and self.proc.poll() is None
+
+    def exchange(self, interface_name, request, timeout):
+        data = request.encode()
+        with self.lock:
+            try:
+                self.proc.stdin.write(f'{interface_name}\t{timeout}\t{len(data)}\n'.encode() + data)
+                deadline = time.monotonic() + timeout + 5
+                status, _, size = self._read_line(deadline).partition(b'\t')
+                reply = self._read_exact(int(size), deadline)
+            except (OSError, ValueError, UapiError) as e:
+                # Out of step with the helper: start a new one next time
+                self.close()
+                raise UapiError(f'{interface_name}: UAPI relay failed: {e}')
+        if status != b'ok':
+            raise UapiError(f'{interface_name}: UAPI relay failed: {reply.decode(errors="ignore")}')
+        return reply
+
+    def close(self):
+        self.closed = True
+        for pipe in (self.proc.stdin, self.proc.stdout):
+            try:
+                pipe.close()
+            except OSError:
+                pass
+        # Without input the helper exits; sudo passes its status on
+        try:
+            self.proc.wait(1)
+        except subprocess.TimeoutExpired:
+            pass
+
+
+_relay = None
+_relay_lock = threading.Lock()
+
+
+def _accessible(path):
+    return os.access(path, os.R_OK | os.W_OK)
+
+
+def available(interface_name, sudo_pwd=None):
+    """
+    True when the device's socket can be reached: directly, or with
+    `sudo_pwd` (which may be empty for passwordless sudo) through the relay.
+    """
+    path = socket_path(interface_name)
+    return os.path.exists(path) and (sudo_pwd is not None or _accessible(path))
+
+
+def key_to_hex(key):
+    raw = base64.b64decode((key or '').strip(), validate=True)
+    if len(raw) != 32:
+        raise ValueError('Bad key length')
+    return raw.hex()
+
+
+def hex_to_key(value):
+    return base64.b64encode(bytes.fromhex(value)).decode()
+
+
+def resolve_endpoint(endpoint):
+    """
+    UAPI only accepts numeric endpoints: resolves "host:port" to "ip:port"
+    (or "[ip6]:port") through the shared resolver cache.
+    """
+    host, port = resolver.split_endpoint(endpoint)
+    if not host or port is None:
+        raise ValueError(f'Bad endpoint: {endpoint}')
+    ips = resolver.default.resolve(host)
+    if not ips:
+        raise ValueError(f'Failed to resolve endpoint: {endpoint}')
+    return resolver.format_endpoint(ips[0], port)
+
+
+def _exchange(interface_name, request, timeout):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(socket_path(interface_name))
+        sock.sendall(request.encode())
+        data = b''
+        while not data.endswith(b'\n\n'):
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    finally:
+        sock.close()
+    return data
+
+
+def _exchange_sudo(interface_name, request, timeout, sudo_pwd):
+    global _relay
+    with _relay_lock:
+        if _relay is None or _relay.sudo_pwd != sudo_pwd or not _relay.alive():
+            if _relay is not None:
+                _relay.close()
+            _relay = None
+            _relay = _Relay(sudo_pwd)
+        relay = _relay
+    return relay.exchange(interface_name, request, timeout)
+
+
+def _transact(interface_name, request, timeout=5.0, sudo_pwd=None):
+    if sudo_pwd is not None and not _accessible(socket_path(interface_name)):
+        data = _exchange_sudo(interface_name, request, timeout, sudo_pwd)
+    else:
+        data = _exchange(interface_name, request, timeout)
+    pairs = []
+    errno = None
+    for line in data.decode(errors='ignore').splitlines():
+        key, sep, value = line.partition('=')
+        if not sep:
+            continue
+        if key == 'errno':
+            errno = int(value)
+        else:
+            pairs.append((key, value))
+    if errno is None:
+        raise UapiError(f'No reply from {interface_name}')
+    if errno != 0:
+        raise UapiError(f'{interface_name}: UAPI error {errno}', errno)
+    return pairs
+
+
+def _peer_lines(peer):
+    lines = [f"public_key={key_to_hex(peer['public_key'])}"]
+    if peer.get('remove'):
+        lines.append('remove=true')
+        return lines
+    if peer.get('update_only'):
+        lines.append('update_only=true')
+    if 'preshared_key' in peer:
+        psk = peer['preshared_key']
+        lines.append(f"preshared_key={key_to_hex(psk) if psk else '0' * 64}")
+    if peer.get('endpoint'):
+        lines.append(f"endpoint={peer['endpoint']}")
+    if peer.get('persistent_keepalive') is not None:
+        lines.append(f"persistent_keepalive_interval={int(peer['persistent_keepalive'])}")
+    if 'allowed_ips' in peer:
+        lines.append('replace_allowed_ips=true')
+        lines += [f'allowed_ip={ip}' for ip in peer['allowed_ips']]
+    return lines
+
+
+def set_device(interface_name, private_key=None, listen_port=None, fwmark=None,
+               replace_peers=False, peers=(), sudo_pwd=None):
+    """
+    Sends one `set=1` transaction. Each peer is a dict with `public_key`
+    (base64) and optionally `remove`, `update_only`, `preshared_key`,
+    `endpoint` (numeric), `persistent_keepalive` and `allowed_ips` (replaces
+    the peer's list).
+    """
+    lines = ['set=1']
+    if private_key is not None:
+        lines.append(f'private_key={key_to_hex(private_key)}')
+    if listen_port is not None:
+        lines.append(f'listen_port={int(listen_port)}')
+    if fwmark is not None:
+        lines.append(f'fwmark={int(fwmark or 0)}')
+    if replace_peers:
+        lines.append('replace_peers=true')
+    for peer in peers:
+        lines += _peer_lines(peer)
+    _transact(interface_name, '\n'.join(lines) + '\n\n', sudo_pwd=sudo_pwd)
+
+
+def get_device(interface_name, sudo_pwd=None):
+    """
+    Returns the device state as a dict; keys are base64 and peers a list of
+    dicts in UAPI order.
+    """
+    device = {'peers': []}
+    peer = None
+    for key, value in _transact(interface_name, 'get=1\n\n', sudo_pwd=sudo_pwd):
+        if key == 'public_key':
+            peer = {'public_key': hex_to_key(value), 'allowed_ips': []}
+            device['peers'].append(peer)
+        elif peer is None:
+            if key == 'private_key':
+                device['private_key'] = hex_to_key(value)
+            elif key in ('listen_port', 'fwmark'):
+                device[key] = int(value)
+        elif key == 'preshared_key':
+            peer['preshared_key'] = hex_to_key(value) if value.strip('0') else ''
+        elif key == 'allowed_ip':
+            peer['allowed_ips'].append(value)
+        elif key == 'endpoint':
+            peer['endpoint'] = value
+        elif value.isdigit():
+            peer[key] = int(value)
+    return device
+
+
+def profile_peers(profile):
+    peers = []
+    for peer in Profile.coerce(profile).peers:
+        entry = {
+            'public_key': peer.key,
+            'preshared_key': peer.preshared_key,
+            'persistent_keepalive': keepalive.peer_interval(peer),
+            'allowed_ips': list(peer.allowed_ips),
+        }
+        if peer.endpoint:
+            entry['endpoint'] = resolve_endpoint(peer.endpoint)
+        peers.append(entry)
+    return peers
+
+
+def configure(interface_name, profile, private_key, sudo_pwd=None):
+    """
+    Equivalent of `wg setconf` with the profile's generated config.
+    """
+    profile = Profile.coerce(profile)
+    set_device(interface_name,
+               private_key=private_key,
+               listen_port=profile.listen_port,
+               fwmark=profile.routing_table or 0,
+               replace_peers=True,
+               peers=profile_peers(profile),
+               sudo_pwd=sudo_pwd)
+
+
+def update_peer(interface_name, peer, sudo_pwd=None):
+    """
+    Updates one profile peer in place, leaving the other peers untouched.
+    """
+    entry = profile_peers({'peers': [peer]})[0]
+    entry['update_only'] = True
+    set_device(interface_name, peers=[entry], sudo_pwd=sudo_pwd)
+
+
+def remove_peer(interface_name, public_key, sudo_pwd=None):
+    set_device(interface_name, peers=[{'public_key': public_key, 'remove': True}], sudo_pwd=sudo_pwd)
+
+
+def status(interface_name, sudo_pwd=None):
+    """
+    Device stats in the shape of `interface.parse_wg_dump()`.
+    """
+    device = get_device(interface_name, sudo_pwd=sudo_pwd)
+    peers = []
+    for peer in device['peers']:
+        handshake = peer.get('last_handshake_time_sec', 0)
+        peers.append({
+            'public_key': peer['public_key'],
+            'rx': peer.get('rx_bytes', 0),
+            'tx': peer.get('tx_bytes', 0),
+            'latest_handshake': handshake,
+            'up': handshake > 0,
+        })
+    peers.sort(key=lambda x: not x['up'])
+    return {'my_privkey': device.get('private_key', '(none)'), 'peers': peers}
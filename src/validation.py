@@ -0,0 +1,191 @@
+import base64
+import binascii
+import functools
+from collections import namedtuple
+from ipaddress import ip_network
+
+import keepalive
+from profile_model import CLIENT, KINDS, SERVER
+
+# One problem of a profile. `peer` is the index into `peers` for peer fields
+# and None for profile fields; `message` is ready to show.
+FieldError = namedtuple('FieldError', 'field peer message')
+
+KEY_LENGTH = 44
+# Peers per profile the caches are sized for (a peer takes at least a key and
+# a prefix in the shared caches). Memoizing a larger profile, a hub whose
+# peers are all different, would only evict every entry again, so its peers
+# are checked without the caches.
+PEER_CACHE_SIZE = 2048
+
+
+def _split_csv(val):
+    return [x.strip() for x in str(val or "").split(",") if x.strip()]
+
+
+def _key_error(value):
+    if len(value) != KEY_LENGTH:
+        return 'length'
+    try:
+        raw = base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        return 'encoding'
+    return None if len(raw) == 32 else 'encoding'
+
+
+def _network_error(value):
+    try:
+        ip_network(value, strict=False)
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+@functools.lru_cache(maxsize=2 * PEER_CACHE_SIZE)
+def check_key(value):
+    """
+    None for a base64 WireGuard key, else 'length' or 'encoding'.
+    """
+    return _key_error(value)
+
+
+@functools.lru_cache(maxsize=2 * PEER_CACHE_SIZE)
+def check_network(value):
+    """
+    None for an address or prefix `ip_network()` takes, else its error.
+    """
+    return _network_error(value)
+
+
+def _peer_errors(name, key, endpoint, endpoints, preshared_key, keepalive_value, allowed, excluded,
+                 require_endpoint=True, check_key=check_key, check_network=check_network):
+    # Returns ((field, message), ...).
+    found = []
+    if not name:
+        found.append(('name', 'Peer name is incomplete'))
+    key_error = check_key(key)
+    if key_error == 'length':
+        found.append(('key', f'Peer key ({name}) must be exactly 44 bytes long'))
+    elif key_error:
+        found.append(('key', f'Bad peer ({name}) key'))
+    if (endpoint or require_endpoint) and ':' not in endpoint:
+        found.append(('endpoint', f'Bad endpoint ({name}) -- missing ":"'))
+    for alt_endpoint in endpoints.replace(',', ' ').split():
+        if ':' not in alt_endpoint:
+            found.append(('endpoints', f'Bad alternative endpoint ({name}) -- missing ":": {alt_endpoint}'))
+    if preshared_key:
+        preshared_error = check_key(preshared_key)
+        if preshared_error == 'length':
+            found.append(('presharedKey', f'Preshared key ({name}) must be exactly 44 bytes long'))
+        elif preshared_error:
+            found.append(('presharedKey', f'Bad peer ({name}) preshared key'))
+    keepalive_error = keepalive.validate(keepalive_value)
+    if keepalive_error:
+        found.append(('keepalive', f'Bad peer ({name}) keepalive: {keepalive_error}'))
+    for prefix in _split_csv(allowed):
+        error = check_network(prefix)
+        if error:
+            found.append(('allowed_prefixes', f'Bad peer ({name}) prefix {prefix}: {error}'))
+    for prefix in _split_csv(excluded):
+        error = check_network(prefix)
+        if error:
+            found.append(('excluded_prefixes', f'Bad peer ({name}) excluded prefix {prefix}: {error}'))
+    return tuple(found)
+
+
+# Peers repeat across the configs of one provider, so a whole peer is
+# checked once
+_check_peer = functools.lru_cache(maxsize=PEER_CACHE_SIZE)(_peer_errors)
+
+
+def check_peer(peer, index=None, require_endpoint=True, cached=True):
+    def text(field):
+        return str(peer.get(field) or '').strip()
+
+    args = (text('name'), text('key'), text('endpoint'), text('endpoints'), text('presharedKey'),
+            keepalive.normalize(peer.get('keepalive')), text('allowed_prefixes'),
+            text('excluded_prefixes'), require_endpoint)
+    if cached:
+        found = _check_peer(*args)
+    else:
+        found = _peer_errors(*args, check_key=_key_error, check_network=_network_error)
+    return [FieldError(field, index, message) for field, message in found]
+
+
+def check_profile(fields, require_key=True):
+    """
+    Every problem of one profile in a single pass. `fields` are the
+    `save_profile()` fields (ip_address, private_key, extra_routes,
+    dns_servers, peers, mtu, kind, listen_port); an empty private key is only
+    reported with `require_key`. Returns a list of FieldError in field order.
+    """
+    errors = []
+    kind = str(fields.get('kind') or CLIENT).strip().lower()
+    if kind not in KINDS:
+        errors.append(FieldError('kind', None, f'Bad profile kind {kind}'))
+    server = kind == SERVER
+    private_key = str(fields.get('private_key') or '').strip()
+    if private_key:
+        key_error = check_key(private_key)
+        if key_error == 'length':
+            errors.append(FieldError('private_key', None, 'Private key must be exactly 44 bytes long'))
+        elif key_error:
+            errors.append(FieldError('private_key', None, 'Bad private key'))
+    elif require_key:
+        errors.append(FieldError('private_key', None, 'Private key is required'))
+
+    addresses = _split_csv(fields.get('ip_address'))
+    if not addresses:
+        errors.append(FieldError('ip_address', None, 'Address is required in [Interface]'))
+    for addr in addresses:
+        error = check_network(addr)
+        if error:
+            errors.append(FieldError('ip_address', None, f'Bad ip address {addr}: {error}'))
+
+    listen_port = str(fields.get('listen_port') or '').strip()
+    if listen_port and not (listen_port.isdigit() and 1 <= int(listen_port) <= 65535):
+        errors.append(FieldError('listen_port', None, f'Bad listen port {listen_port}: must be 1-65535'))
+    elif server and not listen_port:
+        errors.append(FieldError('listen_port', None, 'Listen port is required for a server profile'))
+
+    # A set, so a server with thousands of peers is checked in linear time
+    peers = fields.get('peers') or []
+    cached = len(peers) <= PEER_CACHE_SIZE
+    keys = set()
+    for index, peer in enumerate(peers):
+        errors += check_peer(peer, index, require_endpoint=not server, cached=cached)
+        key = str(peer.get('key') or '').strip()
+        if key and key in keys:
+            errors.append(FieldError('key', index, f"Duplicate peer ({peer.get('name') or index}) key"))
+        keys.add(key)
+
+    for route in _split_csv(fields.get('extra_routes')):
+        error = check_network(route)
+        if error:
+            errors.append(FieldError('extra_routes', None, f'Bad route {route}: {error}'))
+    for dns in _split_csv(fields.get('dns_servers')):
+        error = check_network(dns)
+        if error:
+            errors.append(FieldError('dns_servers', None, f'Bad dns {dns}: {error}'))
+
+    mtu = str(fields.get('mtu') or '').strip().lower()
+    if mtu and mtu != 'auto':
+        minimum = 1280 if any(':' in addr for addr in addresses) else 576
+        if not mtu.isdigit():
+            errors.append(FieldError('mtu', None, f'Bad MTU {mtu}: must be a number or "auto"'))
+        elif not minimum <= int(mtu) <= 9000:
+            errors.append(FieldError('mtu', None, f'Bad MTU {mtu}: must be between {minimum} and 9000'))
+    return errors
+
+
+def check_profiles(profiles, require_key=True):
+    """
+    `check_profile()` for a batch; the caches are shared, so repeated
+    keys, prefixes and peers are checked once. Returns one list per profile.
+    """
+    return [check_profile(fields, require_key) for fields in profiles]
+
+
+def normalize_peers(peers):
+    for peer in peers:
+        peer['keepalive'] = keepalive.normalize(peer.get('keepalive'))
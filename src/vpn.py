@@ -7,13 +7,20 @@ import zipfile
 import re
 import ctypes
 import urllib.parse
+import time
 
 import interface
-import daemon
 import secrets_store
+import policy_routing
+import capabilities
+import metrics
+import import_pipeline
+import profile_export
+import profile_model
+import conf_parser
+import validation
 from wg_config import build_config
 
-from ipaddress import ip_network
 from pathlib import Path
 
 from vendor_paths import resolve_vendor_binary
@@ -192,26 +199,45 @@ class Vpn:
             return None
         return (self._sudo_pwd + '\n').encode()
 
-    def can_use_kernel_module(self):
+    def can_use_kernel_module(self, refresh=False):
+        return bool(capabilities.cached('kernel_module', self._probe_kernel_module, refresh))
+
+    def _probe_kernel_module(self):
         if not Path('/usr/bin/sudo').exists():
             return False
+
+        def sudo_ip(args, check):
+            return subprocess.run(self._sudo_cmd() + ['ip', 'link'] + args + ['test_wg0', 'type', 'wireguard'],
+                                  input=self._sudo_input(),
+                                  stdout=subprocess.PIPE,
+                                  stderr=subprocess.PIPE,
+                                  check=check,
+                                  timeout=3)
         try:
-            subprocess.run(self._sudo_cmd() + ['ip', 'link', 'del', 'test_wg0', 'type', 'wireguard'],
-                           input=self._sudo_input(),
-                           check=False,
-                           timeout=3)
-            subprocess.run(self._sudo_cmd() + ['ip', 'link', 'add', 'test_wg0', 'type', 'wireguard'],
-                           input=self._sudo_input(),
-                           check=True,
-                           timeout=3)
-            subprocess.run(self._sudo_cmd() + ['ip', 'link', 'del', 'test_wg0', 'type', 'wireguard'],
-                           input=self._sudo_input(),
-                           check=False,
-                           timeout=3)
-        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError):
+            sudo_ip(['del'], False)
+            sudo_ip(['add'], True)
+            sudo_ip(['del'], False)
+        except subprocess.CalledProcessError as e:
+            err = (e.stderr or b'').decode(errors='ignore').lower()
+            if 'password' in err or 'sorry' in err:
+                # sudo refused, the module state is still unknown
+                return None
+            return False
+        except subprocess.TimeoutExpired:
+            return None
+        except OSError:
             return False
         return True
 
+    def get_capabilities(self, refresh=False):
+        self.can_use_kernel_module(refresh)
+        capabilities.resolvectl_path(refresh)
+        capabilities.firewall_tools(refresh)
+        capabilities.has_ipv6(refresh)
+        if self.interface:
+            self.interface.check_userspace_binary(refresh)
+        return capabilities.snapshot()
+
     def _disconnect_other_interfaces(self, keep_interface):
         if not self.interface:
             return
@@ -258,22 +284,40 @@ class Vpn:
             self._migrate_profile_secret(path.parent.name, profiles[path.parent.name], existing_keys=existing_keys)
         return profiles
 
-    def _write_profile(self, profile_name, profile):
+    def _load_profile(self, profile_name):
+        """
+        The saved profile as a profile_model.Profile, parsed once per change
+        of its file. Raises ProfileError when it does not parse.
+        """
+        return profile_model.load(PROFILES_DIR / profile_name / 'profile.json')
+
+    def _stage_profile(self, profile_name, profile):
+        """
+        Writes profile.json.tmp next to the profile file and returns its path;
+        renaming it over profile.json makes the write atomic.
+        """
         profile_dir = PROFILES_DIR / profile_name
         profile_dir.mkdir(exist_ok=True, parents=True)
-        profile_file = profile_dir / 'profile.json'
+        tmp_file = profile_dir / 'profile.json.tmp'
         data = dict(profile)
         data.pop("private_key", None)
-        with profile_file.open('w') as fd:
-            json.dump(data, fd, indent=4, sort_keys=True)
+        # Lets imports recognise a config that is already stored
         try:
-            os.chmod(profile_dir, 0o700)
-        except Exception:
-            pass
+            data["content_hash"] = profile_model.Profile(data).content_hash
+        except profile_model.ProfileError:
+            data.pop("content_hash", None)
+        fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=4, sort_keys=True)
         try:
-            os.chmod(profile_file, 0o600)
+            os.chmod(profile_dir, 0o700)
         except Exception:
             pass
+        return tmp_file
+
+    def _write_profile(self, profile_name, profile):
+        tmp_file = self._stage_profile(profile_name, profile)
+        os.replace(tmp_file, tmp_file.with_name('profile.json'))
 
     def _migrate_profile_secret(self, profile_name, data, existing_keys=None):
         if not data:
@@ -305,8 +349,12 @@ class Vpn:
         if existing_keys is not None:
             existing_keys.add(profile_name)
         if "private_key" in data:
-            data.pop("private_key", None)
-            self._write_profile(profile_name, data)
+            # `data` may be the read-only cached model: rewrite a plain copy
+            stored = dict(profile_model.plain(data))
+            stored.pop("private_key", None)
+            if isinstance(data, dict):
+                data.pop("private_key", None)
+            self._write_profile(profile_name, stored)
         try:
             key_file = PROFILES_DIR / profile_name / "privkey"
             if key_file.exists():
@@ -437,28 +485,177 @@ class Vpn:
 
         return profile
 
-    def _connect(self, profile_name,  use_kmod, safe_preup=True):
+    def _prepare_multi_tunnel(self, profile_name, profile):
+        """
+        Assigns the profile its own routing table/fwmark and checks its routes
+        against the tunnels that are already up. Returns an error or None.
+        """
+        try:
+            active_ifaces = set(self.interface.list_wireguard_interfaces())
+        except Exception:
+            active_ifaces = set()
+        profiles = self._load_profiles()
+        others = []
+        for name, data in profiles.items():
+            if name == profile_name:
+                continue
+            if data.get('interface_name') in active_ifaces:
+                data.setdefault('profile_name', name)
+                others.append(data)
+
+        endpoint_ips = {}
+        for data in [profile] + others:
+            for peer in data.get('peers', []):
+                if peer.get('endpoint'):
+                    endpoint_ips[data.get('profile_name')] = self.interface._resolve_endpoint_ips(peer['endpoint'])
+                    break
+        conflicts = policy_routing.find_conflicts(profile, others, endpoint_ips)
+        if conflicts:
+            return "Route conflict: " + "; ".join(conflicts[:3])
+
+        used = {data.get('routing_table') for data in others if data.get('routing_table')}
+        table = policy_routing.allocate_table(profile.get('routing_table'), used)
+        if not table:
+            return "No free routing table for another tunnel"
+        if table != profile.get('routing_table'):
+            profile['routing_table'] = table
+            self._write_profile(profile_name, profile)
+        return None
+
+    def _store_error_message(self, err):
+        if err == "NO_PASSWORD":
+            return "Password is required to store private key"
+        if err == "BAD_PASSWORD":
+            return "Wrong password. Re-open the app and enter the correct password."
+        return f"Secret storage error: {err}"
+
+    def _key_error_message(self, err):
+        if err == "BAD_PASSWORD":
+            return "Wrong password. Re-open the app and enter the correct password."
+        if err == "NO_PASSWORD":
+            return "Password is required to access private keys."
+        if err == "STORE_FAILED":
+            return "Failed to store private key."
+        return "Private key not available."
+
+    def _connect(self, profile_name,  use_kmod, safe_preup=True, multi_tunnel=False):
         try:
             self._require_interface()
             profile = self.get_profile(profile_name)
             key, err = self._get_private_key_status(profile_name, profile)
             if not key:
-                if err == "BAD_PASSWORD":
-                    return "Wrong password. Re-open the app and enter the correct password."
-                if err == "NO_PASSWORD":
-                    return "Password is required to access private keys."
-                if err == "STORE_FAILED":
-                    return "Failed to store private key."
-                return "Private key not available."
+                return self._key_error_message(err)
             profile = self._ensure_unique_interface_name(profile_name, profile)
-            self._disconnect_other_interfaces(profile.get('interface_name'))
+            if multi_tunnel:
+                err = self._prepare_multi_tunnel(profile_name, profile)
+                if err:
+                    return err
+            else:
+                self._disconnect_other_interfaces(profile.get('interface_name'))
+            # Parsed once per change of the profile, not on every connect
+            profile_with_key = self._load_profile(profile_name).replace(
+                interface_name=profile.get('interface_name'),
+                routing_table=profile.get('routing_table') if multi_tunnel else None,
+                private_key=key,
+                safe_preup=bool(safe_preup))
+            return self.interface._connect(profile_with_key, PROFILES_DIR / profile_name / 'config.ini', use_kmod)
+        except Exception as e:
+            return str(e)
+
+    def connect(self, profile_name, use_kmod, safe_preup=True, multi_tunnel=False, wait_handshake=True, timeout=10):
+        """
+        `_connect` followed by an optional wait (up to `timeout` seconds) for
+        the first handshake, so "connected" means packets can flow. Servers
+        and profiles without any peer endpoint are not waited for: their
+        peers dial in, so nothing starts a handshake.
+        Returns {"error", "connect_ms", "handshake_ms", "waited"};
+        `handshake_ms` is the time from the start of the connect to the first
+        handshake, or None. Every attempt is recorded in the metrics, failed
+        ones with their error.
+        """
+        started = time.monotonic()
+        since = time.time()
+        err = self._connect(profile_name, use_kmod, safe_preup, multi_tunnel)
+        res = {"error": err, "connect_ms": int((time.monotonic() - started) * 1000), "handshake_ms": None,
+               "waited": False}
+        if wait_handshake and not err:
+            try:
+                profile = self._load_profile(profile_name)
+                if not profile.is_server and profile.first_endpoint:
+                    res["waited"] = True
+                    if self.interface.wait_for_handshake(profile.interface_name, timeout, since):
+                        res["handshake_ms"] = int((time.monotonic() - started) * 1000)
+            except Exception:
+                pass
+        metrics.record('connect', profile=profile_name, backend='kmod' if use_kmod else 'userspace',
+                       connect_ms=res["connect_ms"], handshake_ms=res["handshake_ms"],
+                       waited=res["waited"], error=err, version=capabilities.app_version())
+        return res
+
+    def reload_profile(self, profile_name):
+        """
+        Applies the saved profile to its running userspace tunnel.
+        """
+        try:
+            self._require_interface()
+            profile = self.get_profile(profile_name)
+            key, err = self._get_private_key_status(profile_name, profile)
+            if not key:
+                return self._key_error_message(err)
             profile_with_key = dict(profile)
             profile_with_key["private_key"] = key
-            profile_with_key["safe_preup"] = bool(safe_preup)
-            return self.interface._connect(profile_with_key, PROFILES_DIR / profile_name / 'config.ini', use_kmod)
+            return self.interface.reload_userspace_profile(profile_with_key)
         except Exception as e:
             return str(e)
 
+    def switch_profile(self, from_profile, to_profile, use_kmod=True, safe_preup=True):
+        """
+        Switches the active tunnel from one profile to another. With the kernel
+        module the existing link is reused; otherwise (or when hooks have to
+        run) it falls back to a full reconnect.
+        Returns {"error", "switch_ms", "fast"}.
+        """
+        started = time.monotonic()
+
+        def result(err, fast, ms=None):
+            if ms is None:
+                ms = int((time.monotonic() - started) * 1000)
+            return {"error": err, "switch_ms": ms, "fast": fast}
+
+        try:
+            self._require_interface()
+            old = self.get_profile(from_profile)
+            new = self.get_profile(to_profile)
+        except Exception as e:
+            return result(str(e), False)
+
+        hooks = (old.get('pre_down'), old.get('post_down'), new.get('pre_up'), new.get('post_up'))
+        # A multi-tunnel link routes through its own table and `ip rule`s,
+        # which the in-place switch does not carry over.
+        tables = (old.get('routing_table'), new.get('routing_table'))
+        fast = (use_kmod
+                and not any((h or '').strip() for h in hooks)
+                and not any(self.interface.policy_rules_active(t) for t in tables)
+                and self.interface.interface_exists(old.get('interface_name')))
+        if fast:
+            try:
+                key, err = self._get_private_key_status(to_profile, new)
+                if not key:
+                    return result(self._key_error_message(err), False)
+                new = self._ensure_unique_interface_name(to_profile, new)
+                new_with_key = self._load_profile(to_profile).replace(
+                    interface_name=new.get('interface_name'),
+                    routing_table=None,
+                    private_key=key,
+                    safe_preup=bool(safe_preup))
+                old = self._load_profile(from_profile).replace(routing_table=None)
+                err, ms = self.interface.switch_profile(old, new_with_key, PROFILES_DIR / to_profile / 'config.ini')
+                if not err:
+                    return result(None, True, ms)
+            except Exception:
+                pass
+        return result(self._connect(to_profile, use_kmod, safe_preup), False)
+
     def cleanup_userspace(self):
         if not self.interface:
             return "VPN interface not initialized"
@@ -499,132 +696,261 @@ class Vpn:
             return stdout.decode().strip()
         return stderr.decode().strip()
 
-    def save_profile(self, profile_name, ip_address, private_key, interface_name, extra_routes, dns_servers, pre_up, post_up, pre_down, post_down, peers, existing_profiles=None, used_ifaces=None):
-        if '/' in profile_name:
-            return '"/" is not allowed in profile names'
-
-        private_key = (private_key or "").strip()
-        if existing_profiles is None:
-            existing_profiles = self._load_profiles()
-        use_existing_key = False
-        if not private_key:
-            if profile_name in existing_profiles and secrets_store.secret_exists(profile_name, self._sudo_pwd):
-                use_existing_key = True
-            else:
-                return 'Private key is required'
-        else:
-            if len(private_key) != 44:
-                return 'Peer key must be exactly 44 bytes long'
-
-            _pub = self.genpubkey(private_key)
-            if len(_pub) != 44:
-                return 'Bad private key: ' + _pub
-
-        def _split_csv(val):
-            return [x.strip() for x in str(val or "").split(",") if x.strip()]
-
-        ip_address = ip_address.strip()
-        if not ip_address:
-            return 'Address is required in [Interface]'
-
-        try:
-            for addr in _split_csv(ip_address):
-                ip_network(addr, strict=False)
-        except Exception as e:
-            return 'Bad ip address {}: {}'.format(addr, e)
+    def validate_profile(self, ip_address, extra_routes, dns_servers, peers, mtu=""):
+        """
+        Checks the profile fields that need no key store or subprocess.
+        Returns the first error message or None; peer `keepalive` values are
+        normalized in place.
+        """
+        errors = validation.check_profile({'ip_address': ip_address, 'extra_routes': extra_routes,
+                                           'dns_servers': dns_servers, 'peers': peers, 'mtu': mtu},
+                                          require_key=False)
+        if errors:
+            return errors[0].message
+        validation.normalize_peers(peers)
+        return None
 
+    def check_profile(self, fields):
+        """
+        All problems of the profile being edited, for live validation:
+        [{"field", "peer", "message"}], `peer` being the peer index or None.
+        The private key may stay empty for a saved profile.
+        """
+        name = str(fields.get('profile_name') or '').strip()
+        require_key = not name or not (PROFILES_DIR / name / 'profile.json').exists()
+        return [error._asdict() for error in validation.check_profile(fields, require_key)]
+
+    def _keep_wg_quick(self, stored, profile):
+        # wg-quick keys the editor has no field for survive an edit; peers
+        # are matched by key
+        if stored.get('wg_quick') and 'wg_quick' not in profile:
+            profile['wg_quick'] = dict(stored['wg_quick'])
+        kept = {str(peer.get('key') or '').strip(): peer['wg_quick']
+                for peer in stored.get('peers') or [] if peer.get('wg_quick')}
+        for peer in profile['peers']:
+            found = kept.get(str(peer.get('key') or '').strip())
+            if found and 'wg_quick' not in peer:
+                peer['wg_quick'] = dict(found)
+
+    def save_profile(self, profile_name, ip_address, private_key, interface_name, extra_routes, dns_servers,
+                     pre_up, post_up, pre_down, post_down, peers, mtu="", kind="", listen_port=""):
+        """
+        Saves one profile from the editor, which passes the fields
+        positionally. It goes through `save_profiles()`, so validation, key
+        handling and the stored form are the same as for bulk saves.
+        Returns the first error or None.
+        """
+        fields = {'profile_name': profile_name, 'ip_address': ip_address, 'private_key': private_key,
+                  'interface_name': interface_name, 'extra_routes': extra_routes,
+                  'dns_servers': dns_servers, 'pre_up': pre_up, 'post_up': post_up,
+                  'pre_down': pre_down, 'post_down': post_down, 'peers': peers,
+                  'mtu': mtu, 'kind': kind, 'listen_port': listen_port}
+        return self.save_profiles([fields])['results'][0]['error']
+
+    def _remove_legacy_files(self, profile_name):
+        for legacy in ("privkey", "config.ini"):
             try:
-                base64.b64decode(private_key)
-            except Exception as e:
-                return 'Bad private key'
+                legacy_path = (PROFILES_DIR / profile_name / legacy)
+                if legacy_path.exists():
+                    legacy_path.unlink()
+            except Exception:
+                pass
 
-        for peer in peers:
-            if not peer['name']:
-                return 'Peer name is incomplete'
+    def _commit_profiles(self, entries):
+        """
+        Writes [(profile_name, profile, private_key or None)] all or nothing:
+        profile files are staged first, every new key is stored with one
+        privileged write, then the staged files are renamed into place.
+        Keys replacing the key of an existing profile are stored as pending
+        keys and swapped in only after every rename succeeded. When a rename
+        or the swap fails the renames done so far are undone from hard link
+        backups and the stored keys are deleted again. Returns an error or
+        None.
+        """
+        staged = []
+        created = []
 
-            if len(peer['key']) != 44:
-                return 'Peer key ({name}) must be exactly 44 bytes long'.format_map(peer)
-            try:
-                base64.b64decode(peer['key'])
-            except Exception as e:
-                return 'Bad peer ({name}) key'.format_map(peer)
+        def rollback():
+            for tmp_file in staged:
+                try:
+                    tmp_file.unlink()
+                except OSError:
+                    pass
+            for profile_dir in created:
+                shutil.rmtree(profile_dir, ignore_errors=True)
 
-            if ':' not in peer['endpoint']:
-                return 'Bad endpoint ({name}) -- missing ":"'.format_map(peer)
+        try:
+            for profile_name, profile, _ in entries:
+                profile_dir = PROFILES_DIR / profile_name
+                if not profile_dir.exists():
+                    created.append(profile_dir)
+                staged.append(self._stage_profile(profile_name, profile))
+        except OSError as e:
+            rollback()
+            return f"Failed to write profiles: {e}"
+
+        keys = {profile_name: key for profile_name, _, key in entries if key}
+        new_keys = [profile_name for profile_name in keys if PROFILES_DIR / profile_name in created]
+        replaced_keys = [profile_name for profile_name in keys if profile_name not in new_keys]
+        if keys:
+            ok, err = secrets_store.set_private_keys(keys, self._sudo_pwd, pending=replaced_keys)
+            if not ok:
+                rollback()
+                return self._store_error_message(err)
 
-            if len(peer['presharedKey']) > 0 and len(peer['presharedKey']) != 44:
-                return 'Preshared key ({name}) must be exactly 44 bytes long'.format_map(peer)
-            try:
-                base64.b64decode(peer['presharedKey'])
-            except Exception as e:
-                return 'Bad peer ({name}) preshared key'.format_map(peer)
+        # (target, backup or None) per completed rename
+        renamed = []
 
-            allowed_prefixes = peer['allowed_prefixes']
-            for allowed_prefix in _split_csv(allowed_prefixes):
+        def undo_renames():
+            for target, backup in reversed(renamed):
                 try:
-                    ip_network(allowed_prefix, strict=False)
-                except Exception as e:
-                    return 'Bad peer ({name}) prefix '.format_map(peer) + allowed_prefix + ': ' + str(e)
-
-        if extra_routes:
-            for route in _split_csv(extra_routes):
+                    if backup:
+                        os.replace(backup, target)
+                    else:
+                        target.unlink()
+                except OSError:
+                    pass
+            # The files not renamed yet are still staged; a backup made for
+            # the one that failed is no longer needed
+            del staged[:len(renamed)]
+            if staged:
                 try:
-                    ip_network(route, strict=False)
-                except Exception as e:
-                    return 'Bad route ' + route + ': ' + str(e)
+                    staged[0].with_name('profile.json.bak').unlink()
+                except OSError:
+                    pass
+            rollback()
+            if keys:
+                secrets_store.delete_private_keys(new_keys, self._sudo_pwd, pending=replaced_keys)
 
-        if dns_servers:
-            for dns in _split_csv(dns_servers):
+        try:
+            for tmp_file in staged:
+                target = tmp_file.with_name('profile.json')
+                backup = None
+                if target.exists():
+                    backup = tmp_file.with_name('profile.json.bak')
+                    if backup.exists():
+                        backup.unlink()
+                    os.link(target, backup)
+                os.replace(tmp_file, target)
+                renamed.append((target, backup))
+        except OSError as e:
+            undo_renames()
+            return f"Failed to write profiles: {e}"
+        if replaced_keys:
+            ok, err = secrets_store.swap_private_keys(replaced_keys, self._sudo_pwd)
+            if not ok:
+                undo_renames()
+                return self._store_error_message(err)
+        for _, backup in renamed:
+            if backup:
                 try:
-                    ip_network(dns, strict=False)
-                except Exception as e:
-                    return 'Bad dns ' + dns + ': ' + str(e)
-
-        if used_ifaces is None:
-            used = set()
-            for name, data in existing_profiles.items():
-                if name == profile_name:
-                    continue
-                iface = data.get('interface_name')
-                if iface:
-                    used.add(iface)
-        else:
-            used = set(used_ifaces)
+                    backup.unlink()
+                except OSError:
+                    pass
+        for profile_name, _, _ in entries:
+            self._remove_legacy_files(profile_name)
+        return None
 
-        interface_name = self._unique_interface_name(interface_name or f"wg_{profile_name}", used)
-        if not use_existing_key:
-            ok, err = secrets_store.set_private_key(profile_name, private_key, self._sudo_pwd)
-            if not ok:
-                if err == "NO_PASSWORD":
-                    return "Password is required to store private key"
-                if err == "BAD_PASSWORD":
-                    return "Wrong password. Re-open the app and enter the correct password."
-                return f"Secret storage error: {err}"
+    def _prepare_profile(self, fields, existing_profiles, existing_keys, used_ifaces):
+        """
+        Validates one `save_profiles()` entry without side effects. Returns
+        (list of validation.FieldError, profile, private key to store or None).
+        """
+        profile_name = str(fields.get('profile_name') or '').strip()
+        if not profile_name:
+            return [validation.FieldError('profile_name', None, 'Profile name is required')], None, None
+        if '/' in profile_name:
+            return [validation.FieldError('profile_name', None, '"/" is not allowed in profile names')], None, None
 
+        private_key = (fields.get('private_key') or '').strip()
+        require_key = False
+        if not private_key:
+            known = secrets_store.key_path(profile_name).stem in existing_keys
+            require_key = profile_name not in existing_profiles or not (
+                known or secrets_store.secret_exists(profile_name, self._sudo_pwd))
+
+        errors = validation.check_profile(fields, require_key)
+        if errors:
+            return errors, None, None
+        peers = fields.get('peers') or []
+        validation.normalize_peers(peers)
+        mtu = fields.get('mtu')
+
+        interface_name = self._unique_interface_name(fields.get('interface_name') or f"wg_{profile_name}",
+                                                     used_ifaces)
+        used_ifaces.add(interface_name)
         profile = {'peers': peers,
-                   'ip_address': ip_address,
-                   'dns_servers': dns_servers,
-                   'extra_routes': extra_routes,
-                   'pre_up': pre_up,
-                   'post_up': post_up,
-                   'pre_down': pre_down,
-                   'post_down': post_down,
+                   'ip_address': fields['ip_address'].strip(),
+                   'dns_servers': fields.get('dns_servers') or '',
+                   'extra_routes': fields.get('extra_routes') or '',
+                   'pre_up': fields.get('pre_up') or '',
+                   'post_up': fields.get('post_up') or '',
+                   'pre_down': fields.get('pre_down') or '',
+                   'post_down': fields.get('post_down') or '',
                    'profile_name': profile_name,
                    'interface_name': interface_name,
                    }
-        self._write_profile(profile_name, profile)
-        if used_ifaces is not None:
-            used_ifaces.add(interface_name)
-        for legacy in ("privkey", "config.ini"):
-            try:
-                legacy_path = (PROFILES_DIR / profile_name / legacy)
-                if legacy_path.exists():
-                    legacy_path.unlink()
-            except Exception:
-                pass
+        mtu = str(mtu or "").strip().lower()
+        if mtu:
+            profile['mtu'] = mtu
+        if str(fields.get('kind') or '').strip().lower() == profile_model.SERVER:
+            profile['kind'] = profile_model.SERVER
+        if str(fields.get('listen_port') or '').strip():
+            profile['listen_port'] = int(str(fields['listen_port']).strip())
+        if isinstance(fields.get('wg_quick'), dict) and fields['wg_quick']:
+            profile['wg_quick'] = dict(fields['wg_quick'])
+        self._keep_wg_quick(existing_profiles.get(profile_name) or {}, profile)
+        return [], profile, private_key or None
+
+    def save_profiles(self, profiles):
+        """
+        Bulk `save_profile()`: `profiles` is a list of dicts with its argument
+        names (profile_name, ip_address, private_key, interface_name,
+        extra_routes, dns_servers, pre_up, post_up, pre_down, post_down,
+        peers, mtu). Everything is validated before anything is written, so
+        either all profiles are saved or none. Returns {"error", "results"}
+        with one {"profile_name", "error", "errors"} per entry; `errors` has
+        every problem as {"field", "peer", "message"}.
+        """
+        existing_profiles = self._load_profiles()
+        existing_keys = secrets_store.list_private_keys(self._sudo_pwd)
+        names = [str((fields or {}).get('profile_name') or '').strip() for fields in profiles]
+        # Interfaces of the profiles being replaced are free for them to keep
+        used_ifaces = {data.get('interface_name') for name, data in existing_profiles.items()
+                       if name not in names and data.get('interface_name')}
+
+        results = []
+        entries = []
+        seen = set()
+        for name, fields in zip(names, profiles):
+            if name and name in seen:
+                errors, profile, key = [validation.FieldError('profile_name', None,
+                                                              f'Duplicate profile name: {name}')], None, None
+            else:
+                errors, profile, key = self._prepare_profile(fields or {}, existing_profiles,
+                                                             existing_keys, used_ifaces)
+            seen.add(name)
+            results.append({'profile_name': name, 'error': errors[0].message if errors else None,
+                            'errors': [error._asdict() for error in errors]})
+            if not errors:
+                entries.append((name, profile, key))
+
+        failed = [result for result in results if result['error']]
+        if failed:
+            return {'error': f"{len(failed)} of {len(results)} profiles are invalid, nothing was saved",
+                    'results': results}
+        error = self._commit_profiles(entries)
+        if error:
+            for result in results:
+                result['error'] = error
+        return {'error': error, 'results': results}
 
     def import_conf(self, path):
-        imported_profiles = []
+        """
+        Imports a .conf or a zip of them through `import_pipeline`: every
+        file is reported in `results`, and one bad file no longer aborts the
+        others.
+        """
         existing_profiles = self._load_profiles()
         used_ifaces = set()
         for name, data in existing_profiles.items():
@@ -633,83 +959,7 @@ class Vpn:
                 used_ifaces.add(iface)
 
         try:
-            if path.endswith(".zip"):
-                with zipfile.ZipFile(path) as z:
-                    confs = [n for n in z.namelist() if n.endswith(".conf")]
-                    if not confs:
-                        return {"error": "No .conf in zip"}
-
-                    for conf_name in confs:
-                        try:
-                            raw = z.read(conf_name)
-                        except KeyError:
-                            continue
-                        text = raw.decode("utf-8", errors="ignore")
-                        default_name = os.path.splitext(os.path.basename(conf_name))[0] or "imported"
-
-                        profile_data = self._parse_wireguard_conf_lines(text.splitlines(), default_name)
-
-                        # profile_data = (profile_name, ip_address, private_key, iface, extra_routes, dns_servers, peers, pre_up, post_up, pre_down, post_down)
-                        profile_name = profile_data[0]
-                        ip_address = profile_data[1]
-                        private_key = profile_data[2]
-                        interface_name = profile_data[3]
-                        extra_routes = profile_data[4]
-                        dns_servers = profile_data[5]
-                        peers = profile_data[6]
-                        pre_up = profile_data[7] if len(profile_data) > 7 else ""
-                        post_up = profile_data[8] if len(profile_data) > 8 else ""
-                        pre_down = profile_data[9] if len(profile_data) > 9 else ""
-                        post_down = profile_data[10] if len(profile_data) > 10 else ""
-
-                        if not ip_address.strip():
-                            return {"error": f"{conf_name} is missing Address in [Interface]"}
-
-                        # generate unique profile name on conflict
-                        original_name = profile_name
-                        suffix = 1
-                        while (PROFILES_DIR / profile_name).exists():
-                            profile_name = f"{original_name}_{suffix}"
-                            suffix += 1
-                        interface_name = self._unique_interface_name(interface_name or f"wg_{profile_name}", used_ifaces)
-
-                        # Ignore PreUp/PostUp/PreDown/PostDown on import for safety
-                        pre_up = ""
-                        post_up = ""
-                        pre_down = ""
-                        post_down = ""
-                        error = self.save_profile(profile_name, ip_address, private_key, interface_name, extra_routes, dns_servers, pre_up, post_up, pre_down, post_down, peers, existing_profiles=existing_profiles, used_ifaces=used_ifaces)
-                        if error:
-                            return {"error": error}
-
-                        imported_profiles.append(profile_name)
-
-                return {"error": None, "profiles": imported_profiles}
-
-            else:
-                # plain single conf
-                profile_data = self.parse_wireguard_conf(path)
-                profile_name = profile_data[0]
-                ip_address = profile_data[1]
-                private_key = profile_data[2]
-                interface_name = profile_data[3]
-                extra_routes = profile_data[4]
-                dns_servers = profile_data[5]
-                peers = profile_data[6]
-                pre_up = ""
-                post_up = ""
-                pre_down = ""
-                post_down = ""
-
-                if not ip_address.strip():
-                    return {"error": "Config is missing Address in [Interface]"}
-
-                interface_name = self._unique_interface_name(interface_name or f"wg_{profile_name}", used_ifaces)
-                error = self.save_profile(profile_name, ip_address, private_key, interface_name, extra_routes, dns_servers, pre_up, post_up, pre_down, post_down, peers, existing_profiles=existing_profiles, used_ifaces=used_ifaces)
-                if error:
-                    return {"error": error}
-
-                return {"error": None, "profiles": [profile_name]}
+            return import_pipeline.run(self, path, used_ifaces)
         except FileNotFoundError:
             return {"error": "File not found"}
         except zipfile.BadZipFile:
@@ -717,123 +967,79 @@ class Vpn:
         except Exception as e:
             return {"error": str(e)}
 
+    def import_many(self, paths):
+        """
+        Imports files, zips and directories of them in one go (see
+        `import_pipeline.run_many()`): configs are stored in batches,
+        `importManyProgress` events report files read and configs found, and
+        each file gets its entry in `items`.
+        """
+        used_ifaces = set()
+        for data in self._load_profiles().values():
+            iface = data.get('interface_name')
+            if iface:
+                used_ifaces.add(iface)
 
+        try:
+            return import_pipeline.run_many(self, [str(path) for path in paths or []], used_ifaces)
+        except Exception as e:
+            return {"error": str(e)}
 
     def _sanitize_profile_name(self, name, fallback):
         cleaned = re.sub(r'[^A-Za-z0-9._-]+', '_', name).strip('_')
         return cleaned or fallback
 
-    def _parse_wireguard_conf_lines(self, lines, default_name):
+    def parse_conf(self, lines, default_name):
+        """
+        Parses a wg-quick config with `conf_parser` and maps it to profile
+        fields (the `save_profile()` argument names plus `wg_quick`, the
+        interface keys kept for export; peers carry their own). Returns
+        (fields, diagnostics).
+        """
+        parsed = conf_parser.parse(lines)
         profile_name = default_name
-        interface_name = f"wg_{profile_name}"
-
-        def _strip_inline_comment(val):
-            return re.sub(r'\s[;#].*$', '', val).strip()
-
-        def _split_csv(val):
-            return [x.strip() for x in str(val or "").split(",") if x.strip()]
-
+        if parsed.profile_name:
+            profile_name = self._sanitize_profile_name(parsed.profile_name, default_name)
         peers = []
-        current_peer = None
-
-        iface = {
-            "Address": [],
-            "DNS": [],
-            "PreUp": [],
-            "PostUp": [],
-            "PreDown": [],
-            "PostDown": [],
+        for i, peer in enumerate(parsed.peers, 1):
+            entry = {
+                "name": peer.name or f"Peer{i}",
+                "key": peer.public_key,
+                "allowed_prefixes": ", ".join(peer.allowed_ips),
+                "endpoint": peer.endpoint,
+                "presharedKey": peer.preshared_key,
+            }
+            if peer.excluded_ips:
+                entry["excluded_prefixes"] = ", ".join(peer.excluded_ips)
+            if peer.persistent_keepalive is not None:
+                entry["keepalive"] = peer.persistent_keepalive
+            if peer.extra:
+                entry["wg_quick"] = dict(peer.extra)
+            peers.append(entry)
+        wg_quick = parsed.wg_quick_extra()
+        listen_port = wg_quick.pop("ListenPort", "")
+        if listen_port == "0":
+            listen_port = ""
+        # A listening config with peers that dial in is a hub
+        server = bool(listen_port) and any(not peer["endpoint"] for peer in peers)
+        fields = {
+            "profile_name": profile_name,
+            "kind": profile_model.SERVER if server else profile_model.CLIENT,
+            "listen_port": listen_port,
+            "ip_address": ", ".join(parsed.addresses),
+            "private_key": parsed.private_key,
+            "interface_name": f"wg_{profile_name}",
+            "extra_routes": "",
+            "dns_servers": ", ".join(parsed.dns),
+            "peers": peers,
+            "pre_up": "\n".join(parsed.pre_up),
+            "post_up": "\n".join(parsed.post_up),
+            "pre_down": "\n".join(parsed.pre_down),
+            "post_down": "\n".join(parsed.post_down),
+            "mtu": str(parsed.mtu) if parsed.mtu is not None else "",
+            "wg_quick": wg_quick,
         }
-        for raw in lines:
-            line = raw.strip()
-            if not line:
-                continue
-            if line.startswith("#") or line.startswith(";"):
-                match = re.match(r"[#;]\s*Profile\s*=\s*(.+)", line, re.IGNORECASE)
-                if match:
-                    profile_name = self._sanitize_profile_name(match.group(1).strip(), default_name)
-                    interface_name = f"wg_{profile_name}"
-                continue
-
-            lower = line.lower()
-            if lower == "[interface]":
-                current_peer = None
-                continue
-
-            if lower == "[peer]":
-                current_peer = {
-                    "name": f"Peer{len(peers)+1}",
-                    "key": "",
-                    "allowed_prefixes": "",
-                    "endpoint": "",
-                    "presharedKey": ""
-                }
-                peers.append(current_peer)
-                continue
-
-            if "=" not in line:
-                continue
-
-            key, val = map(str.strip, line.split("=", 1))
-            val = _strip_inline_comment(val)
-            if not val and key.lower() not in ("preup", "postup", "predown", "postdown"):
-                continue
-
-            if current_peer is None:
-                key_lower = key.lower()
-                if key_lower == "preup":
-                    if val:
-                        iface["PreUp"].append(val)
-                elif key_lower == "postup":
-                    if val:
-                        iface["PostUp"].append(val)
-                elif key_lower == "predown":
-                    if val:
-                        iface["PreDown"].append(val)
-                elif key_lower == "postdown":
-                    if val:
-                        iface["PostDown"].append(val)
-                elif key_lower == "address":
-                    iface["Address"] += _split_csv(val)
-                elif key_lower == "dns":
-                    iface["DNS"] += _split_csv(val)
-                elif key_lower == "privatekey":
-                    iface["PrivateKey"] = val
-                else:
-                    iface[key] = val
-            else:
-                key_lower = key.lower()
-                if key_lower == "publickey":
-                    current_peer["key"] = val
-                elif key_lower == "allowedips":
-                    if current_peer["allowed_prefixes"]:
-                        current_peer["allowed_prefixes"] += ", " + val
-                    else:
-                        current_peer["allowed_prefixes"] = val
-                elif key_lower == "endpoint":
-                    current_peer["endpoint"] = val
-                elif key_lower == "presharedkey":
-                    current_peer["presharedKey"] = val
-
-        return (
-            profile_name,
-            ", ".join(iface.get("Address", [])),
-            iface.get("PrivateKey", ""),
-            interface_name,
-            "",
-            ", ".join(iface.get("DNS", [])),
-            peers,
-            "\n".join(iface.get("PreUp", [])),
-            "\n".join(iface.get("PostUp", [])),
-            "\n".join(iface.get("PreDown", [])),
-            "\n".join(iface.get("PostDown", [])),
-        )
-
-    def parse_wireguard_conf(self, path):
-        profile_name = os.path.splitext(os.path.basename(path))[0]
-        with open(path) as f:
-            lines = f.readlines()
-        return self._parse_wireguard_conf_lines(lines, profile_name)
+        return fields, parsed.diagnostics
 
     def _normalize_qr_text(self, text):
         if not text:
@@ -868,49 +1074,28 @@ class Vpn:
         if "[Interface]" not in normalized:
             return {"error": "QR does not contain WireGuard config"}
 
-        profile_data = self._parse_wireguard_conf_lines(normalized.splitlines(), "qr_import")
-        profile_name = profile_data[0]
-        ip_address = profile_data[1]
-        private_key = profile_data[2]
-        interface_name = profile_data[3]
-        extra_routes = profile_data[4]
-        dns_servers = profile_data[5]
-        peers = profile_data[6]
-        # Ignore PreUp/PostUp/PreDown/PostDown on import for safety
-        pre_up = ""
-        post_up = ""
-        pre_down = ""
-        post_down = ""
+        entry = import_pipeline.parse_source(self, "qr_import", normalized)
+        if entry["error"]:
+            return {"error": entry["error"]}
 
         if profile_name_override:
-            override = self._sanitize_profile_name(str(profile_name_override).strip(), profile_name)
+            override = self._sanitize_profile_name(str(profile_name_override).strip(), entry["wanted_name"])
             if override:
-                profile_name = override
+                entry["wanted_name"] = override
 
         if interface_name_override:
-            interface_name = str(interface_name_override).strip()
+            entry["wanted_interface"] = str(interface_name_override).strip()
         elif profile_name_override:
-            interface_name = f"wg_{profile_name}"
+            entry["wanted_interface"] = None
 
-        profiles = self._load_profiles()
         used = set()
-        for data in profiles.values():
+        for data in self._load_profiles().values():
             iface = data.get('interface_name')
             if iface:
                 used.add(iface)
-        interface_name = self._unique_interface_name(interface_name or f"wg_{profile_name}", used)
-
-        original_name = profile_name
-        suffix = 1
-        while (PROFILES_DIR / profile_name).exists():
-            profile_name = f"{original_name}_{suffix}"
-            suffix += 1
-
-        error = self.save_profile(profile_name, ip_address, private_key, interface_name, extra_routes, dns_servers, pre_up, post_up, pre_down, post_down, peers, existing_profiles=profiles, used_ifaces=used)
-        if error:
-            return {"error": error}
-
-        return {"error": None, "profiles": [profile_name]}
+        # Scanning a stored config again reports it as present
+        res = import_pipeline.commit(self, [entry], used)
+        return {"error": res["error"], "profiles": res["profiles"], "present": res["present"]}
 
     def get_wireguard_version(self):
         """
@@ -928,14 +1113,13 @@ class Vpn:
             "raw": line,
         }
 
-    def export_confs_zip(self):
+    def export_confs_zip(self, target=None, profiles=None, incremental=False):
         """
-        Export all profiles into wireguard.zip in Downloads.
+        Export profiles as wg-quick configs into a zip: wireguard.zip in
+        Downloads by default, or `target` (a path or an open file
+        descriptor). `profiles` limits the export to the named profiles and
+        `incremental` skips profiles unchanged since their last export.
         """
-        downloads = APP_HOME / "Downloads"
-        downloads.mkdir(parents=True, exist_ok=True)
-        base = downloads / "wireguard.zip"
-
         def next_free_name(path):
             if not path.exists():
                 return path
@@ -945,116 +1129,46 @@ class Vpn:
                     return cand
             return path
 
-        target = next_free_name(base)
+        path = None
         try:
-            with zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED) as z:
-                found = False
-                missing = []
-                missing_keys = []
-                bad_password = []
-                for profile_json in PROFILES_DIR.glob("*/profile.json"):
-                    try:
-                        data = json.loads(profile_json.read_text())
-                    except Exception:
-                        continue
-
-                    raw_name = data.get("profile_name") or profile_json.parent.name
-                    safe_name = self._sanitize_profile_name(raw_name, profile_json.parent.name)
-                    ip_address = (data.get("ip_address") or "").strip()
-                    if not ip_address:
-                        missing.append(safe_name)
-                        continue
-                    privkey, err = self._get_private_key_status(profile_json.parent.name, data)
-                    if not privkey:
-                        if err == "BAD_PASSWORD":
-                            bad_password.append(safe_name)
-                        else:
-                            missing_keys.append(safe_name)
-                        continue
-
-                    lines = [
-                        "[Interface]",
-                        f"#Profile = {raw_name}",
-                        f"Address = {ip_address}",
-                        f"PrivateKey = {privkey.strip()}",
-                    ]
-                    pre_up = (data.get("pre_up") or "").strip()
-                    if pre_up:
-                        for line in pre_up.splitlines():
-                            line = line.strip()
-                            if line:
-                                lines.append(f"PreUp = {line}")
-                    post_up = (data.get("post_up") or "").strip()
-                    if post_up:
-                        for line in post_up.splitlines():
-                            line = line.strip()
-                            if line:
-                                lines.append(f"PostUp = {line}")
-                    pre_down = (data.get("pre_down") or "").strip()
-                    if pre_down:
-                        for line in pre_down.splitlines():
-                            line = line.strip()
-                            if line:
-                                lines.append(f"PreDown = {line}")
-                    post_down = (data.get("post_down") or "").strip()
-                    if post_down:
-                        for line in post_down.splitlines():
-                            line = line.strip()
-                            if line:
-                                lines.append(f"PostDown = {line}")
-                    dns = (data.get("dns_servers") or "").strip()
-                    if dns:
-                        lines.append(f"DNS = {dns}")
-                    lines.append("")
-
-                    for peer in data.get("peers", []):
-                        lines.extend([
-                            "[Peer]",
-                            f"#Name = {peer.get('name', '').strip()}",
-                            f"PublicKey = {peer.get('key', '').strip()}",
-                            f"AllowedIPs = {peer.get('allowed_prefixes', '').strip()}",
-                            f"Endpoint = {peer.get('endpoint', '').strip()}",
-                        ])
-                        preshared = (peer.get("presharedKey") or "").strip()
-                        if preshared:
-                            lines.append(f"PresharedKey = {preshared}")
-                        lines.append("PersistentKeepalive = 5")
-                        lines.append("")
-
-                    z.writestr(f"{safe_name}.conf", "\n".join(lines).strip() + "\n")
-                    found = True
-
-                if not found:
-                    return {"error": "No profiles to export"}
-
-            res = {"error": None, "path": str(target)}
-            if missing:
-                preview = ", ".join(missing[:5])
-                if len(missing) > 5:
-                    preview = f"{preview} (+{len(missing)-5} more)"
-                res["warning"] = f"Skipped {len(missing)} profiles missing Address: {preview}"
-            if missing_keys:
-                preview = ", ".join(missing_keys[:5])
-                if len(missing_keys) > 5:
-                    preview = f"{preview} (+{len(missing_keys)-5} more)"
-                warn = f"Skipped {len(missing_keys)} profiles missing private key: {preview}"
-                if "warning" in res:
-                    res["warning"] = res["warning"] + "; " + warn
-                else:
-                    res["warning"] = warn
-            if bad_password:
-                preview = ", ".join(bad_password[:5])
-                if len(bad_password) > 5:
-                    preview = f"{preview} (+{len(bad_password)-5} more)"
-                warn = f"Skipped {len(bad_password)} profiles (wrong password): {preview}"
-                if "warning" in res:
-                    res["warning"] = res["warning"] + "; " + warn
+            if isinstance(target, int):
+                fileobj = os.fdopen(target, "wb", closefd=False)
+            else:
+                if target:
+                    path = Path(target)
                 else:
-                    res["warning"] = warn
-            return res
+                    downloads = APP_HOME / "Downloads"
+                    downloads.mkdir(parents=True, exist_ok=True)
+                    path = next_free_name(downloads / "wireguard.zip")
+                fileobj = open(path, "wb")
+            with fileobj:
+                report = profile_export.export_zip(self, fileobj, profiles, incremental)
         except Exception as e:
+            if path is not None:
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
             return {"error": str(e)}
 
+        if not report["exported"]:
+            if path is not None:
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+            res = {"error": "No changes since the last export" if report["unchanged"] else "No profiles to export"}
+            if report["warning"]:
+                res["warning"] = report["warning"]
+            return res
+
+        profile_export.record_export(report["hashes"])
+        res = {"error": None, "path": str(path) if path is not None else None,
+               "profiles": report["exported"], "unchanged": report["unchanged"]}
+        if report["warning"]:
+            res["warning"] = report["warning"]
+        return res
+
     def decode_qr_image(self, path):
         if path and path.startswith("file://"):
             path = path[7:]
@@ -1166,37 +1280,53 @@ class Vpn:
         return "Re-encryption is not supported with root-only key storage"
 
 
+    def _read_profile(self, path):
+        """
+        The profile stored at `path` through the profile model cache. One
+        that no longer parses comes back as its plain JSON, so it is still
+        listed and can be fixed in the editor.
+        """
+        try:
+            return profile_model.load(path)
+        except profile_model.ProfileError:
+            with open(path) as fd:
+                return json.load(fd)
+
+    def _profile_fields(self, profile_name, profile, existing_keys):
+        """
+        The UI's view of a stored profile: a new dict with the defaults QML
+        expects. The cached model it is built from is not touched.
+        """
+        data = dict(profile_model.plain(profile))
+        data['peers'] = [dict(peer) for peer in data.get('peers') or []]
+        data['private_key'] = ""
+        for hook in ('pre_up', 'post_up', 'pre_down', 'post_down', 'mtu'):
+            data[hook] = data.get(hook) or ""
+        data['kind'] = data.get('kind') or profile_model.CLIENT
+        data['listen_port'] = str(data.get('listen_port') or "")
+        data['has_private_key'] = profile_name in existing_keys
+        return data
+
     def get_profile(self, profile):
-        with (PROFILES_DIR / profile / 'profile.json').open() as fd:
-            data = json.load(fd)
-            existing_keys = secrets_store.list_private_keys(self._sudo_pwd)
-            self._migrate_profile_secret(profile, data, existing_keys=existing_keys)
-            data['private_key'] = ""
-            data['pre_up'] = data.get('pre_up') or ""
-            data['post_up'] = data.get('post_up') or ""
-            data['pre_down'] = data.get('pre_down') or ""
-            data['post_down'] = data.get('post_down') or ""
-            data['has_private_key'] = profile in existing_keys
-            return data
+        stored = self._read_profile(PROFILES_DIR / profile / 'profile.json')
+        existing_keys = secrets_store.list_private_keys(self._sudo_pwd)
+        self._migrate_profile_secret(profile, stored, existing_keys=existing_keys)
+        return self._profile_fields(profile, stored, existing_keys)
 
     def list_profiles(self):
         profiles = []
         raw_profiles = {}
+        stored_profiles = {}
         existing_keys = secrets_store.list_private_keys(self._sudo_pwd)
         for path in PROFILES_DIR.glob('*/profile.json'):
+            name = path.parent.name
             try:
-                with path.open() as fd:
-                    data = json.load(fd)
+                stored = self._read_profile(path)
             except Exception:
                 continue  # skip broken files
-            self._migrate_profile_secret(path.parent.name, data, existing_keys=existing_keys)
-            data['private_key'] = ""
-            data['pre_up'] = data.get('pre_up') or ""
-            data['post_up'] = data.get('post_up') or ""
-            data['pre_down'] = data.get('pre_down') or ""
-            data['post_down'] = data.get('post_down') or ""
-            data['has_private_key'] = path.parent.name in existing_keys
-            raw_profiles[path.parent.name] = data
+            self._migrate_profile_secret(name, stored, existing_keys=existing_keys)
+            stored_profiles[name] = stored
+            raw_profiles[name] = self._profile_fields(name, stored, existing_keys)
 
         active_by_privkey = {}
         active_ifaces = set()
@@ -1218,7 +1348,8 @@ class Vpn:
                 iface = active_by_privkey[priv]
                 if data.get('interface_name') != iface:
                     data['interface_name'] = iface
-                    self._write_profile(name, data)
+                    self._write_profile(name, dict(profile_model.plain(stored_profiles[name]),
+                                                   interface_name=iface))
 
         # Then, ensure uniqueness for all remaining profiles
         used = {}
@@ -1231,7 +1362,8 @@ class Vpn:
                 unique = self._unique_interface_name(desired, set(used.keys()))
                 if unique != iface:
                     data['interface_name'] = unique
-                    self._write_profile(name, data)
+                    self._write_profile(name, dict(profile_model.plain(stored_profiles[name]),
+                                                   interface_name=unique))
                 iface = unique
                 used[iface] = name
 
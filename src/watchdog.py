@@ -0,0 +1,113 @@
+import time
+
+# WireGuard rekeys every 2 minutes while traffic flows and our peers send a
+# keepalive every few seconds, so a handshake older than 3 minutes means the
+# session is dead. Recovery escalates step by step (handshake age, seconds).
+DEFAULT_THRESHOLDS = (
+    ('resolve', 180),
+    ('peer', 240),
+    ('reconfigure', 300),
+)
+# After the last step, repeat it at this interval while the peer stays stale
+RETRY_INTERVAL = 120
+# The thresholds hold for keepalives up to this interval. A handshake is only
+# renewed by the first packet after the 2 minute rekey time, so a peer that
+# sends less often gets the difference added to every step.
+BASE_KEEPALIVE = 25
+HISTORY_SIZE = 50
+
+
+def thresholds_from(profile):
+    """
+    Reads optional `watchdog_thresholds` ({"resolve": s, "peer": s,
+    "reconfigure": s}) from a profile; missing steps keep their default and a
+    step set to 0 or less is skipped.
+    """
+    custom = profile.get('watchdog_thresholds') or {}
+    if not isinstance(custom, dict):
+        return DEFAULT_THRESHOLDS
+    steps = []
+    for action, age in DEFAULT_THRESHOLDS:
+        try:
+            age = int(custom.get(action, age))
+        except (TypeError, ValueError):
+            pass
+        if age > 0:
+            steps.append((action, age))
+    return tuple(sorted(steps, key=lambda step: step[1]))
+
+
+class HandshakeWatchdog:
+    """
+    Tracks the handshake age of every peer of one tunnel and tells the caller
+    which recovery step to run. Recovered peers are recorded in `history`
+    with the steps taken and the time from the first step to the fresh
+    handshake.
+    """
+
+    def __init__(self, thresholds=DEFAULT_THRESHOLDS, retry_interval=RETRY_INTERVAL, clock=time.time):
+        self.thresholds = tuple(thresholds)
+        self.retry_interval = retry_interval
+        self.clock = clock
+        self.started = clock()
+        self.peers = {}
+        self.history = []
+
+    def _peer_state(self, public_key):
+        return self.peers.setdefault(public_key, {'step': 0, 'actions': [], 'first_action': None,
+                                                  'last_action': None})
+
+    def check(self, peers, intervals=None):
+        """
+        `peers` are status entries with `public_key` and `latest_handshake`
+        (unix time, 0 = never); `intervals` optionally maps public keys to
+        their keepalive interval. Peers with keepalive off are not watched,
+        an idle one has no reason to handshake. Returns [(action, public_key)]
+        to run now.
+        """
+        now = self.clock()
+        intervals = intervals or {}
+        due = []
+        for peer in peers:
+            key = peer.get('public_key')
+            if not key:
+                continue
+            interval = intervals.get(key)
+            if interval == 0:
+                continue
+            handshake = int(peer.get('latest_handshake') or 0)
+            # A peer that never completed a handshake ages from tunnel start;
+            # the slack stands in for scaling every threshold
+            age = now - (handshake or self.started) - max(0, (interval or 0) - BASE_KEEPALIVE)
+            state = self._peer_state(key)
+            if not self.thresholds or age < self.thresholds[0][1]:
+                if state['actions'] and handshake:
+                    self._recovered(key, state, now)
+                continue
+            step = state['step']
+            if step < len(self.thresholds):
+                action, threshold = self.thresholds[step]
+                if age < threshold:
+                    continue
+                state['step'] += 1
+            else:
+                action = self.thresholds[-1][0]
+                if now - state['last_action'] < self.retry_interval:
+                    continue
+            state['actions'].append(action)
+            state['first_action'] = state['first_action'] or now
+            state['last_action'] = now
+            due.append((action, key))
+        return due
+
+    def _recovered(self, public_key, state, now):
+        record = {
+            'public_key': public_key,
+            'actions': list(state['actions']),
+            'time_to_recover': round(now - state['first_action'], 3),
+            'recovered_at': int(now),
+        }
+        self.history.append(record)
+        del self.history[:-HISTORY_SIZE]
+        del self.peers[public_key]
+        return record
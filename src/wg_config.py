@@ -1,25 +1,96 @@
+import keepalive
+from profile_model import Profile
+
+
+def _csv(value):
+    return ", ".join(x.strip() for x in str(value or "").split(",") if x.strip())
+
+
+def _peer_lines(peer, quick=False):
+    lines = ["[Peer]"]
+    if peer.name:
+        lines.append(f"#Name = {peer.name}")
+    lines.append(f"PublicKey = {peer.key}")
+    if quick:
+        # The prefixes as entered, so a re-import can still edit them; the
+        # exclusions ride along in a comment
+        lines.append(f"AllowedIPs = {_csv(peer.get('allowed_prefixes'))}")
+        excluded = _csv(peer.get('excluded_prefixes'))
+        if excluded:
+            lines.append(f"#ExcludedIPs = {excluded}")
+    else:
+        lines.append(f"AllowedIPs = {', '.join(peer.allowed_ips)}")
+    # Server peers dial in and have no endpoint
+    if peer.endpoint:
+        lines.append(f"Endpoint = {peer.endpoint}")
+    if peer.preshared_key:
+        lines.append(f"PresharedKey = {peer.preshared_key}")
+    interval = keepalive.peer_interval(peer)
+    if interval:
+        lines.append(f"PersistentKeepalive = {interval}")
+    elif quick:
+        # Without the key, an import would fall back to the default interval
+        lines.append("PersistentKeepalive = off")
+    if quick and keepalive.is_adaptive(peer):
+        # wg-quick has no adaptive mode; keep it for re-import
+        lines.append("#Keepalive = auto")
+    if quick:
+        for key, value in (peer.get("wg_quick") or {}).items():
+            lines.append(f"{key} = {value}")
+    lines.append("")
+    return lines
+
+
 def build_config(profile, private_key=None):
-    profile_name = profile.get("profile_name") or ""
+    profile = Profile.coerce(profile)
     lines = [
         "[Interface]",
-        f"#Profile = {profile_name}",
+        f"#Profile = {profile.profile_name}",
     ]
     if private_key is not None:
         lines.append(f"PrivateKey = {private_key or ''}")
+    if profile.listen_port:
+        lines.append(f"ListenPort = {profile.listen_port}")
+    if profile.routing_table:
+        lines.append(f"FwMark = {profile.routing_table}")
+    lines.append("")
+
+    for peer in profile.peers:
+        lines += _peer_lines(peer)
+
+    return "\n".join(lines).strip() + "\n"
+
+
+def build_quick_config(profile, private_key):
+    """
+    wg-quick config for export: interface addresses, DNS, MTU and hooks
+    included, routing table left out.
+    """
+    profile = Profile.coerce(profile)
+    lines = [
+        "[Interface]",
+        f"#Profile = {profile.profile_name}",
+        f"Address = {(profile.get('ip_address') or '').strip()}",
+        f"PrivateKey = {(private_key or '').strip()}",
+    ]
+    if profile.listen_port:
+        lines.append(f"ListenPort = {profile.listen_port}")
+    for key, field in (("PreUp", "pre_up"), ("PostUp", "post_up"),
+                       ("PreDown", "pre_down"), ("PostDown", "post_down")):
+        for line in (profile.get(field) or "").splitlines():
+            line = line.strip()
+            if line:
+                lines.append(f"{key} = {line}")
+    dns = (profile.get("dns_servers") or "").strip()
+    if dns:
+        lines.append(f"DNS = {dns}")
+    if profile.mtu.isdigit():
+        lines.append(f"MTU = {profile.mtu}")
+    for key, value in (profile.get("wg_quick") or {}).items():
+        lines.append(f"{key} = {value}")
     lines.append("")
 
-    for peer in profile.get("peers", []):
-        lines.append("[Peer]")
-        name = (peer.get("name") or "").strip()
-        if name:
-            lines.append(f"#Name = {name}")
-        lines.append(f"PublicKey = {(peer.get('key') or '').strip()}")
-        lines.append(f"AllowedIPs = {(peer.get('allowed_prefixes') or '').strip()}")
-        lines.append(f"Endpoint = {(peer.get('endpoint') or '').strip()}")
-        preshared = (peer.get("presharedKey") or "").strip()
-        if preshared:
-            lines.append(f"PresharedKey = {preshared}")
-        lines.append("PersistentKeepalive = 5")
-        lines.append("")
+    for peer in profile.peers:
+        lines += _peer_lines(peer, quick=True)
 
     return "\n".join(lines).strip() + "\n"
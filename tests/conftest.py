@@ -1,6 +1,104 @@
+import base64
 import os
+import subprocess
 import tempfile
 
+import pytest
+
 
 if "WIREGUARD_APP_HOME" not in os.environ:
     os.environ["WIREGUARD_APP_HOME"] = tempfile.mkdtemp(prefix="wg_home_")
+os.environ.setdefault("WIREGUARD_KEY_DIR", tempfile.mkdtemp(prefix="wg_keys_"))
+
+
+def _key(i):
+    return base64.b64encode(bytes([i]) * 32).decode()
+
+
+@pytest.fixture
+def key():
+    """key(i): a valid WireGuard key, the same one for the same i."""
+    return _key
+
+
+@pytest.fixture
+def profile_fields():
+    """profile_fields(name, i, **overrides): a valid save_profiles() entry."""
+    def fields(name, i, **overrides):
+        fields = {
+            "profile_name": name,
+            "ip_address": f"10.0.{i}.2/32",
+            "private_key": _key(i),
+            "interface_name": "",
+            "dns_servers": "1.1.1.1",
+            "peers": [{
+                "name": "server",
+                "key": _key(100 + i),
+                "allowed_prefixes": "0.0.0.0/0",
+                "endpoint": "vpn.example.com:51820",
+                "presharedKey": "",
+            }],
+        }
+        fields.update(overrides)
+        return fields
+
+    return fields
+
+
+@pytest.fixture
+def vpn_store(tmp_path, monkeypatch):
+    """
+    vpn_store(fail_keys=None) -> (Vpn, profiles dir, key writes): a Vpn
+    saving profiles under tmp_path, with every set_private_keys() call
+    recorded instead of stored. With `fail_keys` the key write fails with
+    that error.
+    """
+    import import_pipeline
+    import secrets_store
+    import vpn
+
+    profiles_dir = tmp_path / "profiles"
+    profiles_dir.mkdir(exist_ok=True)
+    monkeypatch.setattr(vpn, "PROFILES_DIR", profiles_dir)
+    monkeypatch.setattr(import_pipeline, "PROFILES_DIR", profiles_dir)
+    monkeypatch.setattr(secrets_store, "list_private_keys", lambda sudo_pwd=None: set())
+
+    def setup(fail_keys=None):
+        writes = []
+
+        def set_private_keys(keys, sudo_pwd, pending=()):
+            writes.append(dict(keys))
+            return (False, fail_keys) if fail_keys else (True, None)
+
+        monkeypatch.setattr(secrets_store, "set_private_keys", set_private_keys)
+        monkeypatch.setattr(secrets_store, "swap_private_keys", lambda names, sudo_pwd: (True, None))
+        return vpn.Vpn(), profiles_dir, writes
+
+    return setup
+
+
+@pytest.fixture
+def key_dir(tmp_path, monkeypatch):
+    """
+    Runs the real key store scripts with sudo stubbed out: commands run as
+    the test user, with a no-op chown when that is not root.
+    """
+    import secrets_store
+
+    key_dir = tmp_path / "keys"
+    monkeypatch.setattr(secrets_store, "KEY_DIR", key_dir)
+    env = dict(os.environ)
+    if os.geteuid() != 0:
+        bin_dir = tmp_path / "bin"
+        bin_dir.mkdir()
+        (bin_dir / "chown").write_text("#!/bin/sh\nexit 0\n")
+        (bin_dir / "chown").chmod(0o755)
+        env["PATH"] = f"{bin_dir}:{env.get('PATH', '')}"
+    run = subprocess.run
+
+    def without_sudo(cmd, **kwargs):
+        assert cmd[:2] == ["/usr/bin/sudo", "-n"]
+        return run(cmd[2:], env=env, **kwargs)
+
+    monkeypatch.setattr(secrets_store.subprocess, "run", without_sudo)
+    return key_dir
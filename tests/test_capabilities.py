@@ -0,0 +1,43 @@
+import importlib
+
+import capabilities
+
+
+def _fresh(tmp_path, monkeypatch):
+    mod = importlib.reload(capabilities)
+    monkeypatch.setattr(mod, 'CACHE_FILE', tmp_path / 'capabilities.json')
+    return mod
+
+
+def test_probe_runs_once_per_key(tmp_path, monkeypatch):
+    caps = _fresh(tmp_path, monkeypatch)
+    calls = []
+
+    def probe():
+        calls.append(1)
+        return True
+
+    assert caps.cached('kernel_module', probe) is True
+    assert caps.cached('kernel_module', probe) is True
+    assert len(calls) == 1
+
+    # survives a restart (new process == empty memory cache)
+    caps._memory = None
+    assert caps.cached('kernel_module', probe) is True
+    assert len(calls) == 1
+
+    assert caps.cached('kernel_module', probe, refresh=True) is True
+    assert len(calls) == 2
+
+
+def test_key_change_and_inconclusive(tmp_path, monkeypatch):
+    caps = _fresh(tmp_path, monkeypatch)
+    assert caps.cached('x', lambda: 'a') == 'a'
+    monkeypatch.setattr(caps, 'cache_key', lambda: 'other-kernel')
+    assert caps.cached('x', lambda: 'b') == 'b'
+
+    calls = []
+    assert caps.cached('y', lambda: calls.append(1)) is None
+    assert caps.cached('y', lambda: calls.append(1)) is None
+    assert len(calls) == 2
+    assert 'y' not in caps.snapshot()
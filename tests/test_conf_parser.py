@@ -0,0 +1,112 @@
+import conf_parser
+from wg_config import build_quick_config
+
+
+def _peer(i):
+    return [
+        "[Peer]",
+        f"PublicKey = key{i}",
+        f"AllowedIPs = 10.{i // 256}.{i % 256}.0/24",
+        f"Endpoint = peer{i}.example.com:51820",
+    ]
+
+
+def test_all_interface_and_peer_keys():
+    lines = [
+        "#Profile = Site A",
+        "[Interface]",
+        "PrivateKey = priv # comment",
+        "Address = 10.0.0.1/24, fd00::1/64",
+        "DNS = 1.1.1.1",
+        "ListenPort = 51820",
+        "MTU = 1380",
+        "Table = off",
+        "FwMark = 0x1234",
+        "SaveConfig = false",
+        "PostUp = iptables -A FORWARD -i %i -j ACCEPT; echo done",
+        "[Peer]",
+        "#Name = laptop",
+        "PublicKey = pub",
+        "PresharedKey = psk",
+        "AllowedIPs = 10.0.0.2/32",
+        "AllowedIPs = fd00::2/128",
+        "Endpoint = [2001:db8::1]:51820",
+        "PersistentKeepalive = 0",
+    ]
+    parsed = conf_parser.parse(lines)
+    assert parsed.diagnostics == []
+    assert parsed.profile_name == "Site A"
+    assert parsed.private_key == "priv"
+    assert parsed.addresses == ["10.0.0.1/24", "fd00::1/64"]
+    assert (parsed.listen_port, parsed.mtu, parsed.table, parsed.fwmark) == (51820, 1380, "off", "0x1234")
+    assert parsed.post_up == ["iptables -A FORWARD -i %i -j ACCEPT; echo done"]
+    assert parsed.wg_quick_extra() == {"ListenPort": "51820", "Table": "off", "FwMark": "0x1234",
+                                       "SaveConfig": "false"}
+    peer = parsed.peers[0]
+    assert (peer.name, peer.public_key, peer.preshared_key, peer.endpoint) == \
+        ("laptop", "pub", "psk", "[2001:db8::1]:51820")
+    assert peer.allowed_ips == ["10.0.0.2/32", "fd00::2/128"]
+    assert peer.persistent_keepalive == "off"
+
+
+def test_line_numbered_diagnostics():
+    lines = [
+        "Address = 10.0.0.1/24",
+        "[Interface]",
+        "ListenPort = abc",
+        "Bogus = 1",
+        "garbage",
+        "[Wat]",
+        "Foo = bar",
+        "[Peer]",
+        "AllowedIPs = 0.0.0.0/0",
+    ]
+    parsed = conf_parser.parse(lines)
+    found = [(d.line, d.severity) for d in parsed.diagnostics]
+    assert found == [(1, "warning"), (3, "error"), (4, "warning"), (5, "error"), (6, "warning"), (8, "error")]
+    assert conf_parser.format_diagnostic(parsed.errors[0]) == "line 3: ListenPort must be a number from 0 to 65535"
+    assert parsed.extra == {"Bogus": "1"}
+    assert parsed.addresses == ["10.0.0.1/24"]
+
+
+def test_thousands_of_peers():
+    lines = ["[Interface]", "PrivateKey = priv", "Address = 10.255.0.1/16"]
+    for i in range(5000):
+        lines += _peer(i)
+    parsed = conf_parser.parse(lines)
+    assert parsed.diagnostics == []
+    assert len(parsed.peers) == 5000
+    assert parsed.peers[4999].public_key == "key4999"
+    assert parsed.peers[4999].allowed_ips == ["10.19.135.0/24"]
+    assert parsed.peers[4999].line == 3 + 4999 * 4 + 1
+
+
+def test_export_keeps_wg_quick_keys():
+    import vpn
+
+    v = vpn.Vpn()
+    fields, diagnostics = v.parse_conf([
+        "[Interface]", "PrivateKey = priv", "Address = 10.0.0.1/24", "ListenPort = 51820", "Table = off",
+        *_peer(1),
+    ], "site")
+    assert diagnostics == []
+    text = build_quick_config(dict(fields, profile_name="site"), "priv")
+    assert "ListenPort = 51820" in text
+    assert "Table = off" in text
+    again, _ = v.parse_conf(text.splitlines(), "x")
+    assert again["wg_quick"] == {"Table": "off"}
+    assert (again["listen_port"], again["kind"]) == ("51820", "client")
+    # the default keepalive is written out explicitly
+    assert again["peers"] == [dict(fields["peers"][0], keepalive="5")]
+
+
+def test_export_keeps_excluded_prefixes():
+    import vpn
+
+    peer = {"name": "server", "key": "pub", "allowed_prefixes": "0.0.0.0/0, ::/0",
+            "excluded_prefixes": "10.0.0.0/8", "endpoint": "vpn.example.com:51820", "presharedKey": ""}
+    text = build_quick_config({"profile_name": "home", "ip_address": "10.1.0.2/32", "peers": [peer]}, "priv")
+    assert "AllowedIPs = 0.0.0.0/0, ::/0\n#ExcludedIPs = 10.0.0.0/8\n" in text
+    again, diagnostics = vpn.Vpn().parse_conf(text.splitlines(), "x")
+    assert diagnostics == []
+    assert again["peers"] == [dict(peer, keepalive="5")]
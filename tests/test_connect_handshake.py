@@ -0,0 +1,73 @@
+import subprocess
+
+import pytest
+
+import interface
+import metrics
+import profile_model
+import vpn
+
+
+def test_latest_handshakes_parses_wg_output(monkeypatch):
+    out = b"peerA=\t1700000000\npeerB=\t0\n"
+    monkeypatch.setattr(interface.subprocess, 'run',
+                        lambda cmd, **kw: subprocess.CompletedProcess(cmd, 0, out, b''))
+    iface = interface.Interface('pwd')
+    assert iface.latest_handshakes('wg0') == {'peerA=': 1700000000, 'peerB=': 0}
+
+
+def test_wait_for_handshake_backs_off(monkeypatch):
+    iface = interface.Interface('pwd')
+    polls = iter([{}, {'peer': 0}, {'peer': 0}, {'peer': 99}, {'peer': 1000}])
+    sleeps = []
+    monkeypatch.setattr(iface, 'latest_handshakes', lambda name: next(polls))
+    monkeypatch.setattr(interface.time, 'sleep', sleeps.append)
+    assert iface.wait_for_handshake('wg0', timeout=5, since=1000) is True
+    assert sleeps == [0.05, 0.1, 0.2, 0.4]
+
+
+def test_wait_for_handshake_times_out(monkeypatch):
+    iface = interface.Interface('pwd')
+    monkeypatch.setattr(iface, 'latest_handshakes', lambda name: {'peer': 0})
+    assert iface.wait_for_handshake('wg0', timeout=0.12, since=1000) is False
+
+
+def test_connect_records_every_attempt(monkeypatch, tmp_path):
+    monkeypatch.setattr(metrics, 'METRICS_FILE', str(tmp_path / 'metrics.jsonl'))
+    v = vpn.Vpn()
+    v.set_pwd('pwd')
+    errors = iter(['Private key not available.', None, None])
+    monkeypatch.setattr(v, '_connect', lambda *args: next(errors))
+    monkeypatch.setattr(v, '_load_profile', lambda name: profile_model.Profile(
+        {'interface_name': 'wg0', 'peers': [{'key': 'k', 'endpoint': '192.0.2.1:51820'}]}))
+    monkeypatch.setattr(v.interface, 'wait_for_handshake', lambda name, timeout, since: name == 'wg0')
+
+    assert v.connect('home', True)['error'] == 'Private key not available.'
+    assert v.connect('home', True, wait_handshake=False)['handshake_ms'] is None
+    assert v.connect('home', False)['handshake_ms'] is not None
+
+    records = metrics.read('connect')
+    assert [(r['error'], r['waited'], r['backend']) for r in records] == [
+        ('Private key not available.', False, 'kmod'), (None, False, 'kmod'), (None, True, 'userspace')]
+    assert all(r['connect_ms'] >= 0 for r in records)
+    assert records[2]['handshake_ms'] is not None and records[1]['handshake_ms'] is None
+
+
+def test_connect_does_not_wait_for_dial_in_peers(monkeypatch, tmp_path):
+    monkeypatch.setattr(metrics, 'METRICS_FILE', str(tmp_path / 'metrics.jsonl'))
+    v = vpn.Vpn()
+    v.set_pwd('pwd')
+    monkeypatch.setattr(v, '_connect', lambda *args: None)
+    monkeypatch.setattr(v.interface, 'wait_for_handshake',
+                        lambda name, timeout, since: pytest.fail('waited for a handshake'))
+    profiles = {
+        'hub': {'interface_name': 'wg0', 'kind': 'server', 'listen_port': 51820,
+                'peers': [{'key': 'k', 'endpoint': '192.0.2.1:51820'}]},
+        'dial-in': {'interface_name': 'wg1', 'peers': [{'key': 'k', 'endpoint': ''}]},
+    }
+    monkeypatch.setattr(v, '_load_profile', lambda name: profile_model.Profile(profiles[name]))
+
+    for name in profiles:
+        res = v.connect(name, True)
+        assert (res['error'], res['waited'], res['handshake_ms']) == (None, False, None)
+    assert [r['waited'] for r in metrics.read('connect')] == [False, False]
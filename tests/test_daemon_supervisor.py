@@ -0,0 +1,300 @@
+import base64
+import logging
+import os
+import threading
+import time
+
+import pytest
+
+import daemon
+import daemon_client
+import interface
+from debounce import Debouncer
+import metrics
+
+
+class _Proc:
+    def __init__(self, pid, returncode=None):
+        self.pid = pid
+        self.returncode = returncode
+
+    def poll(self):
+        return self.returncode
+
+
+class _Interface:
+    def __init__(self):
+        self.configured = []
+
+    def config_interface(self, profile, config_file):
+        self.configured.append(profile.to_dict())
+        return None
+
+    def _get_wg_status(self):
+        return [
+            "wg0\tpriv0\tpub0\t0\toff",
+            "wg0\tpeer0\t(none)\t1.2.3.4:51820\t0.0.0.0/0\t1700000000\t10\t20\toff",
+            "wg9\tpriv9\tpub9\t0\toff",
+        ]
+
+
+def _supervisor(tmp_path, monkeypatch):
+    monkeypatch.setattr(daemon_client, 'SOCKET_PATH', str(tmp_path / 'daemon.sock'))
+    monkeypatch.setattr(daemon_client, 'STATE_PATH', str(tmp_path / 'tunnels.json'))
+    sup = daemon.Supervisor.__new__(daemon.Supervisor)
+    monkeypatch.setattr(daemon, 'log', logging.getLogger('daemon-test'))
+    sup.sudo_pwd = ''
+    sup.tunnels = {}
+    sup.listener = None
+    sup.stats = {}
+    sup.stats_time = 0.0
+    sup.races = {}
+    sup._race_pool = None
+    sup.interface = _Interface()
+    sup._interface_mod = interface
+    sup.route_debouncer = Debouncer(sup.apply_route)
+    return sup
+
+
+def test_registry_reports_live_tunnels_only(tmp_path, monkeypatch):
+    sup = _supervisor(tmp_path, monkeypatch)
+    sup.tunnels['wg0'] = daemon.Tunnel({'profile_name': 'a', 'interface_name': 'wg0'}, _Proc(os.getpid()))
+    sup.tunnels['wg1'] = daemon.Tunnel({'profile_name': 'b', 'interface_name': 'wg1'}, _Proc(2 ** 22 + 1))
+    sup.save_state()
+
+    state = daemon_client.read_state()
+    assert state['pid'] == os.getpid()
+    assert sorted(state['tunnels']) == ['wg0', 'wg1']
+    assert list(daemon_client.running_tunnels(state)) == ['wg0']
+    assert oct(os.stat(daemon_client.STATE_PATH).st_mode & 0o777) == '0o600'
+
+
+def test_control_socket_round_trip(tmp_path, monkeypatch):
+    sup = _supervisor(tmp_path, monkeypatch)
+    sup.tunnels['wg0'] = daemon.Tunnel({'profile_name': 'a', 'interface_name': 'wg0'}, _Proc(os.getpid()))
+    assert sup.listen() is True
+    try:
+        server = threading.Thread(target=sup._serve_one)
+        server.start()
+        reply = daemon_client.request({'cmd': 'ping'})
+        server.join(5)
+        assert reply == {'error': None, 'pid': os.getpid(), 'tunnels': ['wg0']}
+        assert sup.handle({'cmd': 'bogus'})['error'] == 'Unknown command: bogus'
+        assert sup.handle({'cmd': 'up'})['error'] == 'Missing profile'
+    finally:
+        sup.listener.close()
+
+
+def test_request_without_supervisor(tmp_path, monkeypatch):
+    monkeypatch.setattr(daemon_client, 'SOCKET_PATH', str(tmp_path / 'missing.sock'))
+    with pytest.raises(daemon_client.DaemonUnavailable):
+        daemon_client.request({'cmd': 'ping'}, timeout=0.5)
+
+
+def test_status_reconfigure_and_stop(tmp_path, monkeypatch):
+    sup = _supervisor(tmp_path, monkeypatch)
+    profile = {'profile_name': 'a', 'interface_name': 'wg0', 'peers': []}
+    sup.tunnels['wg0'] = daemon.Tunnel(profile, _Proc(os.getpid(), returncode=0))
+
+    status = sup.handle({'cmd': 'status'})['tunnels']
+    assert list(status) == ['wg0']
+    assert status['wg0']['my_privkey'] == 'priv0'
+    assert status['wg0']['profile_name'] == 'a'
+    assert status['wg0']['peers'][0]['rx'] == 10
+
+    updated = dict(profile, dns_servers='10.0.0.1')
+    assert sup.handle({'cmd': 'reload-profile', 'profile': updated}) == {'error': None}
+    assert sup.interface.configured == [updated]
+    assert sup.handle({'cmd': 'reconfigure', 'interface_name': 'wg7'})['error'] == 'Unknown tunnel: wg7'
+
+    level = logging.getLogger().level
+    assert sup.handle({'cmd': 'set-log-level', 'level': 'debug'}) == {'error': None}
+    assert logging.getLogger().level == logging.DEBUG
+    logging.getLogger().setLevel(level)
+    assert sup.handle({'cmd': 'set-log-level', 'level': 'chatty'})['error'].startswith('Bad log level')
+
+    assert sup.handle({'cmd': 'stop'}) == {'error': None}
+    assert sup.tunnels == {}
+    assert daemon_client.read_state()['tunnels'] == {}
+
+
+def test_stale_handshake_triggers_recovery(tmp_path, monkeypatch):
+    sup = _supervisor(tmp_path, monkeypatch)
+    monkeypatch.setattr(metrics, 'METRICS_FILE', str(tmp_path / 'metrics.jsonl'))
+    # Without an endpoint keepalive defaults to off, which the watchdog skips
+    profile = {'profile_name': 'a', 'interface_name': 'wg0', 'peers': [{'key': 'peer0', 'keepalive': '25'}]}
+    tunnel = daemon.Tunnel(profile, _Proc(os.getpid()))
+    sup.tunnels['wg0'] = tunnel
+
+    # the stub dump has a handshake far in the past: no UAPI socket, so
+    # every step falls back to a full reconfigure
+    sup.check_handshakes()
+    assert sup.interface.configured == [profile]
+
+    tunnel.watchdog.peers['peer0']['first_action'] -= 5
+    sup.stats = {'wg0': {'peers': [{'public_key': 'peer0', 'latest_handshake': int(tunnel.watchdog.clock())}]}}
+    monkeypatch.setattr(sup, 'refresh_stats', lambda max_age=1.0: sup.stats)
+    sup.check_handshakes()
+    recoveries = metrics.read('recovery')
+    assert len(recoveries) == 1
+    assert recoveries[0]['interface'] == 'wg0'
+    assert recoveries[0]['time_to_recover'] >= 5
+
+
+def test_stats_come_from_uapi_through_the_relay(tmp_path, monkeypatch):
+    import uapi
+
+    sup = _supervisor(tmp_path, monkeypatch)
+    monkeypatch.setattr(uapi, 'available', lambda name, sudo_pwd=None: sudo_pwd is not None)
+    monkeypatch.setattr(uapi, 'status', lambda name, sudo_pwd=None: {'peers': [], 'relayed': sudo_pwd == ''})
+    sup.interface._get_wg_status = lambda: pytest.fail('wg show used for a userspace tunnel')
+    sup.tunnels['wg0'] = daemon.Tunnel({'profile_name': 'a', 'interface_name': 'wg0'}, _Proc(os.getpid()))
+    assert sup.refresh_stats(max_age=0) == {'wg0': {'peers': [], 'relayed': True}}
+
+
+def test_ddns_endpoint_change_updates_only_that_peer(tmp_path, monkeypatch):
+    import resolver
+    import uapi
+
+    sup = _supervisor(tmp_path, monkeypatch)
+    moves = []
+    sup.interface.move_endpoint_route = lambda old, new: moves.append((old, new))
+    answers = {'ddns.example.com': ['1.1.1.1']}
+    monkeypatch.setattr(resolver, 'default', resolver.Resolver(lookup=lambda host: answers[host]))
+    sets = []
+    monkeypatch.setattr(uapi, 'available', lambda name, sudo_pwd=None: sudo_pwd is not None)
+    monkeypatch.setattr(uapi, 'set_device', lambda name, **kw: sets.append(kw['peers']))
+
+    key = base64.b64encode(bytes(32)).decode()
+    profile = {'profile_name': 'a', 'interface_name': 'wg0',
+               'peers': [{'key': key, 'endpoint': 'ddns.example.com:51820'}]}
+    tunnel = daemon.Tunnel(profile, _Proc(os.getpid()))
+    sup.tunnels['wg0'] = tunnel
+    sup._record_endpoints(tunnel)
+    assert tunnel.endpoints == {key: ('1.1.1.1',)}
+
+    # fresh handshake: no lookup even though the cache entry expired
+    resolver.default.invalidate()
+    sup.check_endpoints(tunnel, [{'public_key': key, 'latest_handshake': int(time.time())}])
+    assert resolver.default.lookups == 1
+
+    answers['ddns.example.com'] = ['2.2.2.2']
+    sup.check_endpoints(tunnel, [{'public_key': key, 'latest_handshake': int(time.time()) - 200}])
+    assert sets == [[{'public_key': key, 'update_only': True, 'endpoint': '2.2.2.2:51820'}]]
+    assert moves == [('1.1.1.1', None), (None, '2.2.2.2')]
+    assert sup.interface.configured == []
+    assert sup.handle({'cmd': 'status'})['tunnels']['wg0']['endpoints'] == {key: ['2.2.2.2']}
+
+
+def test_endpoint_race_keeps_fastest_candidate(tmp_path, monkeypatch):
+    import uapi
+
+    sup = _supervisor(tmp_path, monkeypatch)
+    moves = []
+    sup.interface.move_endpoint_route = lambda old, new: moves.append((old, new))
+    monkeypatch.setattr(uapi, 'available', lambda name, sudo_pwd=None: sudo_pwd is not None)
+    tried = []
+
+    def handshake_via(name, peer, endpoint, timeout):
+        tried.append(endpoint)
+        return endpoint == '10.0.0.2:51820'
+
+    monkeypatch.setattr(sup, '_handshake_via', handshake_via)
+    key = base64.b64encode(bytes(32)).decode()
+    profile = {'profile_name': 'a', 'interface_name': 'wg0',
+               'peers': [{'key': key, 'endpoint': '10.0.0.1:51820', 'endpoints': '10.0.0.2:51820'}]}
+    tunnel = daemon.Tunnel(profile, _Proc(os.getpid()))
+    sup.tunnels['wg0'] = tunnel
+    sup._record_endpoints(tunnel)
+    assert sup.race_endpoints(tunnel) == [key]
+    sup.collect_races(wait=True)
+
+    race = tunnel.races[key]
+    assert race['chosen'] == '10.0.0.2:51820'
+    assert race['rtts']['10.0.0.1:51820'] is None
+    assert tried == ['10.0.0.1:51820', '10.0.0.2:51820']
+    assert tunnel.profile['peers'][0]['endpoint'] == '10.0.0.2:51820'
+    assert tunnel.profile['peers'][0]['endpoints'] == '10.0.0.1:51820, 10.0.0.2:51820'
+    assert moves == [('10.0.0.1', None), (None, '10.0.0.2')]
+
+
+def test_endpoint_race_runs_off_the_loop_after_a_stale_handshake(tmp_path, monkeypatch):
+    import uapi
+
+    sup = _supervisor(tmp_path, monkeypatch)
+    sup.interface.move_endpoint_route = lambda old, new: None
+    monkeypatch.setattr(uapi, 'available', lambda name, sudo_pwd=None: sudo_pwd is not None)
+    removed = []
+    monkeypatch.setattr(uapi, 'remove_peer', lambda name, key, sudo_pwd=None: removed.append(key))
+    release = threading.Event()
+    tried = []
+
+    def handshake_via(name, peer, endpoint, timeout):
+        tried.append(endpoint)
+        return release.wait(5)
+
+    monkeypatch.setattr(sup, '_handshake_via', handshake_via)
+    key = base64.b64encode(bytes(32)).decode()
+    profile = {'profile_name': 'a', 'interface_name': 'wg0',
+               'peers': [{'key': key, 'endpoint': '10.0.0.1:51820', 'endpoints': '10.0.0.2:51820'}]}
+    tunnel = daemon.Tunnel(profile, _Proc(os.getpid()))
+    sup.tunnels['wg0'] = tunnel
+
+    # A fresh configuration is given time to handshake on its own
+    peers = [{'public_key': key, 'latest_handshake': 0}]
+    sup._race_unanswered(tunnel, peers)
+    assert sup.races == {}
+
+    # The watchdog step starts a race instead of resetting the peer, and
+    # returns while the handshake is still pending
+    assert sup.recover(tunnel, 'peer', key) is None
+    assert removed == [] and ('wg0', key) in sup.races
+    assert sup.recover(tunnel, 'resolve', key) is None
+    sup.collect_races()
+    assert tunnel.races == {}
+
+    # The endpoint in use answered: kept, the alternative is not tried
+    release.set()
+    sup.collect_races(wait=True)
+    assert tried == ['10.0.0.1:51820']
+    assert tunnel.races[key]['chosen'] == '10.0.0.1:51820'
+    assert sup.races == {}
+
+    # No handshake RACE_AFTER seconds after a configuration: raced once
+    tunnel.races.clear()
+    tunnel.configured = time.time() - daemon.RACE_AFTER
+    sup._race_unanswered(tunnel, peers)
+    sup.collect_races(wait=True)
+    assert len(tried) == 2
+    sup._race_unanswered(tunnel, peers)
+    assert sup.races == {}
+
+
+def test_adaptive_keepalive_pushed_and_reported(tmp_path, monkeypatch):
+    import keepalive
+    import uapi
+
+    sup = _supervisor(tmp_path, monkeypatch)
+    monkeypatch.setattr(uapi, 'available', lambda name, sudo_pwd=None: sudo_pwd is not None)
+    sets = []
+    monkeypatch.setattr(uapi, 'set_device', lambda name, **kw: sets.append(kw['peers']))
+    auto = base64.b64encode(bytes(32)).decode()
+    fixed = base64.b64encode(bytes([1] * 32)).decode()
+    profile = {'profile_name': 'a', 'interface_name': 'wg0',
+               'peers': [{'key': auto, 'keepalive': 'auto'}, {'key': fixed, 'keepalive': '30'}]}
+    tunnel = daemon.Tunnel(profile, _Proc(os.getpid()))
+    sup.tunnels['wg0'] = tunnel
+    assert list(tunnel.keepalives) == [auto]
+
+    now = int(time.time())
+    for i in range(keepalive.STABLE_HANDSHAKES):
+        sup.adapt_keepalives(tunnel, [{'public_key': auto, 'latest_handshake': now + i},
+                                      {'public_key': fixed, 'latest_handshake': now + i}])
+    interval = keepalive.ADAPTIVE_INITIAL * 2
+    assert sets == [[{'public_key': auto, 'update_only': True, 'persistent_keepalive': interval}]]
+
+    monkeypatch.setattr(sup, 'refresh_stats', lambda max_age=1.0: {'wg0': {'peers': []}})
+    status = sup.handle({'cmd': 'status'})['tunnels']['wg0']['keepalive']
+    assert status[auto]['interval'] == interval
+    assert status[auto]['adaptive'] is True
+    assert status[fixed] == {'interval': 30, 'adaptive': False}
@@ -0,0 +1,66 @@
+from debounce import Debouncer
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _debouncer(**kwargs):
+    clock = _Clock()
+    applied = []
+    deb = Debouncer(applied.append, clock=clock, **kwargs)
+    deb.applied_state = 'A'
+    return deb, clock, applied
+
+
+def test_burst_applies_final_state_once():
+    deb, clock, applied = _debouncer(window=1.0)
+    for state in ('B', 'C', 'D'):
+        deb.event(state)
+        clock.now += 0.25
+        assert deb.run_pending() is False
+    clock.now += 0.75
+    assert deb.run_pending() is True
+    assert applied == ['D']
+    assert deb.stats() == {'window': 1.0, 'events': 3, 'applied': 1, 'suppressed': 2, 'pending': False}
+
+
+def test_flap_back_to_applied_state_is_dropped():
+    deb, clock, applied = _debouncer(window=1.0)
+    deb.event('B')
+    deb.event('A')
+    clock.now += 1.0
+    assert deb.run_pending() is False
+    assert applied == []
+    assert deb.suppressed == 2
+
+
+def test_max_delay_bounds_constant_flapping():
+    deb, clock, applied = _debouncer(window=1.0, max_delay=2.0)
+    for i in range(5):
+        deb.event(f'S{i}')
+        clock.now += 0.5
+        deb.run_pending()
+    assert applied == ['S3']
+
+
+def test_runs_never_overlap():
+    deb, clock, applied = _debouncer(window=0)
+
+    def action(state):
+        # A change arriving while a reconfiguration runs waits for it
+        deb.event('C')
+        assert deb.run_pending() is False
+        applied.append(state)
+
+    deb.action = action
+    deb.event('B')
+    assert deb.run_pending() is True
+    assert applied == ['B']
+    assert deb.pending
+    assert deb.run_pending() is True
+    assert applied == ['B', 'C']
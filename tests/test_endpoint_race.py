@@ -0,0 +1,40 @@
+import time
+
+import endpoint_race
+
+
+def test_candidates_dedupe_and_order():
+    peer = {'endpoint': 'a.example.com:1', 'endpoints': 'b.example.com:1, a.example.com:1 c.example.com:1'}
+    assert endpoint_race.candidates(peer) == ['a.example.com:1', 'b.example.com:1', 'c.example.com:1']
+    assert endpoint_race.candidates({'endpoint': ''}) == []
+
+
+def test_handshake_race_shrinks_budget():
+    budgets = []
+    delays = {'a:1': 0.05, 'b:1': 0.01, 'c:1': None}
+
+    def attempt(endpoint, timeout):
+        budgets.append(timeout)
+        if delays[endpoint] is None:
+            return False
+        time.sleep(delays[endpoint])
+        return True
+
+    rtts = endpoint_race.race_handshakes(['a:1', 'b:1', 'c:1'], attempt, timeout=2.0)
+    assert rtts['c:1'] is None
+    assert endpoint_race.fastest(rtts) == 'b:1'
+    assert budgets[0] == 2.0
+    assert budgets[1] < 0.2
+    assert budgets[2] <= budgets[1]
+
+
+def test_handshake_race_keeps_answering_first_candidate():
+    tried = []
+
+    def attempt(endpoint, timeout):
+        tried.append(endpoint)
+        return True
+
+    rtts = endpoint_race.race_handshakes(['a:1', 'b:1'], attempt, keep_first=True)
+    assert tried == ['a:1']
+    assert endpoint_race.fastest(rtts) == 'a:1'
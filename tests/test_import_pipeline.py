@@ -0,0 +1,242 @@
+import json
+import os
+import zipfile
+
+import pytest
+
+import import_pipeline
+import secrets_store
+
+
+@pytest.fixture
+def conf(key):
+    """conf(i, name=None, address=..., private_key=None): a client .conf."""
+    def conf(i, name=None, address="10.0.0.2/32", private_key=None):
+        lines = ["[Interface]"]
+        if name:
+            lines.append(f"#Profile = {name}")
+        lines += [
+            f"PrivateKey = {private_key or key(i)}",
+            f"Address = {address}",
+            "[Peer]",
+            f"PublicKey = {key(200)}",
+            "AllowedIPs = 0.0.0.0/0",
+            "Endpoint = vpn.example.com:51820",
+        ]
+        return "\n".join(lines) + "\n"
+
+    return conf
+
+
+def _zip(tmp_path, members):
+    path = tmp_path / "configs.zip"
+    with zipfile.ZipFile(path, "w") as z:
+        for name, text in members:
+            z.writestr(name, text)
+    return str(path)
+
+
+def test_zip_import_reports_each_file(tmp_path, vpn_store, conf, key):
+    v, profiles_dir, writes = vpn_store()
+    (profiles_dir / "office").mkdir()
+    path = _zip(tmp_path, [
+        ("a.conf", conf(1, name="office")),
+        ("b.conf", conf(2, name="office")),
+        ("broken.conf", conf(3, address="")),
+        ("badkey.conf", conf(4, private_key="nope")),
+        ("readme.txt", "not a config"),
+    ])
+    events = []
+    res = import_pipeline.run(v, path, {"wg_office"}, progress=lambda done, total: events.append((done, total)))
+
+    assert res["error"] is None
+    assert res["profiles"] == ["office_1", "office_2"]
+    assert [r["source"] for r in res["results"]] == ["a.conf", "b.conf", "broken.conf", "badkey.conf"]
+    assert res["results"][2]["error"] == "Missing Address in [Interface]"
+    assert res["results"][3]["error"] == "Private key must be exactly 44 bytes long"
+    assert res["warning"] == "Skipped 2 of 4 configs"
+    assert events[-1] == (4, 4)
+    # one privileged write for all keys
+    assert writes == [{"office_1": key(1), "office_2": key(2)}]
+
+    ifaces = set()
+    for name in res["profiles"]:
+        data = json.loads((profiles_dir / name / "profile.json").read_text())
+        assert "private_key" not in data
+        assert data["pre_up"] == ""
+        ifaces.add(data["interface_name"])
+    assert len(ifaces) == 2 and "wg_office" not in ifaces
+    assert sorted(p.name for p in profiles_dir.iterdir()) == ["office", "office_1", "office_2"]
+
+
+def test_failed_key_write_commits_nothing(tmp_path, vpn_store, conf):
+    v, profiles_dir, writes = vpn_store("BAD_PASSWORD")
+    path = _zip(tmp_path, [("a.conf", conf(1)), ("b.conf", conf(2))])
+    res = import_pipeline.run(v, path, set(), progress=None)
+
+    assert res["profiles"] == []
+    assert res["error"].startswith("a.conf: Wrong password")
+    assert list(profiles_dir.iterdir()) == []
+
+
+def _stored_keys(monkeypatch, writes):
+    reads = []
+
+    def get_private_keys(names, sudo_pwd):
+        reads.append(list(names))
+        keys = {}
+        for batch in writes:
+            keys.update(batch)
+        return {name: keys[name] for name in names if name in keys}, None
+
+    monkeypatch.setattr(secrets_store, "get_private_keys", get_private_keys)
+    return reads
+
+
+def test_reimport_reports_present(tmp_path, monkeypatch, vpn_store, conf):
+    v, profiles_dir, writes = vpn_store()
+    reads = _stored_keys(monkeypatch, writes)
+    path = _zip(tmp_path, [("a.conf", conf(1, name="home")), ("b.conf", conf(2, name="office"))])
+    first = import_pipeline.run(v, path, set(), progress=None)
+    assert first["profiles"] == ["home", "office"]
+
+    # Same configs under other file names, plus a copy inside the zip
+    path = _zip(tmp_path, [("x.conf", conf(2, name="work")), ("y.conf", conf(1)), ("z.conf", conf(1))])
+    res = import_pipeline.run(v, path, {"wg_home", "wg_office"}, progress=None)
+
+    assert res["error"] is None
+    assert res["profiles"] == []
+    assert res["present"] == ["office", "home", "home"]
+    assert [r["status"] for r in res["results"]] == ["present"] * 3
+    assert len(writes) == 1 and reads == [["home", "office"]]
+    assert sorted(p.name for p in profiles_dir.iterdir()) == ["home", "office"]
+
+
+def test_same_key_new_config_updates_in_place(tmp_path, monkeypatch, vpn_store, conf, key):
+    v, profiles_dir, writes = vpn_store()
+    _stored_keys(monkeypatch, writes)
+    import_pipeline.run(v, _zip(tmp_path, [("a.conf", conf(1, name="home"))]), set(), progress=None)
+    stored = json.loads((profiles_dir / "home" / "profile.json").read_text())
+    stored["post_up"] = "echo up"
+    (profiles_dir / "home" / "profile.json").write_text(json.dumps(stored))
+
+    path = _zip(tmp_path, [
+        ("a.conf", conf(1, name="home", address="10.0.0.9/32")),
+        # Same config with another key is another profile
+        ("b.conf", conf(5, name="home")),
+    ])
+    res = import_pipeline.run(v, path, {stored["interface_name"]}, progress=None)
+
+    assert [r["status"] for r in res["results"]] == ["updated", "imported"]
+    assert res["profiles"] == ["home", "home_1"]
+    # Only the new profile's key is written
+    assert writes[1:] == [{"home_1": key(5)}]
+    data = json.loads((profiles_dir / "home" / "profile.json").read_text())
+    assert data["ip_address"] == "10.0.0.9/32"
+    assert data["interface_name"] == stored["interface_name"]
+    assert data["post_up"] == "echo up"
+    assert data["content_hash"] != stored["content_hash"]
+
+
+def test_unreadable_stored_profile_imports_as_new(tmp_path, monkeypatch, vpn_store, conf):
+    v, profiles_dir, writes = vpn_store()
+    _stored_keys(monkeypatch, writes)
+    import_pipeline.run(v, _zip(tmp_path, [("a.conf", conf(1, name="home"))]), set(), progress=None)
+    (profiles_dir / "home" / "profile.json").write_text("{not json")
+
+    path = _zip(tmp_path, [("a.conf", conf(1, name="home", address="10.0.0.9/32"))])
+    res = import_pipeline.run(v, path, set(), progress=None)
+
+    assert res["error"] is None
+    assert [r["status"] for r in res["results"]] == ["imported"]
+    assert res["profiles"] == ["home_1"]
+    assert (profiles_dir / "home" / "profile.json").read_text() == "{not json"
+
+
+def _bomb(tmp_path, members, compression=zipfile.ZIP_DEFLATED):
+    path = tmp_path / "bomb.zip"
+    with zipfile.ZipFile(path, "w", compression=compression) as z:
+        for name, data in members:
+            z.writestr(name, data)
+    return str(path)
+
+
+@pytest.mark.parametrize("members, limits, message", [
+    # 8 MiB of zeros deflate to about 8 KiB
+    (lambda conf: [("a.conf", conf(1)), ("bomb.conf", b"\0" * (8 << 20))], import_pipeline.LIMITS,
+     "is larger than"),
+    (lambda conf: [("bomb.conf", b"\0" * (512 << 10))], import_pipeline.LIMITS, "compression ratio over 100"),
+    (lambda conf: [(f"{i}.conf", conf(i)) for i in range(6)], import_pipeline.LIMITS._replace(members=5),
+     "Too many configs"),
+    (lambda conf: [(f"{i}.conf", conf(i)) for i in range(6)], import_pipeline.LIMITS._replace(total_bytes=1000),
+     "Configs in zip are larger than 1000 bytes"),
+])
+def test_bomb_is_rejected_before_reading(tmp_path, monkeypatch, members, limits, message, vpn_store, conf):
+    v, profiles_dir, writes = vpn_store()
+    path = _bomb(tmp_path, members(conf))
+    monkeypatch.setattr(zipfile.ZipFile, "open", lambda *args, **kwargs: pytest.fail("member read"))
+    res = import_pipeline.run(v, path, set(), progress=None, limits=limits)
+
+    assert message in res["error"]
+    assert res["profiles"] == [] and res["results"] == []
+    assert writes == [] and list(profiles_dir.iterdir()) == []
+
+
+def test_large_single_conf_is_rejected(tmp_path, vpn_store, conf):
+    v, profiles_dir, writes = vpn_store()
+    path = tmp_path / "big.conf"
+    path.write_text(conf(1) + "#" * 2000)
+    limits = import_pipeline.LIMITS._replace(member_bytes=1000)
+    res = import_pipeline.run(v, str(path), set(), progress=None, limits=limits)
+
+    assert res["error"].endswith("big.conf is larger than 1000 bytes")
+    assert writes == []
+
+
+def test_run_many_walks_files_zips_and_directories(tmp_path, monkeypatch, vpn_store, conf):
+    v, profiles_dir, writes = vpn_store()
+    _stored_keys(monkeypatch, writes)
+    folder = tmp_path / "migrate"
+    (folder / "sub").mkdir(parents=True)
+    for i in range(3):
+        (folder / f"c{i}.conf").write_text(conf(10 + i))
+    (folder / "notes.txt").write_text("skip me")
+    (folder / "sub" / "broken.zip").write_text("not a zip")
+    with zipfile.ZipFile(folder / "sub" / "more.zip", "w") as z:
+        z.writestr("d.conf", conf(20))
+        # Same config as c0.conf, stored by an earlier batch
+        z.writestr("e.conf", conf(10))
+    single = tmp_path / "single.conf"
+    single.write_text(conf(30))
+
+    events = []
+    res = import_pipeline.run_many(v, [str(folder), str(single), str(tmp_path / "missing.conf")], set(),
+                                   progress=lambda files, configs: events.append((files, configs)), batch=2)
+
+    assert [(os.path.relpath(item["path"], tmp_path), item["error"], item["configs"]) for item in res["items"]] == [
+        ("migrate/c0.conf", None, 1),
+        ("migrate/c1.conf", None, 1),
+        ("migrate/c2.conf", None, 1),
+        ("migrate/sub/broken.zip", "Bad zip file", 0),
+        ("migrate/sub/more.zip", None, 2),
+        ("single.conf", None, 1),
+        ("missing.conf", "File not found", 0),
+    ]
+    assert res["profiles"] == ["c0", "c1", "c2", "d", "single"]
+    assert res["present"] == ["c0"]
+    assert res["results"][4]["source"] == str(folder / "sub" / "more.zip" / "e.conf")
+    assert res["warning"] == "2 files could not be read"
+    assert events[-1] == (7, 6)
+    # One key write per batch
+    assert [sorted(batch) for batch in writes] == [["c0", "c1"], ["c2", "d"], ["single"]]
+    # Interfaces taken by earlier batches are not handed out again
+    ifaces = [json.loads((profiles_dir / name / "profile.json").read_text())["interface_name"]
+              for name in res["profiles"]]
+    assert len(set(ifaces)) == 5
+
+
+def test_run_many_reports_when_nothing_is_readable(tmp_path, vpn_store):
+    v, profiles_dir, writes = vpn_store()
+    res = import_pipeline.run_many(v, [str(tmp_path / "missing.zip")], set(), progress=None)
+    assert res["error"] == "File not found"
+    assert import_pipeline.run_many(v, [str(profiles_dir)], set(), progress=None)["error"] == "No .conf or .zip found"
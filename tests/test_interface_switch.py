@@ -0,0 +1,182 @@
+import socket
+import subprocess
+
+import pytest
+
+import interface
+
+
+@pytest.fixture(autouse=True)
+def _underlay_file(monkeypatch, tmp_path_factory):
+    monkeypatch.setattr(interface, 'UNDERLAY_FILE', tmp_path_factory.mktemp('underlay') / 'underlay.json')
+
+
+class _Recorder:
+    def __init__(self):
+        self.cmds = []
+        self.batches = []
+
+    def __call__(self, cmd, **kwargs):
+        self.cmds.append(cmd[2:] if cmd[:1] == ['/usr/bin/sudo'] else cmd)
+        if '-batch' in cmd:
+            with open(cmd[-1]) as f:
+                self.batches.append(f.read().splitlines())
+        return subprocess.CompletedProcess(cmd, 0, b'', b'')
+
+
+def _iface(monkeypatch):
+    rec = _Recorder()
+    monkeypatch.setattr(interface.subprocess, 'run', rec)
+    iface = interface.Interface('pwd')
+    monkeypatch.setattr(iface, 'interface_exists', lambda name: False)
+    monkeypatch.setattr(iface, '_setconf', lambda name, profile, config_file: None)
+    monkeypatch.setattr(iface, '_resolve_endpoint_ips', lambda ep, refresh=False: [ep.split(':')[0]])
+    monkeypatch.setattr(iface, '_get_default_route', lambda family: ('192.168.1.1', 'wlan0'))
+    return iface, rec
+
+
+def _profile(iface_name, addr, prefixes, endpoint):
+    return {
+        'profile_name': iface_name,
+        'interface_name': iface_name,
+        'ip_address': addr,
+        'dns_servers': '',
+        'peers': [{'allowed_prefixes': prefixes, 'endpoint': endpoint}],
+    }
+
+
+def test_switch_same_link_diffs_addresses_and_routes(monkeypatch):
+    iface, rec = _iface(monkeypatch)
+    old = _profile('wg0', '10.0.0.2/32, 10.0.0.3/32', '10.1.0.0/16, 10.2.0.0/16', '1.1.1.1:51820')
+    new = _profile('wg0', '10.0.0.2/32, 10.0.0.4/32', '10.2.0.0/16, 10.4.0.0/16', '2.2.2.2:51820')
+    err, ms = iface.switch_profile(old, new, None)
+    assert err is None
+    assert ms >= 0
+    cmds = rec.cmds
+    assert ['ip', 'address', 'del', '10.0.0.3/32', 'dev', 'wg0'] in cmds
+    assert ['ip', 'address', 'add', '10.0.0.4/32', 'dev', 'wg0'] in cmds
+    assert not any(c[:3] == ['ip', 'address', 'add'] and '10.0.0.2/32' in c for c in cmds)
+    assert rec.batches == [['route del 10.1.0.0/16 dev wg0', 'route replace 10.4.0.0/16 dev wg0']]
+    assert not any(c[:2] == ['ip', '-4'] for c in cmds)
+    assert ['ip', 'route', 'del', '1.1.1.1/32'] in cmds
+    assert ['ip', 'route', 'replace', '2.2.2.2/32', 'via', '192.168.1.1', 'dev', 'wlan0'] in cmds
+    assert not any(c[:3] == ['ip', 'link', 'del'] for c in cmds)
+
+
+def test_switch_renames_link(monkeypatch):
+    iface, rec = _iface(monkeypatch)
+    old = _profile('wg_a', '10.0.0.2/32', '0.0.0.0/0', '1.1.1.1:51820')
+    new = _profile('wg_b', '10.0.0.2/32', '0.0.0.0/0', '1.1.1.1:51820')
+    err, _ = iface.switch_profile(old, new, None)
+    assert err is None
+    assert ['ip', 'link', 'set', 'dev', 'wg_a', 'name', 'wg_b'] in rec.cmds
+    assert ['ip', 'route', 'replace', 'default', 'dev', 'wg_b'] in rec.cmds
+    assert not any(c[:3] == ['ip', 'address', 'add'] for c in rec.cmds)
+
+
+def test_switch_uses_underlay_recorded_at_bring_up(monkeypatch, tmp_path):
+    iface, rec = _iface(monkeypatch)
+    monkeypatch.setattr(interface.capabilities, 'resolvectl_path', lambda: None)
+    monkeypatch.setattr(iface, 'list_wireguard_interfaces', lambda: ['wg0'])
+    routes = {socket.AF_INET: 'default via 192.168.1.1 dev wlan0 proto dhcp\n', socket.AF_INET6: ''}
+
+    def check_output(cmd, **kwargs):
+        if cmd[-3:] == ['route', 'show', 'default']:
+            return routes[socket.AF_INET6 if '-6' in cmd else socket.AF_INET].encode()
+        return b''
+
+    monkeypatch.setattr(interface.subprocess, 'check_output', check_output)
+    monkeypatch.delattr(iface, '_get_default_route')
+    full = _profile('wg0', '10.0.0.2/32', '0.0.0.0/0', '1.1.1.1:51820')
+    assert iface.config_interface(full, str(tmp_path / 'wg0.conf')) is None
+    # The full tunnel now owns the default route
+    routes[socket.AF_INET] = 'default dev wg0 scope link\n'
+    rec.cmds.clear()
+
+    split = _profile('wg0', '10.0.0.2/32', '10.4.0.0/16', '2.2.2.2:51820')
+    err, _ = iface.switch_profile(full, split, None)
+    assert err is None
+    assert ['ip', 'route', 'replace', '2.2.2.2/32', 'via', '192.168.1.1', 'dev', 'wlan0'] in rec.cmds
+    assert ['ip', 'route', 'replace', 'default', 'via', '192.168.1.1', 'dev', 'wlan0'] in rec.cmds
+
+
+def test_exclusion_routes_follow_a_ddns_change(monkeypatch, tmp_path):
+    iface, rec = _iface(monkeypatch)
+    monkeypatch.delattr(iface, '_resolve_endpoint_ips')
+    monkeypatch.setattr(interface.capabilities, 'resolvectl_path', lambda: None)
+    answers = {'vpn.example.com': ['198.51.100.1']}
+    monkeypatch.setattr(interface.resolver, 'default', interface.resolver.Resolver(lookup=lambda host: answers[host]))
+    old = _profile('wg0', '10.0.0.2/32', '10.1.0.0/16', 'vpn.example.com:51820')
+    new = _profile('wg0', '10.0.0.2/32', '10.1.0.0/16', 'other.example.com:51820')
+    assert iface.config_interface(old, str(tmp_path / 'wg0.conf')) is None
+    assert ['ip', 'route', 'replace', '198.51.100.1/32', 'via', '192.168.1.1', 'dev', 'wlan0'] in rec.cmds
+
+    # The host moved while its old answer is still cached
+    answers['vpn.example.com'] = ['198.51.100.2']
+    answers['other.example.com'] = ['198.51.100.1']
+    rec.cmds.clear()
+    assert iface.config_interface(old, str(tmp_path / 'wg0.conf')) is None
+    assert ['ip', 'route', 'replace', '198.51.100.2/32', 'via', '192.168.1.1', 'dev', 'wlan0'] in rec.cmds
+
+    # A switch removes the route that was installed and adds a fresh one
+    answers['vpn.example.com'] = ['198.51.100.3']
+    rec.cmds.clear()
+    err, _ = iface.switch_profile(old, new, None)
+    assert err is None
+    assert ['ip', 'route', 'del', '198.51.100.2/32'] in rec.cmds
+    assert ['ip', 'route', 'replace', '198.51.100.1/32', 'via', '192.168.1.1', 'dev', 'wlan0'] in rec.cmds
+
+
+def test_config_interface_installs_routes_in_one_batch(monkeypatch, tmp_path):
+    iface, rec = _iface(monkeypatch)
+    monkeypatch.setattr(interface.capabilities, 'resolvectl_path', lambda: None)
+    batches = []
+
+    def run(cmd, **kwargs):
+        if '-batch' in cmd:
+            batches.append(open(cmd[-1]).read().splitlines())
+        return rec(cmd, **kwargs)
+
+    monkeypatch.setattr(interface.subprocess, 'run', run)
+    profile = _profile('wg_hub', '10.99.0.1/16', '', '')
+    profile.update(kind='server', listen_port=51820, extra_routes='192.168.50.0/24')
+    profile['peers'] = [{'key': f'key{i}', 'allowed_prefixes': f'10.{i // 256}.{i % 256}.0/24', 'endpoint': ''}
+                        for i in range(1, 301)]
+    assert iface.config_interface(profile, str(tmp_path / 'wg_hub.conf')) is None
+
+    assert len(batches) == 2
+    assert len(batches[0]) == 300
+    assert batches[0][0] == 'route replace 10.0.1.0/24 dev wg_hub'
+    assert batches[1] == ['route replace 192.168.50.0/24 dev wg_hub']
+    # No per-route sudo calls and no endpoint exclusion for a hub
+    assert not any(c[:3] == ['ip', 'route', 'replace'] for c in rec.cmds)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_auto_mtu_is_probed_after_bring_up(monkeypatch, tmp_path):
+    import threading
+
+    iface, rec = _iface(monkeypatch)
+    monkeypatch.setattr(interface.capabilities, 'resolvectl_path', lambda: None)
+    monkeypatch.setattr(interface.pmtu, 'CACHE_FILE', tmp_path / 'pmtu.json')
+    release = threading.Event()
+    monkeypatch.setattr(interface.pmtu, 'probe_path_mtu', lambda target, ping=None: release.wait(5) and 1420)
+    threads = []
+    probe_later = iface._probe_mtu_later
+    monkeypatch.setattr(iface, '_probe_mtu_later', lambda *args: threads.append(probe_later(*args)))
+    profile = dict(_profile('wg0', '10.0.0.2/32', '0.0.0.0/0', '1.1.1.1:51820'), mtu='auto')
+    mtu_cmd = ['ip', 'link', 'set', 'dev', 'wg0', 'mtu', '1360']
+
+    # The connect does not wait for the probe
+    assert iface.config_interface(profile, str(tmp_path / 'wg0.conf')) is None
+    assert mtu_cmd not in rec.cmds
+    monkeypatch.setattr(iface, 'interface_exists', lambda name: True)
+    release.set()
+    threads[0].join(5)
+    assert rec.cmds[-1] == mtu_cmd
+
+    # Cached for this endpoint and network: set before the link comes up
+    rec.cmds.clear()
+    assert iface.config_interface(profile, str(tmp_path / 'wg0.conf')) is None
+    assert rec.cmds.index(mtu_cmd) < rec.cmds.index(['ip', 'link', 'set', 'up', 'dev', 'wg0'])
+    assert threads[1] is None
@@ -0,0 +1,72 @@
+import keepalive
+from wg_config import build_config
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_peer_interval_and_validation():
+    assert keepalive.peer_interval({'endpoint': 'vpn.example.com:51820'}) == keepalive.DEFAULT_INTERVAL
+    # Server-side peers without an endpoint are not kept alive by default
+    assert keepalive.peer_interval({}) == 0
+    assert keepalive.peer_interval({'keepalive': '25'}) == 25
+    assert keepalive.peer_interval({'keepalive': 'off'}) == 0
+    assert keepalive.peer_interval({'keepalive': '0'}) == 0
+    assert keepalive.peer_interval({'keepalive': 'Auto'}) == keepalive.ADAPTIVE_INITIAL
+    for value in ('', None, '15', 'off', 'auto'):
+        assert keepalive.validate(value) is None
+    assert keepalive.validate('fast')
+    assert keepalive.validate('70000')
+
+
+def test_build_config_per_peer_keepalive():
+    profile = {'peers': [
+        {'key': 'a', 'allowed_prefixes': '10.0.0.0/24', 'endpoint': 'a:1'},
+        {'key': 'b', 'allowed_prefixes': '10.0.1.0/24', 'endpoint': 'b:1', 'keepalive': 'off'},
+        {'key': 'c', 'allowed_prefixes': '10.0.2.0/24', 'endpoint': 'c:1', 'keepalive': '60'},
+    ]}
+    text = build_config(profile)
+    assert text.count('PersistentKeepalive') == 2
+    assert 'PersistentKeepalive = 5' in text
+    assert 'PersistentKeepalive = 60' in text
+
+
+def test_adaptive_lengthens_while_stable():
+    clock = _Clock()
+    adaptive = keepalive.AdaptiveKeepalive(interval=20, maximum=120, stable_handshakes=3, clock=clock)
+    assert adaptive.observe(0) is None
+    changes = []
+    for i in range(1, 10):
+        clock.now += 120
+        changes.append(adaptive.observe(clock.now))
+    assert [c for c in changes if c] == [40, 80, 120]
+    # polling again without a new handshake changes nothing
+    assert adaptive.observe(clock.now) is None
+    assert adaptive.interval == 120
+
+
+def test_adaptive_backs_off_after_stale_handshake():
+    clock = _Clock()
+    adaptive = keepalive.AdaptiveKeepalive(interval=80, minimum=10, stable_handshakes=1,
+                                           stale_age=180, clock=clock)
+    handshake = clock.now
+    adaptive.observe(handshake)
+    assert adaptive.interval == 120
+
+    clock.now += 200
+    assert adaptive.observe(handshake) == 60
+    # one back-off per stale period
+    clock.now += 60
+    assert adaptive.observe(handshake) is None
+
+    # growth stops short of the interval that failed
+    for _ in range(3):
+        clock.now += 120
+        adaptive.observe(clock.now)
+    assert adaptive.interval == 90
+    assert adaptive.state() == {'interval': 90, 'adaptive': True, 'ceiling': 90, 'changes': 3}
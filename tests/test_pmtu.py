@@ -0,0 +1,61 @@
+import pmtu
+
+
+def _fake_ping(path_mtu, report=False):
+    sent = []
+
+    def ping(target, mtu):
+        sent.append(mtu)
+        if mtu <= path_mtu:
+            return True, None
+        return False, (path_mtu if report else None)
+    ping.sent = sent
+    return ping
+
+
+def test_probe_binary_search():
+    ping = _fake_ping(1412)
+    assert pmtu.probe_path_mtu('192.0.2.1', ping=ping) == 1412
+    assert len(ping.sent) <= 10
+
+
+def test_probe_uses_reported_mtu():
+    ping = _fake_ping(1400, report=True)
+    assert pmtu.probe_path_mtu('192.0.2.1', ping=ping) == 1400
+    assert ping.sent == [1500, 1400]
+
+
+def test_probe_filtered_icmp():
+    assert pmtu.probe_path_mtu('192.0.2.1', ping=lambda target, mtu: (False, None)) is None
+
+
+def test_tunnel_mtu_cached_per_network(tmp_path, monkeypatch):
+    monkeypatch.setattr(pmtu, 'CACHE_FILE', tmp_path / 'pmtu.json')
+    wifi = _fake_ping(1500)
+    assert pmtu.tunnel_mtu('192.0.2.1', 'wlan0', '192.168.1.1', ping=wifi) == 1440
+    assert pmtu.tunnel_mtu('2001:db8::1', 'wlan0', '192.168.1.1', ping=wifi) == 1420
+    probes = len(wifi.sent)
+    assert pmtu.tunnel_mtu('192.0.2.1', 'wlan0', '192.168.1.1', ping=wifi) == 1440
+    assert len(wifi.sent) == probes
+
+    mobile = _fake_ping(1380)
+    assert pmtu.tunnel_mtu('192.0.2.1', 'rmnet0', '10.0.0.1', ping=mobile) == 1320
+    assert pmtu.tunnel_mtu('192.0.2.1', 'wlan0', '192.168.1.1', refresh=True, ping=mobile) == 1320
+
+
+def test_tunnel_mtu_cached_per_endpoint_and_failure(tmp_path, monkeypatch):
+    monkeypatch.setattr(pmtu, 'CACHE_FILE', tmp_path / 'pmtu.json')
+    assert pmtu.cached_tunnel_mtu('192.0.2.1', 'wlan0', '192.168.1.1') == (False, None)
+    assert pmtu.tunnel_mtu('192.0.2.1', 'wlan0', '192.168.1.1', ping=_fake_ping(1500)) == 1440
+    assert pmtu.cached_tunnel_mtu('192.0.2.1', 'wlan0', '192.168.1.1') == (True, 1440)
+    # Another endpoint behind the same gateway is probed on its own
+    assert pmtu.tunnel_mtu('198.51.100.1', 'wlan0', '192.168.1.1', ping=_fake_ping(1400)) == 1340
+
+    # ICMP filtered: not probed again until FAILED_TTL has passed
+    filtered = _fake_ping(0)
+    assert pmtu.tunnel_mtu('203.0.113.1', 'wlan0', '192.168.1.1', ping=filtered) is None
+    probes = len(filtered.sent)
+    assert pmtu.tunnel_mtu('203.0.113.1', 'wlan0', '192.168.1.1', ping=filtered) is None
+    assert len(filtered.sent) == probes
+    monkeypatch.setattr(pmtu.time, 'time', lambda: 10 ** 10)
+    assert pmtu.cached_tunnel_mtu('203.0.113.1', 'wlan0', '192.168.1.1') == (False, None)
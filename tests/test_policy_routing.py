@@ -0,0 +1,48 @@
+import policy_routing
+
+
+def _profile(name, prefixes, extra=""):
+    return {
+        "profile_name": name,
+        "extra_routes": extra,
+        "peers": [{"name": "p", "allowed_prefixes": prefixes, "endpoint": "vpn.example.com:51820"}],
+    }
+
+
+def test_allocate_table_keeps_preferred_and_skips_used():
+    assert policy_routing.allocate_table(51825, {51820}) == 51825
+    assert policy_routing.allocate_table(51820, {51820, 51821}) == 51822
+    assert policy_routing.allocate_table(None, set()) == 51820
+
+
+def test_split_and_full_tunnel_do_not_conflict():
+    corp = _profile("corp", "10.0.0.0/8, 172.16.0.0/12")
+    exit_node = _profile("exit", "0.0.0.0/0, ::/0")
+    assert policy_routing.find_conflicts(corp, [exit_node]) == []
+
+
+def test_conflicts_detected():
+    a = _profile("a", "0.0.0.0/0", extra="10.1.0.0/16")
+    b = _profile("b", "0.0.0.0/0", extra="10.1.2.0/24")
+    conflicts = policy_routing.find_conflicts(a, [b], {"b": ["10.1.5.5"]})
+    assert any("IPv4" in c for c in conflicts)
+    assert any("overlaps" in c for c in conflicts)
+    assert any("endpoint 10.1.5.5" in c for c in conflicts)
+
+
+def test_rule_commands_and_owned_rules():
+    profile = _profile("exit", "0.0.0.0/0", extra="192.168.50.0/24")
+    cmds = policy_routing.rule_commands(51821, profile)
+    assert ['ip', '-4', 'rule', 'add', 'to', '192.168.50.0/24', 'lookup', '51821', 'priority', '10001'] in cmds
+    assert ['ip', '-4', 'rule', 'add', 'not', 'fwmark', '51821', 'lookup', '51821', 'priority', '20003'] in cmds
+    assert not any(cmd[1] == '-6' for cmd in cmds)
+
+    output = "\n".join([
+        "0:\tfrom all lookup local",
+        "10001:\tfrom all to 192.168.50.0/24 lookup 51821",
+        "20002:\tfrom all lookup main suppress_prefixlength 0",
+        "20003:\tnot from all fwmark 0xca6d lookup 51821",
+        "20004:\tfrom all lookup main suppress_prefixlength 0",
+        "32766:\tfrom all lookup main",
+    ])
+    assert [prio for prio, _ in policy_routing.owned_rules(51821, output)] == [10001, 20002, 20003]
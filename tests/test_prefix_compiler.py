@@ -0,0 +1,31 @@
+from ipaddress import ip_network
+
+from prefix_compiler import compile_prefixes, peer_allowed_ips
+
+
+def test_collapses_adjacent_and_nested():
+    nets = compile_prefixes("10.0.0.0/24, 10.0.1.0/24, 10.0.0.128/25, 10.0.0.0/24")
+    assert [str(n) for n in nets] == ["10.0.0.0/23"]
+
+
+def test_exclude_lan_from_default_route():
+    lan = ["10.0.0.0/8", "172.16.0.0/12", "192.168.0.0/16"]
+    nets = compile_prefixes(["0.0.0.0/0", "::/0"], lan)
+    assert ip_network("::/0") in nets
+    v4 = [n for n in nets if n.version == 4]
+    for excluded in lan:
+        assert not any(n.overlaps(ip_network(excluded)) for n in v4)
+    assert sum(n.num_addresses for n in v4) == 2 ** 32 - sum(ip_network(x).num_addresses for x in lan)
+    # minimal: merging any two neighbours must be impossible
+    assert len(v4) == len(list(compile_prefixes([str(n) for n in v4])))
+
+
+def test_exclude_everything_and_outside_ranges():
+    assert compile_prefixes("10.0.0.0/8", "0.0.0.0/0") == []
+    assert [str(n) for n in compile_prefixes("10.0.0.0/8", "192.168.0.0/16, fd00::/8")] == ["10.0.0.0/8"]
+
+
+def test_peer_allowed_ips():
+    peer = {"allowed_prefixes": "192.168.0.0/16", "excluded_prefixes": "192.168.1.0/24"}
+    assert peer_allowed_ips(peer)[0] == "192.168.0.0/24"
+    assert peer_allowed_ips({"allowed_prefixes": "bogus, 10.0.0.0/8"}) == ["bogus", "10.0.0.0/8"]
@@ -0,0 +1,104 @@
+import json
+import zipfile
+
+import pytest
+
+import profile_export
+import secrets_store
+
+
+def _write(profiles_dir, name, i, key, **extra):
+    data = {
+        "profile_name": name,
+        "interface_name": f"wg{i}",
+        "ip_address": f"10.0.{i}.2/32",
+        "dns_servers": "1.1.1.1",
+        "peers": [{
+            "name": "server",
+            "key": key(100 + i),
+            "allowed_prefixes": "0.0.0.0/0",
+            "endpoint": "vpn.example.com:51820",
+            "presharedKey": "",
+            "keepalive": "auto",
+        }],
+    }
+    data.update(extra)
+    (profiles_dir / name).mkdir()
+    (profiles_dir / name / "profile.json").write_text(json.dumps(data))
+
+
+@pytest.fixture
+def exported(tmp_path, monkeypatch, key):
+    """(Vpn, profiles dir, get_private_keys() calls) for three stored profiles."""
+    import vpn
+
+    profiles_dir = tmp_path / "profiles"
+    profiles_dir.mkdir()
+    monkeypatch.setattr(profile_export, "PROFILES_DIR", profiles_dir)
+    monkeypatch.setattr(profile_export, "INDEX_FILE", tmp_path / "export_index.json")
+    calls = []
+
+    def get_private_keys(names, sudo_pwd):
+        calls.append(list(names))
+        return {name: key(i) for i, name in enumerate(names, 1) if name != "nokey"}, None
+
+    monkeypatch.setattr(secrets_store, "get_private_keys", get_private_keys)
+    v = vpn.Vpn()
+    monkeypatch.setattr(v, "_get_private_key_status", lambda name, data=None: (None, "MISSING"))
+    for i, name in enumerate(["home", "office", "nokey"], 1):
+        _write(profiles_dir, name, i, key, mtu="1380" if name == "office" else "")
+    return v, profiles_dir, calls
+
+
+def _members(path):
+    with zipfile.ZipFile(path) as z:
+        return {name: z.read(name).decode() for name in z.namelist()}
+
+
+def test_export_reads_keys_once_and_round_trips(tmp_path, exported):
+    v, profiles_dir, calls = exported
+    target = tmp_path / "out.zip"
+    res = v.export_confs_zip(str(target))
+
+    assert res["error"] is None
+    assert res["profiles"] == ["home", "office"]
+    assert "missing private key: nokey" in res["warning"]
+    assert calls == [["home", "nokey", "office"]]
+    members = _members(target)
+    assert sorted(members) == ["home.conf", "office.conf"]
+    assert "MTU = 1380" in members["office.conf"]
+    assert "#Keepalive = auto" in members["home.conf"]
+
+    fields, diagnostics = v.parse_conf(members["office.conf"].splitlines(), "x")
+    assert diagnostics == []
+    assert fields["profile_name"] == "office"
+    assert fields["ip_address"] == "10.0.2.2/32"
+    assert fields["peers"][0]["keepalive"] == "auto"
+    assert (fields["mtu"], fields["wg_quick"]) == ("1380", {})
+
+
+def test_export_selected_profiles_to_fd(tmp_path, exported):
+    v, profiles_dir, calls = exported
+    target = tmp_path / "fd.zip"
+    with open(target, "wb") as f:
+        res = v.export_confs_zip(f.fileno(), profiles=["office"])
+    assert res["error"] is None and res["path"] is None
+    assert calls == [["office"]]
+    assert list(_members(target)) == ["office.conf"]
+
+
+def test_incremental_export_skips_unchanged(tmp_path, exported):
+    v, profiles_dir, calls = exported
+    assert v.export_confs_zip(str(tmp_path / "full.zip"))["error"] is None
+
+    res = v.export_confs_zip(str(tmp_path / "none.zip"), incremental=True)
+    assert res["error"] == "No changes since the last export"
+    assert not (tmp_path / "none.zip").exists()
+
+    data = json.loads((profiles_dir / "home" / "profile.json").read_text())
+    data["dns_servers"] = "9.9.9.9"
+    (profiles_dir / "home" / "profile.json").write_text(json.dumps(data))
+    res = v.export_confs_zip(str(tmp_path / "delta.zip"), incremental=True)
+    assert res["profiles"] == ["home"]
+    assert res["unchanged"] == ["office"]
+    assert list(_members(tmp_path / "delta.zip")) == ["home.conf"]
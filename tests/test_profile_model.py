@@ -0,0 +1,150 @@
+import json
+import os
+from ipaddress import ip_interface, ip_network
+
+import pytest
+
+import profile_model
+import uapi
+from wg_config import build_config
+
+KEY = 'A' * 43 + '='
+
+
+def _data():
+    return {
+        'profile_name': 'home',
+        'interface_name': 'wg0',
+        'ip_address': '10.0.0.2/32, fd00::2/128',
+        'dns_servers': '10.0.0.1',
+        'extra_routes': '192.168.10.0/24',
+        'mtu': 'Auto',
+        'routing_table': '51821',
+        'peers': [{'name': 'gw', 'key': KEY, 'endpoint': '203.0.113.1:51820',
+                   'allowed_prefixes': '0.0.0.0/0, ::/0', 'excluded_prefixes': '192.168.0.0/16',
+                   'presharedKey': '', 'keepalive': '0'}],
+    }
+
+
+def test_fields_are_parsed_once():
+    profile = profile_model.Profile(_data())
+    assert profile.addresses == (ip_interface('10.0.0.2/32'), ip_interface('fd00::2/128'))
+    assert profile.address_list == ['10.0.0.2/32', 'fd00::2/128']
+    assert profile.extra_routes == (ip_network('192.168.10.0/24'),)
+    assert profile.dns == ('10.0.0.1',)
+    assert profile.mtu == 'auto'
+    assert profile.routing_table == 51821
+    assert profile.first_endpoint == '203.0.113.1:51820'
+    peer = profile.peers[0]
+    assert peer.key == KEY
+    assert peer.keepalive == 'off'
+    assert peer.excluded_prefixes == (ip_network('192.168.0.0/16'),)
+    assert '192.168.0.0/16' not in peer.allowed_ips and '0.0.0.0/1' in peer.allowed_ips
+    prefixes, default_v4, default_v6 = profile.routes()
+    # The exclusion splits the IPv4 default route, IPv6 keeps it
+    assert not default_v4 and default_v6
+    assert prefixes[-1] == '192.168.10.0/24'
+
+
+def test_reads_like_the_stored_dict():
+    data = _data()
+    profile = profile_model.Profile(data)
+    assert profile['interface_name'] == 'wg0'
+    assert profile.get('missing', 'x') == 'x'
+    assert profile['peers'][0].get('name') == 'gw'
+    assert profile.to_dict() == data
+    assert profile.to_dict() is profile.to_dict()
+    assert json.loads(json.dumps(profile_model.plain(profile))) == data
+    assert 'PublicKey = ' + KEY in build_config(profile)
+    assert uapi.profile_peers(profile)[0]['persistent_keepalive'] == 0
+
+
+def test_replace_shares_peers():
+    profile = profile_model.Profile(_data())
+    copy = profile.replace(private_key='secret', routing_table=None)
+    assert copy.peers[0] is profile.peers[0]
+    assert copy.routing_table is None and copy['private_key'] == 'secret'
+    moved = profile.peers[0].replace(endpoint='1.2.3.4:51820')
+    switched = profile.replace_peer(profile.peers[0], moved)
+    assert switched.first_endpoint == '1.2.3.4:51820'
+    assert profile.first_endpoint == '203.0.113.1:51820'
+
+
+def test_replace_parses_only_changed_fields(monkeypatch):
+    profile = profile_model.Profile(_data())
+    routes = profile.routes()
+    table = profile.peer_table
+    monkeypatch.setattr(profile_model, 'ip_interface', None)
+    copy = profile.replace(interface_name='wg9', routing_table=51821)
+    assert copy.addresses is profile.addresses
+    assert copy._routes is profile._routes and copy.routes() == routes
+    assert copy.peer_table is table
+    assert (copy.interface_name, copy.routing_table) == ('wg9', 51821)
+    assert copy.to_dict()['interface_name'] == 'wg9' and profile.interface_name != 'wg9'
+    monkeypatch.undo()
+
+    rerouted = copy.replace(extra_routes='192.168.50.0/24')
+    assert '192.168.50.0/24' in rerouted.routes()[0] and '192.168.50.0/24' not in copy.routes()[0]
+    readdressed = copy.replace(ip_address='10.9.0.2/32')
+    assert readdressed.address_list == ['10.9.0.2/32']
+    with pytest.raises(profile_model.ProfileError, match='Bad routing table main'):
+        profile.replace(routing_table='main')
+
+
+@pytest.mark.parametrize('field, value, message', [
+    ('ip_address', '10.0.0.300/32', 'Bad ip address 10.0.0.300/32'),
+    ('extra_routes', '10.0.0.0/33', 'Bad route 10.0.0.0/33'),
+    ('routing_table', 'main', 'Bad routing table main'),
+])
+def test_bad_fields_raise(field, value, message):
+    with pytest.raises(profile_model.ProfileError, match=message):
+        profile_model.Profile(dict(_data(), **{field: value}))
+
+
+def test_bad_peer_prefix_raises():
+    data = _data()
+    data['peers'][0]['allowed_prefixes'] = '10.0.0.0/99'
+    with pytest.raises(profile_model.ProfileError, match=r'Bad peer \(gw\) prefix 10.0.0.0/99'):
+        profile_model.Profile(data)
+
+
+def test_load_parses_once_per_change(tmp_path):
+    path = tmp_path / 'profile.json'
+    path.write_text(json.dumps(_data()))
+    first = profile_model.load(path)
+    assert profile_model.load(path) is first
+
+    tmp = tmp_path / 'profile.json.tmp'
+    tmp.write_text(json.dumps(dict(_data(), interface_name='wg1')))
+    os.replace(tmp, path)
+    second = profile_model.load(path)
+    assert second is not first
+    assert second.interface_name == 'wg1'
+
+
+def test_content_hash_ignores_names_and_key():
+    profile = profile_model.Profile(_data())
+    renamed = profile.replace(profile_name='other', interface_name='wg9', private_key='secret', post_up='true')
+    assert renamed.content_hash == profile.content_hash
+    reordered = profile.replace(ip_address='fd00::2/128, 10.0.0.2/32')
+    assert reordered.content_hash == profile.content_hash
+    assert profile.replace(mtu='1420').content_hash != profile.content_hash
+    moved = profile.replace_peer(profile.peers[0], profile.peers[0].replace(endpoint='1.2.3.4:51820'))
+    assert moved.content_hash != profile.content_hash
+
+
+def test_server_profile():
+    data = dict(_data(), kind='Server', listen_port='51820')
+    data['peers'] = [dict(data['peers'][0], endpoint='', key=f'{i:043d}=', name=f'site{i}') for i in range(3)]
+    profile = profile_model.Profile(data)
+    assert profile.is_server and profile.listen_port == 51820
+    assert profile.first_endpoint is None
+    assert profile.peer_table['0000000000000000000000000000000000000000002='] is profile.peers[2]
+    assert profile.content_hash != profile.replace(listen_port=51821).content_hash
+    # Client hashes stored before server profiles existed stay valid
+    client = profile_model.Profile(_data())
+    assert client.content_hash == client.replace(kind='client', listen_port='').content_hash
+    with pytest.raises(profile_model.ProfileError, match='Bad profile kind relay'):
+        profile_model.Profile(dict(_data(), kind='relay'))
+    with pytest.raises(profile_model.ProfileError, match='Bad listen port x'):
+        profile_model.Profile(dict(_data(), listen_port='x'))
@@ -0,0 +1,42 @@
+import resolver
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_split_endpoint():
+    assert resolver.split_endpoint('vpn.example.com:51820') == ('vpn.example.com', 51820)
+    assert resolver.split_endpoint('[2001:db8::1]:443') == ('2001:db8::1', 443)
+    assert resolver.split_endpoint('vpn.example.com') == ('vpn.example.com', None)
+    assert resolver.format_endpoint('2001:db8::1', 443) == '[2001:db8::1]:443'
+
+
+def test_cache_ttl_and_negative_answers():
+    clock = _Clock()
+    answers = {'ddns.example.com': ['1.1.1.1']}
+    res = resolver.Resolver(ttl=300, negative_ttl=30, clock=clock,
+                            lookup=lambda host: answers.get(host) or [])
+
+    assert res.resolve('ddns.example.com') == ['1.1.1.1']
+    answers['ddns.example.com'] = ['2.2.2.2']
+    clock.now = 299
+    assert res.resolve('ddns.example.com') == ['1.1.1.1']
+    assert res.lookups == 1
+    clock.now = 300
+    assert res.expired('ddns.example.com')
+    assert res.resolve('ddns.example.com') == ['2.2.2.2']
+
+    # DNS down: the last answer is kept and retried after the negative TTL
+    answers.clear()
+    assert res.resolve('ddns.example.com', refresh=True) == ['2.2.2.2']
+    assert not res.expired('ddns.example.com')
+    clock.now = 330
+    assert res.expired('ddns.example.com')
+
+    assert res.resolve('10.0.0.1') == ['10.0.0.1']
+    assert res.lookups == 3
@@ -0,0 +1,165 @@
+import json
+import os
+
+import secrets_store
+
+
+def test_save_profiles_single_key_write(vpn_store, profile_fields, key):
+    v, profiles_dir, writes = vpn_store()
+    res = v.save_profiles([profile_fields("home", 1), profile_fields("office", 2, mtu="1380")])
+
+    assert res == {"error": None, "results": [{"profile_name": "home", "error": None, "errors": []},
+                                              {"profile_name": "office", "error": None, "errors": []}]}
+    assert writes == [{"home": key(1), "office": key(2)}]
+    home = json.loads((profiles_dir / "home" / "profile.json").read_text())
+    office = json.loads((profiles_dir / "office" / "profile.json").read_text())
+    assert home["interface_name"] != office["interface_name"]
+    assert office["mtu"] == "1380"
+    assert not list(profiles_dir.glob("*/profile.json.tmp"))
+    assert oct(os.stat(profiles_dir / "home" / "profile.json").st_mode & 0o777) == "0o600"
+
+
+def test_save_profiles_invalid_entry_saves_nothing(vpn_store, profile_fields):
+    v, profiles_dir, writes = vpn_store()
+    res = v.save_profiles([profile_fields("home", 1), profile_fields("bad", 2, ip_address="nope"),
+                           profile_fields("home", 3)])
+
+    assert res["error"] == "2 of 3 profiles are invalid, nothing was saved"
+    assert res["results"][0]["error"] is None
+    assert res["results"][1]["error"].startswith("Bad ip address nope")
+    assert res["results"][2]["error"] == "Duplicate profile name: home"
+    assert writes == []
+    assert list(profiles_dir.iterdir()) == []
+
+
+def test_save_profiles_key_failure_rolls_back(vpn_store, profile_fields):
+    v, profiles_dir, writes = vpn_store()
+    assert v.save_profiles([profile_fields("home", 1)])["error"] is None
+    before = (profiles_dir / "home" / "profile.json").read_text()
+
+    v, profiles_dir, writes = vpn_store("SUDO_FAILED")
+    res = v.save_profiles([profile_fields("home", 1, dns_servers="9.9.9.9"), profile_fields("new", 2)])
+    assert res["error"] == "Secret storage error: SUDO_FAILED"
+    assert all(r["error"] == res["error"] for r in res["results"])
+    assert (profiles_dir / "home" / "profile.json").read_text() == before
+    assert sorted(p.name for p in profiles_dir.iterdir()) == ["home"]
+    assert not (profiles_dir / "home" / "profile.json.tmp").exists()
+
+
+def test_switch_profile_reconnects_multi_tunnel_link(monkeypatch, vpn_store, profile_fields):
+    v, profiles_dir, _ = vpn_store()
+    assert v.save_profiles([profile_fields("home", 1), profile_fields("office", 2)])["error"] is None
+    stored = json.loads((profiles_dir / "home" / "profile.json").read_text())
+    stored["routing_table"] = 51821
+    (profiles_dir / "home" / "profile.json").write_text(json.dumps(stored))
+
+    class Iface:
+        def interface_exists(self, name):
+            return True
+
+        def policy_rules_active(self, table):
+            return table == 51821
+
+        def switch_profile(self, *args):
+            raise AssertionError("in-place switch with live policy rules")
+
+    v.interface = Iface()
+    monkeypatch.setattr(v, "_connect", lambda name, use_kmod, safe_preup=True: None)
+    res = v.switch_profile("home", "office")
+    assert res["error"] is None
+    assert res["fast"] is False
+
+
+def test_get_profile_reads_through_the_model(vpn_store, profile_fields, key):
+    import profile_model
+
+    v, profiles_dir, _ = vpn_store()
+    assert v.save_profile("home", "10.0.1.2/32", key(1), "", "", "1.1.1.1", "", "", "", "",
+                          profile_fields("home", 1)["peers"], mtu="1380") is None
+    stored = profile_model.load(profiles_dir / "home" / "profile.json")
+    data = v.get_profile("home")
+    assert (data["mtu"], data["kind"], data["listen_port"], data["private_key"]) == ("1380", "client", "", "")
+    data["peers"][0]["endpoint"] = "changed:1"
+    data["interface_name"] = "changed"
+    assert stored.to_dict()["peers"][0]["endpoint"] == "vpn.example.com:51820"
+    assert "has_private_key" not in stored
+    assert [p["profile_name"] for p in v.list_profiles()] == ["home"]
+    assert profile_model.load(profiles_dir / "home" / "profile.json") is stored
+
+
+def test_save_profiles_rename_failure_restores_every_file(monkeypatch, vpn_store, profile_fields):
+    import vpn
+
+    v, profiles_dir, writes = vpn_store()
+    assert v.save_profiles([profile_fields("home", 1)])["error"] is None
+    before = (profiles_dir / "home" / "profile.json").read_text()
+    deleted = []
+    monkeypatch.setattr(secrets_store, "delete_private_keys",
+                        lambda names, sudo_pwd, pending=(): deleted.append((sorted(names), list(pending)))
+                        or (True, None))
+    real_replace = os.replace
+    renames = []
+
+    def replace(src, dst):
+        if str(src).endswith("profile.json.tmp"):
+            renames.append(src)
+            if len(renames) == 2:
+                raise OSError(28, "No space left on device")
+        return real_replace(src, dst)
+
+    monkeypatch.setattr(vpn.os, "replace", replace)
+    res = v.save_profiles([profile_fields("home", 1, dns_servers="9.9.9.9"), profile_fields("office", 2),
+                           profile_fields("lab", 3)])
+    assert res["error"] == "Failed to write profiles: [Errno 28] No space left on device"
+    assert (profiles_dir / "home" / "profile.json").read_text() == before
+    assert sorted(p.name for p in profiles_dir.iterdir()) == ["home"]
+    assert sorted(p.name for p in (profiles_dir / "home").iterdir()) == ["profile.json"]
+    assert deleted == [(["lab", "office"], ["home"])]
+
+
+def test_replaced_key_is_swapped_in_only_after_every_rename(tmp_path, monkeypatch, key_dir, profile_fields, key):
+    import vpn
+
+    profiles_dir = tmp_path / "profiles"
+    profiles_dir.mkdir()
+    monkeypatch.setattr(vpn, "PROFILES_DIR", profiles_dir)
+    v = vpn.Vpn()
+    v._sudo_pwd = "pwd"
+    assert v.save_profiles([profile_fields("home", 1)])["error"] is None
+    real_replace = os.replace
+
+    def replace(src, dst):
+        if str(src).endswith("office/profile.json.tmp"):
+            raise OSError(28, "No space left on device")
+        return real_replace(src, dst)
+
+    monkeypatch.setattr(vpn.os, "replace", replace)
+    res = v.save_profiles([profile_fields("home", 1, private_key=key(2)), profile_fields("office", 3)])
+    assert res["error"] == "Failed to write profiles: [Errno 28] No space left on device"
+    assert sorted(p.name for p in key_dir.iterdir()) == ["home.key"]
+    assert (key_dir / "home.key").read_text() == key(1) + "\n"
+
+    monkeypatch.setattr(vpn.os, "replace", real_replace)
+    assert v.save_profiles([profile_fields("home", 1, private_key=key(2))])["error"] is None
+    assert sorted(p.name for p in key_dir.iterdir()) == ["home.key"]
+    assert (key_dir / "home.key").read_text() == key(2) + "\n"
+
+
+def test_legacy_plaintext_key_is_migrated_on_read(monkeypatch, vpn_store, profile_fields, key):
+    v, profiles_dir, writes = vpn_store()
+    v._sudo_pwd = "pwd"
+    stored = {}
+    monkeypatch.setattr(secrets_store, "set_private_key",
+                        lambda name, key, sudo_pwd: stored.setdefault(name, key) and (True, None))
+    fields = profile_fields("legacy", 1, interface_name="wg_legacy")
+    (profiles_dir / "legacy").mkdir()
+    (profiles_dir / "legacy" / "profile.json").write_text(json.dumps(fields))
+
+    profiles = v.list_profiles()
+
+    assert [p["profile_name"] for p in profiles] == ["legacy"]
+    assert profiles[0]["private_key"] == ""
+    assert stored == {"legacy": key(1)}
+    on_disk = json.loads((profiles_dir / "legacy" / "profile.json").read_text())
+    assert "private_key" not in on_disk and on_disk["interface_name"] == "wg_legacy"
+    assert v.get_profile("legacy")["ip_address"] == fields["ip_address"]
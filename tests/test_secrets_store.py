@@ -1,32 +1,36 @@
 import os
 import shutil
-import tempfile
 import subprocess
 
 import pytest
 
-if not shutil.which("sudo"):
-    pytest.skip("sudo not available for root key store tests", allow_module_level=True)
+import secrets_store
 
 SUDO_PWD = os.environ.get("WIREGUARD_SUDO_PWD") or os.environ.get("SUDO_PWD")
-if not SUDO_PWD:
-    pytest.skip("SUDO password required for root key store tests", allow_module_level=True)
 
-os.environ.setdefault("WIREGUARD_KEY_DIR", tempfile.mkdtemp(prefix="wg_keys_"))
 
-probe = subprocess.run(
-    ["sudo", "-S", "-v"],
-    input=(SUDO_PWD + "\n").encode(),
-    stdout=subprocess.PIPE,
-    stderr=subprocess.PIPE,
-    check=False,
-)
-if probe.returncode != 0:
-    pytest.skip("sudo validation failed for root key store tests", allow_module_level=True)
+def _sudo_skip_reason():
+    if not shutil.which("sudo"):
+        return "sudo not available for root key store tests"
+    if not SUDO_PWD:
+        return "SUDO password required for root key store tests"
+    probe = subprocess.run(
+        ["sudo", "-S", "-v"],
+        input=(SUDO_PWD + "\n").encode(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=False,
+    )
+    if probe.returncode != 0:
+        return "sudo validation failed for root key store tests"
+    return None
 
-import secrets_store
+
+SUDO_SKIP = _sudo_skip_reason()
+needs_sudo = pytest.mark.skipif(SUDO_SKIP is not None, reason=SUDO_SKIP or "")
 
 
+@needs_sudo
 def test_store_roundtrip():
     ok, err = secrets_store.set_private_key("profile1", "privkeydata", SUDO_PWD)
     assert ok, err
@@ -36,9 +40,32 @@ def test_store_roundtrip():
     assert bad is None
 
 
+@needs_sudo
 def test_delete_secret():
     ok, err = secrets_store.set_private_key("profile2", "k", SUDO_PWD)
     assert ok, err
     ok, err = secrets_store.delete_private_key("profile2", SUDO_PWD)
     assert ok, err
     assert secrets_store.get_private_key("profile2", SUDO_PWD) is None
+
+
+def test_set_private_keys_moves_every_key(key_dir):
+    keys = {"home": "a" * 44, ".work": "b" * 44, "office vpn": "c" * 44}
+    assert secrets_store.set_private_keys(keys, "pwd") == (True, None)
+
+    assert sorted(p.name for p in key_dir.iterdir()) == [".work.key", "home.key", "office_vpn.key"]
+    assert (key_dir / ".work.key").read_text() == "b" * 44 + "\n"
+    assert oct((key_dir / "home.key").stat().st_mode & 0o777) == "0o600"
+    assert secrets_store.get_private_keys(list(keys), "pwd") == (keys, None)
+
+
+def test_pending_keys_replace_only_when_swapped(key_dir):
+    assert secrets_store.set_private_keys({"home": "a" * 44}, "pwd") == (True, None)
+    assert secrets_store.set_private_keys({"home": "b" * 44, "office": "c" * 44}, "pwd",
+                                          pending=["home"]) == (True, None)
+    assert secrets_store.get_private_keys(["home"], "pwd") == ({"home": "a" * 44}, None)
+    assert secrets_store.list_private_keys("pwd") == {"home", "office"}
+
+    assert secrets_store.swap_private_keys(["home"], "pwd") == (True, None)
+    assert sorted(p.name for p in key_dir.iterdir()) == ["home.key", "office.key"]
+    assert secrets_store.get_private_keys(["home"], "pwd") == ({"home": "b" * 44}, None)
@@ -0,0 +1,166 @@
+import base64
+import os
+import socket
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import uapi
+
+PRIV = base64.b64encode(bytes(range(32))).decode()
+PEER = base64.b64encode(bytes([7] * 32)).decode()
+
+
+class _StubDevice:
+    """wireguard-go stand-in: records set transactions, answers get."""
+
+    def __init__(self, path, get_reply='', errno=0):
+        self.requests = []
+        self.get_reply = get_reply
+        self.errno = errno
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(path)
+        self.sock.listen(4)
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            data = b''
+            while not data.endswith(b'\n\n'):
+                chunk = conn.recv(4096)
+                if not chunk:
+                    break
+                data += chunk
+            text = data.decode()
+            self.requests.append(text)
+            body = self.get_reply if text.startswith('get=1') else ''
+            conn.sendall(f'{body}errno={self.errno}\n\n'.encode())
+            conn.close()
+
+    def close(self):
+        self.sock.close()
+
+
+@pytest.fixture
+def device(tmp_path, monkeypatch):
+    monkeypatch.setattr(uapi, 'SOCKET_DIR', str(tmp_path))
+    devices = []
+
+    def make(**kwargs):
+        dev = _StubDevice(uapi.socket_path('wg0'), **kwargs)
+        devices.append(dev)
+        return dev
+
+    yield make
+    for dev in devices:
+        dev.close()
+
+
+def test_configure_sends_full_set(device):
+    dev = device()
+    assert uapi.available('wg0')
+    profile = {
+        'routing_table': 51821,
+        'peers': [{'key': PEER, 'endpoint': '127.0.0.1:51820',
+                   'allowed_prefixes': '10.0.0.0/24, 10.0.1.0/24', 'presharedKey': ''}],
+    }
+    uapi.configure('wg0', profile, PRIV)
+    assert dev.requests == ['\n'.join([
+        'set=1',
+        f'private_key={bytes(range(32)).hex()}',
+        'fwmark=51821',
+        'replace_peers=true',
+        f'public_key={"07" * 32}',
+        f'preshared_key={"0" * 64}',
+        'endpoint=127.0.0.1:51820',
+        'persistent_keepalive_interval=5',
+        'replace_allowed_ips=true',
+        'allowed_ip=10.0.0.0/23',
+    ]) + '\n\n']
+
+
+def test_incremental_peer_update_and_remove(device):
+    dev = device()
+    uapi.update_peer('wg0', {'key': PEER, 'endpoint': '[::1]:51820', 'allowed_prefixes': '::/0'})
+    uapi.remove_peer('wg0', PEER)
+    assert 'update_only=true' in dev.requests[0]
+    assert 'endpoint=[::1]:51820' in dev.requests[0]
+    assert 'replace_peers' not in dev.requests[0]
+    assert dev.requests[1] == f'set=1\npublic_key={"07" * 32}\nremove=true\n\n'
+
+
+def test_get_and_status(device):
+    device(get_reply='\n'.join([
+        f'private_key={bytes(range(32)).hex()}',
+        'listen_port=40000',
+        f'public_key={"07" * 32}',
+        f'preshared_key={"0" * 64}',
+        'endpoint=1.2.3.4:51820',
+        'last_handshake_time_sec=1700000000',
+        'last_handshake_time_nsec=0',
+        'rx_bytes=10',
+        'tx_bytes=20',
+        'persistent_keepalive_interval=5',
+        'allowed_ip=0.0.0.0/0',
+        'protocol_version=1',
+    ]) + '\n')
+    dev = uapi.get_device('wg0')
+    assert dev['private_key'] == PRIV
+    assert dev['listen_port'] == 40000
+    assert dev['peers'] == [{
+        'public_key': PEER, 'preshared_key': '', 'endpoint': '1.2.3.4:51820',
+        'last_handshake_time_sec': 1700000000, 'last_handshake_time_nsec': 0,
+        'rx_bytes': 10, 'tx_bytes': 20, 'persistent_keepalive_interval': 5,
+        'allowed_ips': ['0.0.0.0/0'], 'protocol_version': 1,
+    }]
+    assert uapi.status('wg0') == {'my_privkey': PRIV, 'peers': [
+        {'public_key': PEER, 'rx': 10, 'tx': 20, 'latest_handshake': 1700000000, 'up': True}]}
+
+
+def test_root_only_socket_is_reached_through_one_relay(device, monkeypatch):
+    dev = device(get_reply='listen_port=40000\n')
+    monkeypatch.setattr(uapi, '_accessible', lambda path: False)
+    assert not uapi.available('wg0')
+    assert uapi.available('wg0', '')
+    started = []
+    real_popen = subprocess.Popen
+
+    def popen(cmd, **kwargs):
+        # Stands in for sudo with cached credentials: the relay gets the
+        # password line too and has to skip it
+        started.append(cmd)
+        assert cmd[:5] == ['/usr/bin/sudo', '-S', '-p', '', '/usr/bin/python3']
+        return real_popen([sys.executable] + cmd[5:], **kwargs)
+
+    monkeypatch.setattr(uapi.subprocess, 'Popen', popen)
+    monkeypatch.setattr(uapi, '_relay', None)
+    try:
+        uapi.remove_peer('wg0', PEER, sudo_pwd='pwd')
+        assert uapi.get_device('wg0', sudo_pwd='pwd')['listen_port'] == 40000
+        with pytest.raises(uapi.UapiError, match='relay failed'):
+            uapi.get_device('../wg0', sudo_pwd='pwd')
+        assert uapi.status('wg0', sudo_pwd='pwd')['peers'] == []
+    finally:
+        uapi._relay.close()
+    assert dev.requests == [f'set=1\npublic_key={"07" * 32}\nremove=true\n\n', 'get=1\n\n', 'get=1\n\n']
+    assert len(started) == 1
+
+
+def test_errno_is_raised(device):
+    device(errno=22)
+    with pytest.raises(uapi.UapiError) as exc:
+        uapi.set_device('wg0', listen_port=1)
+    assert exc.value.errno == 22
+
+
+def test_resolve_endpoint_rejects_missing_port():
+    with pytest.raises(ValueError):
+        uapi.resolve_endpoint('vpn.example.com')
+    assert uapi.resolve_endpoint('127.0.0.1:51820') == '127.0.0.1:51820'
@@ -0,0 +1,110 @@
+import pytest
+
+import validation
+from validation import FieldError
+
+
+@pytest.fixture
+def peer(key):
+    def peer(i, **overrides):
+        peer = {'name': f'peer{i}', 'key': key(100 + i), 'endpoint': 'vpn.example.com:51820',
+                'allowed_prefixes': '0.0.0.0/0', 'presharedKey': ''}
+        peer.update(overrides)
+        return peer
+
+    return peer
+
+
+@pytest.fixture
+def fields(key, peer):
+    def fields(**overrides):
+        fields = {'private_key': key(1), 'ip_address': '10.0.0.2/32', 'dns_servers': '1.1.1.1',
+                  'extra_routes': '', 'peers': [peer(1)], 'mtu': ''}
+        fields.update(overrides)
+        return fields
+
+    return fields
+
+
+def test_valid_profile_has_no_errors(fields):
+    assert validation.check_profile(fields()) == []
+
+
+def test_every_problem_in_one_pass(fields, peer):
+    errors = validation.check_profile(fields(
+        private_key='short',
+        ip_address='10.0.0.2/32, nope',
+        dns_servers='1.1.1.1, dns?',
+        mtu='100',
+        peers=[peer(1, endpoint='nohost', keepalive='fast'),
+               peer(2, key='!' * 44, allowed_prefixes='10.0.0.0/8, 10.0.0.0/99')],
+    ))
+    assert [(e.field, e.peer) for e in errors] == [
+        ('private_key', None),
+        ('ip_address', None),
+        ('endpoint', 0),
+        ('keepalive', 0),
+        ('key', 1),
+        ('allowed_prefixes', 1),
+        ('dns_servers', None),
+        ('mtu', None),
+    ]
+    assert errors[0].message == 'Private key must be exactly 44 bytes long'
+    assert errors[4].message == 'Bad peer (peer2) key'
+    assert errors[5].message.startswith('Bad peer (peer2) prefix 10.0.0.0/99')
+    assert errors[-1].message == 'Bad MTU 100: must be between 576 and 9000'
+
+
+def test_private_key_rules(fields):
+    assert validation.check_profile(fields(private_key=''), require_key=False) == []
+    assert validation.check_profile(fields(private_key='')) == [
+        FieldError('private_key', None, 'Private key is required')]
+    # 44 characters but not base64 of 32 bytes
+    assert validation.check_profile(fields(private_key='A' * 44))[0].message == 'Bad private key'
+
+
+def test_repeated_values_are_checked_once(fields):
+    validation.check_key.cache_clear()
+    validation._check_peer.cache_clear()
+    batch = [fields(ip_address=f'10.0.{i}.2/32') for i in range(50)]
+    assert validation.check_profiles(batch) == [[] for _ in batch]
+    assert validation._check_peer.cache_info().misses == 1
+    assert validation.check_key.cache_info().misses == 2
+
+
+def test_large_profile_bypasses_the_caches(monkeypatch, fields, peer):
+    monkeypatch.setattr(validation, 'PEER_CACHE_SIZE', 3)
+    validation._check_peer.cache_clear()
+    peers = [peer(i) for i in range(1, 5)]
+    peers[3]['allowed_prefixes'] = '10.0.0.0/33'
+    errors = validation.check_profile(fields(peers=peers))
+    assert [(e.field, e.peer) for e in errors] == [('allowed_prefixes', 3)]
+    assert validation._check_peer.cache_info().currsize == 0
+
+
+def test_vpn_check_profile_reports_fields(tmp_path, monkeypatch, fields):
+    import vpn
+
+    monkeypatch.setattr(vpn, 'PROFILES_DIR', tmp_path)
+    v = vpn.Vpn()
+    entry = fields(profile_name='home', private_key='', ip_address='')
+    assert v.check_profile(entry) == [
+        {'field': 'private_key', 'peer': None, 'message': 'Private key is required'},
+        {'field': 'ip_address', 'peer': None, 'message': 'Address is required in [Interface]'},
+    ]
+    (tmp_path / 'home').mkdir()
+    (tmp_path / 'home' / 'profile.json').write_text('{}')
+    assert [e['field'] for e in v.check_profile(entry)] == ['ip_address']
+
+
+def test_server_rules(fields, peer, key):
+    peers = [peer(1, endpoint=''), peer(2, endpoint='', key=key(101))]
+    assert [e.field for e in validation.check_profile(fields(peers=peers))] == ['endpoint', 'endpoint', 'key']
+    errors = validation.check_profile(fields(kind='server', peers=peers))
+    assert errors == [
+        FieldError('listen_port', None, 'Listen port is required for a server profile'),
+        FieldError('key', 1, 'Duplicate peer (peer2) key'),
+    ]
+    assert validation.check_profile(fields(kind='server', listen_port='51820', peers=peers[:1])) == []
+    assert validation.check_profile(fields(listen_port='70000'))[0].message == \
+        'Bad listen port 70000: must be 1-65535'
@@ -3,7 +3,6 @@ import importlib
 import os
 import shutil
 import subprocess
-import tempfile
 
 import pytest
 
@@ -19,8 +18,6 @@ if SUDO_PWD and shutil.which("sudo"):
     )
     SUDO_OK = probe.returncode == 0
 
-os.environ.setdefault("WIREGUARD_KEY_DIR", tempfile.mkdtemp(prefix="wg_keys_"))
-
 import secrets_store
 
 
@@ -29,7 +26,7 @@ def _vpn_module():
     return importlib.reload(vpn)
 
 
-def test_parse_conf_lines_basic():
+def test_parse_conf_basic():
     vpn = _vpn_module()
     v = vpn.Vpn()
     lines = [
@@ -45,30 +42,19 @@ def test_parse_conf_lines_basic():
         "Endpoint = vpn.example.com:51820",
     ]
 
-    (
-        profile_name,
-        ip_address,
-        private_key,
-        iface,
-        extra_routes,
-        dns,
-        peers,
-        pre_up,
-        post_up,
-        pre_down,
-        post_down,
-    ) = v._parse_wireguard_conf_lines(lines, "default")
-
-    assert profile_name == "My_VPN"
-    assert iface == "wg_My_VPN"
-    assert ip_address == "10.0.0.2/32"
-    assert dns == "1.1.1.1"
-    assert len(peers) == 1
-    assert pre_up == ""
-    assert post_up == ""
-    assert pre_down == ""
-    assert post_down == ""
-    assert peers[0]["endpoint"] == "vpn.example.com:51820"
+    fields, diagnostics = v.parse_conf(lines, "default")
+
+    assert diagnostics == []
+    assert fields["profile_name"] == "My_VPN"
+    assert fields["interface_name"] == "wg_My_VPN"
+    assert fields["ip_address"] == "10.0.0.2/32"
+    assert fields["dns_servers"] == "1.1.1.1"
+    assert len(fields["peers"]) == 1
+    assert fields["pre_up"] == ""
+    assert fields["post_up"] == ""
+    assert fields["pre_down"] == ""
+    assert fields["post_down"] == ""
+    assert fields["peers"][0]["endpoint"] == "vpn.example.com:51820"
 
 
 def test_normalize_qr_text_wireguard_scheme():
@@ -134,7 +120,7 @@ def test_save_profile_keeps_existing_private_key():
     assert err is None
 
 
-def test_parse_conf_lines_with_comments_and_repeats():
+def test_parse_conf_with_comments_and_repeats():
     vpn = _vpn_module()
     v = vpn.Vpn()
     lines = [
@@ -158,29 +144,111 @@ def test_parse_conf_lines_with_comments_and_repeats():
         "Endpoint = vpn.example.com:51820 # comment",
     ]
 
-    (
-        profile_name,
-        ip_address,
-        private_key,
-        iface,
-        extra_routes,
-        dns,
-        peers,
-        pre_up,
-        post_up,
-        pre_down,
-        post_down,
-    ) = v._parse_wireguard_conf_lines(lines, "default")
-
-    assert profile_name == "Demo_VPN"
-    assert iface == "wg_Demo_VPN"
-    assert private_key == "privkey"
-    assert ip_address == "10.0.0.2/32, 10.0.0.3/32"
-    assert dns == "1.1.1.1, 8.8.8.8"
-    assert pre_up == "echo one\necho two"
-    assert post_up == "echo post"
-    assert pre_down == "echo predown"
-    assert post_down == "echo postdown"
-    assert len(peers) == 1
-    assert peers[0]["allowed_prefixes"] == "0.0.0.0/0, ::/0"
-    assert peers[0]["endpoint"] == "vpn.example.com:51820"
+    fields, _ = v.parse_conf(lines, "default")
+
+    assert fields["profile_name"] == "Demo_VPN"
+    assert fields["interface_name"] == "wg_Demo_VPN"
+    assert fields["private_key"] == "privkey"
+    assert fields["ip_address"] == "10.0.0.2/32, 10.0.0.3/32"
+    assert fields["dns_servers"] == "1.1.1.1, 8.8.8.8"
+    assert fields["pre_up"] == "echo one\necho two"
+    assert fields["post_up"] == "echo post"
+    assert fields["pre_down"] == "echo predown"
+    assert fields["post_down"] == "echo postdown"
+    assert len(fields["peers"]) == 1
+    assert fields["peers"][0]["allowed_prefixes"] == "0.0.0.0/0, ::/0"
+    assert fields["peers"][0]["endpoint"] == "vpn.example.com:51820"
+
+
+def test_parse_conf_mtu():
+    vpn = _vpn_module()
+    v = vpn.Vpn()
+    lines = [
+        "[Interface]",
+        "PrivateKey = privkey",
+        "Address = 10.0.0.2/32",
+        "MTU = 1380",
+        "[Peer]",
+        "PublicKey = pubkey",
+        "AllowedIPs = 0.0.0.0/0",
+    ]
+    fields, _ = v.parse_conf(lines, "fallback")
+    assert fields["mtu"] == "1380"
+    assert fields["wg_quick"] == {}
+
+
+def test_parse_conf_keepalive():
+    vpn = _vpn_module()
+    v = vpn.Vpn()
+    lines = [
+        "[Interface]",
+        "PrivateKey = privkey",
+        "[Peer]",
+        "PublicKey = a",
+        "PersistentKeepalive = 25",
+        "[Peer]",
+        "PublicKey = b",
+        "PersistentKeepalive = 0",
+        "[Peer]",
+        "PublicKey = c",
+        "PersistentKeepalive = 25",
+        "#Keepalive = auto",
+        "[Peer]",
+        "PublicKey = d",
+    ]
+    fields, _ = v.parse_conf(lines, "fallback")
+    assert [p.get("keepalive") for p in fields["peers"]] == ["25", "off", "auto", None]
+
+
+def test_parse_conf_server():
+    vpn = _vpn_module()
+    v = vpn.Vpn()
+    lines = [
+        "[Interface]",
+        "PrivateKey = privkey",
+        "Address = 10.99.0.1/16",
+        "ListenPort = 51820",
+        "[Peer]",
+        "PublicKey = a",
+        "AllowedIPs = 10.99.1.0/24",
+        "[Peer]",
+        "PublicKey = b",
+        "AllowedIPs = 10.99.2.0/24",
+        "Endpoint = 203.0.113.2:51820",
+    ]
+    fields, diagnostics = v.parse_conf(lines, "hub")
+    assert diagnostics == []
+    assert (fields["kind"], fields["listen_port"], fields["wg_quick"]) == ("server", "51820", {})
+    # A listening client still dials every peer
+    fields, _ = v.parse_conf(lines[:4] + lines[7:], "roadwarrior")
+    assert fields["kind"] == "client"
+
+
+def test_unknown_peer_keys_survive_import_edit_and_export(vpn_store, key):
+    _vpn_module()
+    from wg_config import build_quick_config
+
+    v, _, _ = vpn_store()
+    lines = [
+        "[Interface]",
+        "PrivateKey = " + key(2),
+        "Address = 10.0.0.2/32",
+        "[Peer]",
+        "PublicKey = " + key(1),
+        "AllowedIPs = 0.0.0.0/0",
+        "Endpoint = 203.0.113.1:51820",
+        "Obfuscation = on",
+    ]
+    fields, diagnostics = v.parse_conf(lines, "home")
+    assert [d.message for d in diagnostics] == ["Unknown key Obfuscation, kept as is"]
+    assert fields["peers"][0]["wg_quick"] == {"Obfuscation": "on"}
+    assert v.save_profile("home", "10.0.0.2/32", key(2), "", "", "",
+                          "", "", "", "", fields["peers"]) is None
+
+    # The editor sends peers without the key; the stored one is kept
+    edited = [{k: val for k, val in fields["peers"][0].items() if k != "wg_quick"}]
+    assert v.save_profile("home", "10.0.0.3/32", key(2), "", "", "",
+                          "", "", "", "", edited) is None
+    stored = v._load_profile("home")
+    assert stored["peers"][0]["wg_quick"] == {"Obfuscation": "on"}
+    assert "Obfuscation = on" in build_quick_config(stored, "priv").split("[Peer]")[1]
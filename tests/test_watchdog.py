@@ -0,0 +1,75 @@
+import watchdog
+
+
+class _Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _peers(handshake):
+    return [{'public_key': 'peer', 'latest_handshake': handshake}]
+
+
+def test_escalates_then_records_recovery():
+    clock = _Clock()
+    dog = watchdog.HandshakeWatchdog(clock=clock)
+    handshake = clock.now
+
+    clock.now += 100
+    assert dog.check(_peers(handshake)) == []
+    clock.now += 90
+    assert dog.check(_peers(handshake)) == [('resolve', 'peer')]
+    clock.now += 10
+    assert dog.check(_peers(handshake)) == []
+    clock.now += 50
+    assert dog.check(_peers(handshake)) == [('peer', 'peer')]
+    clock.now += 70
+    assert dog.check(_peers(handshake)) == [('reconfigure', 'peer')]
+    clock.now += 60
+    assert dog.check(_peers(handshake)) == []
+    clock.now += 60
+    assert dog.check(_peers(handshake)) == [('reconfigure', 'peer')]
+
+    clock.now += 5
+    assert dog.check(_peers(clock.now - 1)) == []
+    assert dog.history == [{
+        'public_key': 'peer',
+        'actions': ['resolve', 'peer', 'reconfigure', 'reconfigure'],
+        'time_to_recover': 255.0,
+        'recovered_at': int(clock.now),
+    }]
+    assert dog.peers == {}
+
+
+def test_never_handshaked_peer_ages_from_start():
+    clock = _Clock()
+    dog = watchdog.HandshakeWatchdog(thresholds=(('peer', 30),), clock=clock)
+    clock.now += 29
+    assert dog.check(_peers(0)) == []
+    clock.now += 1
+    assert dog.check(_peers(0)) == [('peer', 'peer')]
+
+
+def test_keepalive_off_is_skipped_and_long_intervals_get_slack():
+    clock = _Clock()
+    dog = watchdog.HandshakeWatchdog(thresholds=(('peer', 180),), clock=clock)
+    peers = [{'public_key': 'off', 'latest_handshake': 0},
+             {'public_key': 'slow', 'latest_handshake': 0},
+             {'public_key': 'default', 'latest_handshake': 0}]
+    intervals = {'off': 0, 'slow': 120, 'default': 5}
+    clock.now += 180
+    assert dog.check(peers, intervals) == [('peer', 'default')]
+    clock.now += 120 - watchdog.BASE_KEEPALIVE
+    assert dog.check(peers, intervals) == [('peer', 'slow')]
+    clock.now += 3600
+    assert dog.check(peers, intervals) == [('peer', 'slow'), ('peer', 'default')]
+    assert 'off' not in dog.peers
+
+
+def test_thresholds_from_profile():
+    assert watchdog.thresholds_from({}) == watchdog.DEFAULT_THRESHOLDS
+    assert watchdog.thresholds_from({'watchdog_thresholds': {'resolve': 0, 'peer': 60}}) == (
+        ('peer', 60), ('reconfigure', 300))
@@ -17,3 +17,20 @@ def test_build_config_includes_private_key():
     text = build_config(profile, "privkey")
     assert "PrivateKey = privkey" in text
     assert "PublicKey = pubkey" in text
+
+
+def test_server_config_listens_and_skips_missing_endpoints():
+    profile = {
+        "profile_name": "hub",
+        "kind": "server",
+        "listen_port": 51820,
+        "peers": [
+            {"name": "site1", "key": "pub1", "allowed_prefixes": "10.1.0.0/24", "endpoint": ""},
+            {"name": "site2", "key": "pub2", "allowed_prefixes": "10.2.0.0/24", "endpoint": "203.0.113.2:51820"},
+        ],
+    }
+    text = build_config(profile, "privkey")
+    assert "ListenPort = 51820" in text
+    assert text.count("Endpoint = ") == 1
+    # Only the peer with an endpoint gets the default keepalive
+    assert text.count("PersistentKeepalive = 5") == 1